@@ -1,57 +1,373 @@
 import math
-from .lmsr_bid_ask import lmsr_cost_sparse
+from threading import RLock
+import numpy as np
+from .lmsr_kernel import PartitionCache, cost_and_prices, lmsr_prices
+from .order_book import MarketBook, FILL_EPS
+from . import exposure
+from .exposure import EXPOSURE
 
 ORDER_BOOK = {}
-DELTA_Q_MAX = 10.0  # max shares per fill
+
+# Upper bound on re-check passes over resting orders after one AMM move
+MAX_SWEEP_PASSES = 8
+
+# Set by amm_store.attach(); fills are logged before the order is acknowledged
+JOURNAL = None
 
 def place_order(market_id, bucket_idx, side, size, order_type, limit_price=None):
     """
-    Place an order into the AMM-CLOB hybrid. Supports:
-    - market: fill at next available ask (buy) or bid (sell)
-    - limit: fill if price meets/exceeds limit, else queue (not implemented: persistent queue)
-    Returns: {'filled': qty, 'avg_price': price, 'remaining': qty, 'status': ...}
+    Place an order into the AMM-CLOB hybrid:
+    1. fill from the AMM or resting contra orders in this bucket, whichever is
+       better: a book level crosses (price-time priority, at its price) only
+       once the AMM's marginal price has reached it
+    2. market orders fill in full, limit orders up to the size at which the
+       bucket's marginal price reaches limit_price (closed form)
+    3. rest any limit remainder in the book; resting orders are re-checked
+       against the AMM whenever its prices move
+    Returns: {'filled': qty, 'avg_price': price, 'remaining': qty, 'status': ..., 'order_id': ...}
     """
-    # For MVP, only immediate-or-cancel logic (no persistent queue)
     state = ORDER_BOOK.get(market_id)
     if not state:
         return {'status': 'error', 'detail': 'No AMM state for market'}
-    q = state['q']
-    b = state['b']
-    n = len(q)
+    # Orders on one market execute one at a time; other markets run in parallel
+    with state['lock']:
+        if EXPOSURE.is_paused('book', market_id):
+            return {'status': 'error', 'detail': 'Trading paused for this market'}
+        return _execute_order(market_id, state, bucket_idx, side, size, order_type, limit_price)
+
+def _execute_order(market_id, state, bucket_idx, side, size, order_type, limit_price):
     idx = bucket_idx
-    filled = 0.0
-    total_paid = 0.0
-    size_left = size
-    while size_left > 0:
-        # Compute price for 1 share
-        q_before = q[:]
-        dq = min(size_left, DELTA_Q_MAX)
-        if side == 'buy':
-            q[idx] += dq
-            price = lmsr_cost_sparse(q, b) - lmsr_cost_sparse(q_before, b)
-        else:
-            q[idx] -= dq
-            price = lmsr_cost_sparse(q_before, b) - lmsr_cost_sparse(q, b)
-        # Limit order logic
-        if order_type == 'limit':
-            if (side == 'buy' and price > limit_price) or (side == 'sell' and price < limit_price):
-                break  # do not fill at worse price
-        filled += dq
-        total_paid += price
-        size_left -= dq
-    # Update state
-    state['q'] = q
-    return {
+    limit = limit_price if order_type == 'limit' else None
+    filled, total_paid, amm_size = _route(market_id, state, idx, side, size, limit)
+    remaining = size - filled
+    if remaining <= FILL_EPS:
+        filled, remaining = size, 0.0
+    result = {
         'filled': filled,
         'avg_price': total_paid / filled if filled else 0.0,
-        'remaining': size - filled,
+        'remaining': remaining,
         'status': 'filled' if filled == size else 'partial',
         'side': side,
         'bucket_idx': idx
     }
+    if order_type == 'limit' and remaining > 0:
+        order = _rest(market_id, state, idx, side, limit_price, remaining)
+        result['status'] = 'resting'
+        result['order_id'] = order.id
+    if amm_size > 0:
+        _sweep_resting(market_id, state)
+    return result
+
+def _route(market_id, state, idx, side, size, limit_price):
+    """
+    Fill an incoming order from whichever source is cheaper: a resting contra
+    level crosses (at its price) only while it is at or better than the AMM's
+    marginal price; otherwise the AMM fills up to the point where its price
+    reaches that level (or the order's limit). Market orders with nothing
+    better in the book go to the AMM in full. Returns (filled, paid, amm_filled).
+    """
+    book = state['clob']
+    contra = book.side(idx, 'sell' if side == 'buy' else 'buy')
+    buy = side == 'buy'
+    filled = paid = amm_filled = 0.0
+    while size - filled > FILL_EPS:
+        price = contra.best()
+        if price is not None and limit_price is not None and (price > limit_price if buy else price < limit_price):
+            price = None  # the book's best is beyond the order's limit
+        amm_price = state['partition'].price(state['q'][idx])
+        book_better = price is not None and (price <= amm_price if buy else price >= amm_price)
+        amm_qty = 0.0
+        if not book_better:
+            cap = price if price is not None else limit_price
+            if cap is None:
+                amm_qty = size - filled
+            else:
+                amm_qty = limit_fill_size(state['partition'], state['q'], idx, side, size - filled, cap)
+        if amm_qty > FILL_EPS:
+            paid += _amm_fill(market_id, state, idx, side, amm_qty)
+            filled += amm_qty
+            amm_filled += amm_qty
+        elif price is not None:
+            # Book level at or better than the AMM (or the AMM has just reached it)
+            order = contra.head()
+            qty = min(size - filled, order.remaining)
+            _fill_resting(market_id, state, order, qty, qty * price)
+            filled += qty
+            paid += qty * price
+        else:
+            break
+    return filled, paid, amm_filled
+
+def _amm_fill(market_id, state, idx, side, qty, order=None):
+    """
+    Trade qty shares of bucket idx against the AMM; returns the exact cost
+    (buy) or proceeds (sell). A resting order filled by the AMM is journaled
+    with the trade in one append. Caller holds the book's lock.
+    """
+    q = state['q']
+    cache = state['partition']
+    qk_old = q[idx]
+    dq = qty if side == 'buy' else -qty
+    paid = cache.ask(qk_old, qty) if side == 'buy' else cache.bid(qk_old, qty)
+    cost = paid if side == 'buy' else -paid
+    due = False
+    if JOURNAL is not None:
+        rows = [{'kind': 'trade', 'bucket': idx, 'dq': dq, 'paid': cost}]
+        if order is not None:
+            rows.append({'kind': 'fill', 'order_id': order.id, 'dq': qty, 'paid': paid})
+        due = JOURNAL.append_many('book', market_id, rows)
+    q[idx] = qk_old + dq
+    if not cache.apply(qk_old, q[idx]):
+        cache.rebase(q, cache.b)
+    if order is not None:
+        state['clob'].fill(order, qty, paid)
+    action = _record_exposure(market_id, state, ((idx, dq),), cost)
+    if due:
+        JOURNAL.snapshot_book(market_id, state)  # after the exposure update, which the snapshot carries
+    if action == 'reduce_b':
+        scale_liquidity(market_id, state, exposure.REDUCE_B_FACTOR)
+    return paid
+
+def _rest(market_id, state, idx, side, price, size):
+    """Journal and rest a limit order's remainder. Caller holds the book's lock."""
+    order_id = MarketBook.next_id()
+    due = False
+    if JOURNAL is not None:
+        due = JOURNAL.append('book', market_id, 'rest', x=price, bucket=idx,
+                             dq=size if side == 'buy' else -size, order_id=order_id)
+    order = state['clob'].rest(idx, side, price, size, order_id)
+    if due:
+        JOURNAL.snapshot_book(market_id, state)
+    return order
+
+def _fill_resting(market_id, state, order, qty, paid):
+    """Journal and apply a fill of a resting order at its own price. Caller holds the book's lock."""
+    due = False
+    if JOURNAL is not None:
+        due = JOURNAL.append('book', market_id, 'fill', dq=qty, paid=paid, order_id=order.id)
+    state['clob'].fill(order, qty, paid)
+    if due:
+        JOURNAL.snapshot_book(market_id, state)
+
+def _record_exposure(market_id, state, moves, cost):
+    seed = state['b'] * math.log(len(state['q']))
+    return EXPOSURE.record('book', market_id, moves, cost, seed)
+
+def scale_liquidity(market_id, state, factor):
+    """
+    Scale the book's b and q by factor (prices unchanged, later trades cost
+    the maker less). Caller holds the book's lock; persisted as a snapshot.
+    """
+    q = state['q']
+    for i in range(len(q)):
+        q[i] *= factor
+    state['b'] *= factor
+    state['partition'].rebase(q, state['b'])
+    if JOURNAL is not None:
+        JOURNAL.snapshot_book(market_id, state)
+
+def _sweep_resting(market_id, state):
+    """
+    After the AMM moved, fill resting orders whose limit the AMM now beats,
+    up to the point where the bucket's marginal price reaches the limit.
+    A fill in one bucket moves every other bucket's price, so passes repeat
+    (bounded) until nothing fills.
+    """
+    book = state['clob']
+    for _ in range(MAX_SWEEP_PASSES):
+        moved = False
+        for idx in list(book.active):
+            for side in ('buy', 'sell'):
+                resting = book.side(idx, side)
+                while True:
+                    price = resting.best()
+                    if price is None:
+                        break
+                    order = resting.head()
+                    qty = limit_fill_size(state['partition'], state['q'], idx, side, order.remaining, price)
+                    if qty <= FILL_EPS:
+                        break
+                    _amm_fill(market_id, state, idx, side, qty, order)
+                    moved = True
+                    if order.remaining > 0:
+                        break  # AMM price has reached this level's limit
+            if not book.side(idx, 'buy') and not book.side(idx, 'sell'):
+                book.active.discard(idx)
+        if not moved:
+            break
+
+def cancel_order(market_id, order_id):
+    state = ORDER_BOOK.get(market_id)
+    if not state:
+        return None
+    with state['lock']:
+        due = False
+        if JOURNAL is not None and order_id in state['clob'].orders:
+            due = JOURNAL.append('book', market_id, 'cancel', order_id=order_id)
+        order = state['clob'].cancel(order_id)
+        if due:
+            JOURNAL.snapshot_book(market_id, state)
+        return order.to_dict() if order else None
+
+def get_order(market_id, order_id):
+    state = ORDER_BOOK.get(market_id)
+    if not state:
+        return None
+    with state['lock']:
+        order = state['clob'].get(order_id)
+        return order.to_dict() if order else None
+
+def get_book_levels(market_id):
+    """
+    Best resting bid/offer for every bucket that has resting orders.
+    """
+    state = ORDER_BOOK.get(market_id)
+    if not state:
+        return None
+    with state['lock']:
+        book = state['clob']
+        levels = [book.bbo(idx) for idx in sorted(book.active)]
+        return [lv for lv in levels if lv['bid'] is not None or lv['ask'] is not None]
+
+def limit_fill_size(cache, q, idx, side, size, limit_price):
+    """
+    Largest fill (<= size) that keeps bucket idx's marginal price within the limit.
+    Buying s shares moves logit(p_k) up by exactly s / b, so the fill is
+    b * (logit(limit) - logit(p_k)) for a buy (mirrored for a sell). Falls back
+    to bisection for a single-bucket market, which has no logit.
+    """
+    if limit_price is None:
+        return 0.0
+    if limit_price >= 1.0:
+        return size if side == 'buy' else 0.0
+    if limit_price <= 0.0:
+        return 0.0 if side == 'buy' else size
+    logit_p = cache.logit(q, idx)
+    if logit_p is None:
+        return _bisect_fill(q, cache.b, idx, side, size, limit_price)
+    logit_limit = math.log(limit_price / (1.0 - limit_price))
+    s = cache.b * (logit_limit - logit_p if side == 'buy' else logit_p - logit_limit)
+    return min(size, max(0.0, s))
+
+def _bisect_fill(q, b, idx, side, size, limit_price, iters=60):
+    sign = 1.0 if side == 'buy' else -1.0
+    q = np.array(q, dtype=np.float64)
+    qk = q[idx]
+
+    def within(s):
+        q[idx] = qk + sign * s
+        p = lmsr_prices(q, b)[idx]
+        return p <= limit_price if side == 'buy' else p >= limit_price
+
+    if within(size):
+        return size
+    if not within(0.0):
+        return 0.0
+    lo, hi = 0.0, size
+    for _ in range(iters):
+        mid = 0.5 * (lo + hi)
+        if within(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+def place_orders(market_id, legs):
+    """
+    Execute a batch of legs [{'bucket_idx', 'side', 'size', 'limit_price'}, ...]
+    as one all-or-nothing trade. The legs are netted into a single delta vector
+    and priced jointly with one cost evaluation C(q + delta) - C(q); each leg's
+    limit (if any) is checked against its bucket's marginal price after the
+    whole batch. Returns per-leg results plus the total payment
+    (positive: trader pays, negative: trader receives).
+    """
+    state = ORDER_BOOK.get(market_id)
+    if not state:
+        return {'status': 'error', 'detail': 'No AMM state for market'}
+    with state['lock']:
+        if EXPOSURE.is_paused('book', market_id):
+            return {'status': 'error', 'detail': 'Trading paused for this market'}
+        q = state['q']
+        n = len(q)
+        delta = np.zeros(n)
+        for leg in legs:
+            idx = leg['bucket_idx']
+            if not 0 <= idx < n:
+                return {'status': 'error', 'detail': f'Invalid bucket_idx {idx}'}
+            if leg['side'] not in ('buy', 'sell') or leg['size'] <= 0:
+                return {'status': 'error', 'detail': 'Each leg needs side buy/sell and a positive size'}
+            delta[idx] += leg['size'] if leg['side'] == 'buy' else -leg['size']
+        cache = state['partition']
+        q_after = np.asarray(q) + delta
+        cost_after, prices = cost_and_prices(q_after, state['b'])
+        payment = cost_after - cache.cost()
+        results = []
+        rejected = False
+        for leg in legs:
+            price = float(prices[leg['bucket_idx']])
+            limit = leg.get('limit_price')
+            ok = limit is None or (price <= limit if leg['side'] == 'buy' else price >= limit)
+            rejected = rejected or not ok
+            results.append({'bucket_idx': leg['bucket_idx'], 'side': leg['side'], 'size': leg['size'],
+                            'price': price, 'within_limit': ok})
+        if rejected:
+            return {'status': 'rejected', 'payment': 0.0, 'legs': results}
+        touched = np.flatnonzero(delta)
+        moves = [(int(i), float(delta[i])) for i in touched]
+        if JOURNAL is not None:
+            # One trade: its payment rides on the first row (the rest have paid=None)
+            due = JOURNAL.append_many('book', market_id, [
+                {'kind': 'trade', 'bucket': i, 'dq': dq, 'paid': float(payment) if j == 0 else None}
+                for j, (i, dq) in enumerate(moves)])
+        for i in touched:
+            qk_old = q[i]
+            q[i] = qk_old + float(delta[i])
+            if not cache.apply(qk_old, q[i]):
+                cache.rebase(q, cache.b)
+        action = _record_exposure(market_id, state, moves, float(payment))
+        if JOURNAL is not None and due:
+            JOURNAL.snapshot_book(market_id, state)
+        if action == 'reduce_b':
+            scale_liquidity(market_id, state, exposure.REDUCE_B_FACTOR)
+        _sweep_resting(market_id, state)
+        return {'status': 'filled', 'payment': float(payment), 'legs': results}
+
+def new_book_state(q, b):
+    return {'q': q[:], 'b': b, 'partition': PartitionCache(q, b), 'lock': RLock(), 'clob': MarketBook()}
 
 def set_amm_state(market_id, q, b):
-    ORDER_BOOK[market_id] = {'q': q[:], 'b': b}
+    state = new_book_state(q, b)
+    if JOURNAL is not None:
+        JOURNAL.snapshot_book(market_id, state)
+    ORDER_BOOK[market_id] = state
+    EXPOSURE.forget('book', market_id)
+
+def replay_book_entry(state, bucket_idx, dq):
+    # Caller rebases state['partition'] once replay is complete
+    state['q'][bucket_idx] += dq
+
+def replay_order_entry(state, kind, bucket_idx, price, dq, paid, order_id):
+    """Apply one journaled resting-order event ('rest' / 'fill' / 'cancel') during replay."""
+    book = state['clob']
+    MarketBook.reserve_ids(order_id)
+    if kind == 'rest':
+        book.rest(bucket_idx, 'buy' if dq > 0 else 'sell', price, abs(dq), order_id)
+        return
+    order = book.orders.get(order_id)
+    if order is None:
+        return
+    if kind == 'fill':
+        book.fill(order, dq, paid)
+    else:
+        book.cancel(order_id)
 
 def get_amm_state(market_id):
     return ORDER_BOOK.get(market_id)
+
+def get_book_snapshot(market_id):
+    """Consistent copy of a market's book q vector and b, or None."""
+    state = ORDER_BOOK.get(market_id)
+    if not state:
+        return None
+    with state['lock']:
+        return {'q': state['q'][:], 'b': state['b']}
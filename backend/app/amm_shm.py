@@ -0,0 +1,167 @@
+# Shared-memory AMM market segments for multi-worker deployments
+# Enabled with AMM_SHARED_MEMORY=1: every uvicorn worker maps the same
+# per-market segment, so q vectors never fork between processes.
+#
+# Segment layout (one per market, fixed capacity):
+#   int64[4]   seq, n, capacity, ready
+#   float64[4] b, bankroll, min_val, max_val
+#   float64[capacity] x, float64[capacity] q
+# Writers hold the market's MarketLock (thread RLock + fcntl.flock on a lock
+# file) and bump seq on every mutation; each worker's PartitionCache is tagged
+# with the seq it was built at and is rebuilt when another worker moved q.
+
+import os
+import tempfile
+from threading import RLock
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from .amm_state import AMMState
+
+SHARED_MEMORY = os.getenv("AMM_SHARED_MEMORY", "0") == "1"
+SHM_PREFIX = os.getenv("AMM_SHM_PREFIX", "vmamm")
+SHM_CAPACITY = int(os.getenv("AMM_SHM_CAPACITY", "1024"))  # max knots per market
+LOCK_DIR = os.getenv("AMM_SHM_LOCK_DIR", tempfile.gettempdir())
+
+_HEADER_BYTES = 64
+
+class MarketLock:
+    """
+    Re-entrant lock that excludes other threads (RLock) and other worker
+    processes (flock on a per-market lock file).
+    """
+    def __init__(self, path):
+        self._local = RLock()
+        self._path = path
+        self._fd = None
+        self._depth = 0
+
+    def __enter__(self):
+        import fcntl
+        self._local.acquire()
+        if self._depth == 0:
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        import fcntl
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._local.release()
+
+def _segment_name(market_id):
+    return f"{SHM_PREFIX}_{market_id}"
+
+def market_lock(market_id):
+    return MarketLock(os.path.join(LOCK_DIR, f"{_segment_name(market_id)}.lock"))
+
+def _untrack(shm):
+    # The resource tracker would unlink the segment when this worker exits;
+    # segments outlive individual workers and are removed with unlink().
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+def _field(view, i, cast):
+    return property(lambda self: cast(getattr(self, view)[i]),
+                    lambda self, v: getattr(self, view).__setitem__(i, v))
+
+class SharedAMMState(AMMState):
+    """
+    AMMState whose arrays and scalars live in a shared-memory segment.
+    """
+    __slots__ = ('_shm', '_ints', '_floats', '_partition', '_partition_seq')
+
+    def __init__(self, shm, market_id, lock):
+        self._shm = shm
+        buf = shm.buf
+        self._ints = np.ndarray((4,), dtype=np.int64, buffer=buf, offset=0)
+        self._floats = np.ndarray((4,), dtype=np.float64, buffer=buf, offset=32)
+        capacity = int(self._ints[2])
+        self._x = np.ndarray((capacity,), dtype=np.float64, buffer=buf, offset=_HEADER_BYTES)
+        self._q = np.ndarray((capacity,), dtype=np.float64, buffer=buf, offset=_HEADER_BYTES + 8 * capacity)
+        self._partition = None
+        self._partition_seq = -1
+        self.market_id = market_id
+        self.lock = lock
+
+    # Scalars are read from / written to the shared header
+    version = _field('_ints', 0, int)
+    n = _field('_ints', 1, int)
+    b = _field('_floats', 0, float)
+    bankroll = _field('_floats', 1, float)
+    min_val = _field('_floats', 2, float)
+    max_val = _field('_floats', 3, float)
+
+    @property
+    def partition(self):
+        # Only valid if no worker has moved q since this cache was built
+        if self._partition_seq != self._ints[0]:
+            return None
+        return self._partition
+
+    @partition.setter
+    def partition(self, cache):
+        self._partition = cache
+        self._partition_seq = int(self._ints[0])
+
+    def touch(self):
+        valid = self._partition_seq == self._ints[0]
+        self._ints[0] += 1
+        if valid:
+            self._partition_seq = int(self._ints[0])
+
+    def _grow(self):
+        raise RuntimeError(f"Shared AMM segment full ({len(self._x)} knots); raise AMM_SHM_CAPACITY")
+
+def open_state(market_id, x, q, bankroll, b, min_val, max_val):
+    """
+    Attach to the market's segment, creating and initializing it from the
+    given arrays if no worker has yet. Returns (state, created).
+    """
+    lock = market_lock(market_id)
+    name = _segment_name(market_id)
+    with lock:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            created = False
+        except FileNotFoundError:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_BYTES + 16 * SHM_CAPACITY)
+            created = True
+        _untrack(shm)
+        if created:
+            ints = np.ndarray((4,), dtype=np.int64, buffer=shm.buf, offset=0)
+            ints[:] = (0, 0, SHM_CAPACITY, 0)
+            del ints
+        state = SharedAMMState(shm, market_id, lock)
+        # A creator that died mid-initialization leaves ready == 0
+        created = created or not state._ints[3]
+        if created:
+            n = len(x)
+            if n > SHM_CAPACITY:
+                raise RuntimeError(f"Market has {n} knots; raise AMM_SHM_CAPACITY")
+            state._x[:n] = x
+            state._q[:n] = q
+            state.n = n
+            state.b = b
+            state.bankroll = bankroll
+            state.min_val = min_val
+            state.max_val = max_val
+            state._ints[3] = 1
+    return state, created
+
+def unlink(market_id):
+    """
+    Remove a market's segment (e.g. after resolution or a dev reset).
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=_segment_name(market_id))
+    except FileNotFoundError:
+        return
+    _untrack(shm)
+    shm.close()
+    shm.unlink()
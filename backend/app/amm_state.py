@@ -1,15 +1,170 @@
-# In-memory AMM state for each market (MVP, not persistent)
-# Key: market_id, Value: dict with 'knots' (list of (x, q)), 'bankroll', 'b', etc.
+# In-memory AMM state for each market, journaled to the DB by app/amm_store.py
+# Key: market_id, Value: AMMState (knot x/q arrays, 'bankroll', 'b', etc.)
 
-from threading import Lock
+from threading import Lock, RLock
 import math
+import numpy as np
+from . import lmsr_kernel, priors, exposure
+from .exposure import EXPOSURE
+from .circuit_breaker import BREAKERS, widen
 
 AMM_STATE = {}
 AMM_LOCK = Lock()
 
+# Set by amm_store.attach(); every knot insert / trade is logged before it is applied
+JOURNAL = None
+
 # Default bankroll for new markets
 DEFAULT_BANKROLL = 5000.0
 
+# Two valuations closer than this share a knot
+KNOT_TOL = 1e-6
+
+class AMMState:
+    """
+    Compact per-market AMM state. Knot values x (sorted) and share counts q
+    live in contiguous float64 buffers with spare capacity, so inserting a
+    knot is a bisect plus an in-place shift, and the pricing code gets
+    zero-copy views through .x and .q.
+    """
+    __slots__ = ('_x', '_q', 'n', 'bankroll', 'b', 'min_val', 'max_val', 'partition', 'market_id',
+                 'version', 'lock')
+
+    MIN_CAPACITY = 32
+
+    def __init__(self, x, q, bankroll, b, min_val, max_val, market_id=None):
+        n = len(x)
+        capacity = max(self.MIN_CAPACITY, 2 * n)
+        self._x = np.empty(capacity)
+        self._q = np.empty(capacity)
+        self._x[:n] = x
+        self._q[:n] = q
+        self.n = n
+        self.bankroll = bankroll
+        self.b = b
+        self.min_val = min_val
+        self.max_val = max_val
+        self.partition = None
+        self.market_id = market_id
+        self.version = 0
+        self.lock = RLock()
+
+    @property
+    def x(self):
+        return self._x[:self.n]
+
+    @property
+    def q(self):
+        return self._q[:self.n]
+
+    def __len__(self):
+        return self.n
+
+    def knot(self, i):
+        return {'x': float(self._x[i]), 'q': float(self._q[i])}
+
+    def snapshot(self):
+        """
+        Consistent copy (x, q, b, version) for readers; writers are only
+        blocked for the duration of the copy.
+        """
+        with self.lock:
+            return self.x.copy(), self.q.copy(), self.b, self.version
+
+    def touch(self):
+        """Bump the state version after a mutation (caller holds self.lock)."""
+        self.version += 1
+
+    def refresh(self):
+        """
+        Apply time-based changes (a circuit-breaker trip lapsing) before a
+        read, bumping the version if anything changed; caller holds self.lock.
+        """
+        sync_breaker(self)
+
+    def locate(self, x, tol=None):
+        """
+        Binary-search the sorted knots for x.
+        Returns (idx, found): the index of the knot within tol of x if one
+        exists, otherwise the index at which x would be inserted.
+        """
+        tol = KNOT_TOL if tol is None else tol
+        xs = self._x[:self.n]
+        idx = int(np.searchsorted(xs, x))
+        if idx < self.n and xs[idx] - x < tol:
+            return idx, True
+        if idx > 0 and x - xs[idx - 1] < tol:
+            return idx - 1, True
+        return idx, False
+
+    def locate_many(self, xs, tol=None):
+        """
+        Vectorized locate() for an array of values. Returns (idx, found) arrays.
+        """
+        tol = KNOT_TOL if tol is None else tol
+        xs = np.asarray(xs, dtype=np.float64)
+        kx = self._x[:self.n]
+        idx = np.searchsorted(kx, xs)
+        right = np.minimum(idx, self.n - 1)
+        left = np.maximum(idx - 1, 0)
+        hit_right = (idx < self.n) & (np.abs(kx[right] - xs) < tol)
+        hit_left = (idx > 0) & (np.abs(xs - kx[left]) < tol)
+        found = hit_right | hit_left
+        idx = np.where(hit_right, right, np.where(hit_left, left, idx))
+        return idx, found
+
+    def insert(self, x, q=0.0):
+        """
+        Insert a knot at its sorted position (binary search) and return its index.
+        """
+        n = self.n
+        idx = int(np.searchsorted(self._x[:n], x))
+        if n == len(self._x):
+            self._grow()
+        self._x[idx + 1:n + 1] = self._x[idx:n]
+        self._q[idx + 1:n + 1] = self._q[idx:n]
+        self._x[idx] = x
+        self._q[idx] = q
+        self.n = n + 1
+        return idx
+
+    def insert_many(self, xs, q=0.0):
+        """
+        Merge new knots (sorted, already deduplicated, none present) in one O(N + M) pass.
+        """
+        n = self.n
+        pos = np.searchsorted(self._x[:n], xs)
+        x = np.insert(self._x[:n], pos, xs)
+        q = np.insert(self._q[:n], pos, q)
+        while len(x) > len(self._x):
+            self._grow()
+        self.n = len(x)
+        self._x[:self.n] = x
+        self._q[:self.n] = q
+
+    def reset(self, x, q, b, min_val, max_val):
+        """
+        Replace all knots and shares (reseeding); caller holds self.lock.
+        """
+        n = len(x)
+        while n > len(self._x):
+            self._grow()
+        self._x[:n] = x
+        self._q[:n] = q
+        self.n = n
+        self.b = b
+        self.min_val = min_val
+        self.max_val = max_val
+        self.partition = None
+        self.touch()
+
+    def _grow(self):
+        capacity = 2 * len(self._x)
+        for name in ('_x', '_q'):
+            buf = np.empty(capacity)
+            buf[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, buf)
+
 def get_amm_state(market_id, N, min_val, max_val, prior=None):
     """
     Retrieve or initialize the sparse AMM state for a market.
@@ -18,103 +173,286 @@ def get_amm_state(market_id, N, min_val, max_val, prior=None):
     """
     with AMM_LOCK:
         if market_id not in AMM_STATE:
-            knots = []
-            log_min = math.log(min_val)
-            log_max = math.log(max_val)
             b = DEFAULT_BANKROLL / math.log(N)
-            # Default prior: uniform
-            if prior is None:
-                p_k0 = [1.0/N] * N
-            elif callable(prior):
-                p_k0 = [prior(i, N, min_val, max_val) for i in range(N)]
-                S = sum(p_k0)
-                p_k0 = [pk/S for pk in p_k0]
-            else:
-                p_k0 = prior
-                S = sum(p_k0)
-                p_k0 = [pk/S for pk in p_k0]
-            for i in range(N):
-                x = math.exp(log_min + (log_max - log_min) * i / (N-1))
-                qk = b * math.log(p_k0[i])
-                knots.append({'x': x, 'q': qk})
-            AMM_STATE[market_id] = {
-                'knots': knots,
-                'bankroll': DEFAULT_BANKROLL,
-                'b': b,
-                'min_val': min_val,
-                'max_val': max_val
-            }
+            x = priors.knot_grid(N, min_val, max_val)
+            q = b * np.log(priors.prior_vector(prior, x, min_val, max_val))
+            state, created = make_state(market_id, x, q, DEFAULT_BANKROLL, b, min_val, max_val)
+            if created and JOURNAL is not None:
+                JOURNAL.snapshot_amm(state)
+            AMM_STATE[market_id] = state
         return AMM_STATE[market_id]
 
+def seed_markets(specs, reseed=False):
+    """
+    Seed many markets in one pass. specs: iterable of dicts with market_id, N,
+    min_val, max_val and optional prior (anything get_amm_state accepts).
+    Markets sharing (N, min_val, max_val) share one knot grid, and their
+    uniform / array priors go through one batched normalize + log.
+    Existing markets are left alone unless reseed=True, which resets their
+    knots, q and b in place and drops their exposure tracker and circuit
+    breaker. Reseeding is for markets without open positions: those whose
+    tracked trades leave traders holding shares are skipped with a warning
+    (the tracker is off in shared-memory mode, so there the caller must
+    check). Returns the list of seeded market ids.
+    """
+    groups = {}
+    for spec in specs:
+        key = (spec['N'], spec['min_val'], spec['max_val'])
+        groups.setdefault(key, []).append(spec)
+    seeded = []
+    with AMM_LOCK:
+        for (N, min_val, max_val), group in groups.items():
+            if not reseed:
+                group = [spec for spec in group if spec['market_id'] not in AMM_STATE]
+            if not group:
+                continue
+            x = priors.knot_grid(N, min_val, max_val)
+            b = DEFAULT_BANKROLL / math.log(N)
+            batch = [spec.get('prior') for spec in group]
+            if all(p is None or not callable(p) for p in batch):
+                P = priors.normalize([np.full(N, 1.0) if p is None else p for p in batch])
+            else:
+                P = np.array([priors.prior_vector(p, x, min_val, max_val) for p in batch])
+            Q = b * np.log(P)
+            for spec, q in zip(group, Q):
+                market_id = spec['market_id']
+                state = existing = AMM_STATE.get(market_id)
+                if state is None:
+                    state, created = make_state(market_id, x, q, DEFAULT_BANKROLL, b, min_val, max_val)
+                    AMM_STATE[market_id] = state
+                    if not created and not reseed:
+                        continue
+                with state.lock:
+                    if existing is not None and EXPOSURE.has_positions('amm', market_id):
+                        print(f"Warning: not reseeding market {market_id}: traders hold open positions")
+                        continue
+                    if state.n != N or not np.array_equal(state.q, q) or not np.array_equal(state.x, x):
+                        state.reset(x, q, b, min_val, max_val)
+                    # Accumulators and trip state describe the replaced AMM
+                    EXPOSURE.forget('amm', market_id)
+                    BREAKERS.forget(market_id)
+                if JOURNAL is not None:
+                    JOURNAL.snapshot_amm(state)
+                seeded.append(market_id)
+    return seeded
+
+def make_state(market_id, x, q, bankroll, b, min_val, max_val):
+    """
+    Build a market's AMMState, or in shared-memory mode attach to the segment
+    another worker may already have created. Returns (state, created).
+    """
+    from . import amm_shm
+    if amm_shm.SHARED_MEMORY:
+        return amm_shm.open_state(market_id, x, q, bankroll, b, min_val, max_val)
+    return AMMState(x, q, bankroll, b, min_val, max_val, market_id=market_id), True
+
 def insert_knot(state, x):
     """
     Insert a knot at x if not present, preserving order.
+    Returns the knot's index (existing or new) in O(log N) lookup.
     """
-    for knot in state['knots']:
-        if abs(knot['x'] - x) < 1e-6:
-            return  # Already present
-    state['knots'].append({'x': x, 'q': 0.0})
-    state['knots'].sort(key=lambda k: k['x'])
+    with state.lock:
+        idx, found = state.locate(x)
+        if found:
+            return idx
+        due = False
+        if JOURNAL is not None:
+            due = JOURNAL.append('amm', state.market_id, 'knot', x=float(x))
+        before = _breaker_prices(state)
+        state.insert(x, 0.0)
+        _knots_changed(state)
+        if before is not None:
+            BREAKERS.knots_inserted(state.market_id, [idx], before, lmsr_kernel.lmsr_prices(state.q, state.b))
+        if due:
+            JOURNAL.snapshot_amm(state)
+        return idx
+
+def insert_knots(state, xs):
+    """
+    Batch version of insert_knot for many valuations at once: one merge and
+    one b/partition rebuild. Returns the knot index for each value in xs.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    with state.lock:
+        _, found = state.locate_many(xs)
+        new = np.unique(xs[~found])
+        if len(new):
+            # Collapse new values that fall within tolerance of each other
+            new = new[np.concatenate(([True], np.diff(new) >= KNOT_TOL))]
+            due = False
+            if JOURNAL is not None:
+                due = JOURNAL.append_many('amm', state.market_id, [{'kind': 'knot', 'x': float(x)} for x in new])
+            before = _breaker_prices(state)
+            pos = np.searchsorted(state.x, new)
+            state.insert_many(new, 0.0)
+            _knots_changed(state)
+            if before is not None:
+                BREAKERS.knots_inserted(state.market_id, pos, before, lmsr_kernel.lmsr_prices(state.q, state.b))
+            if due:
+                JOURNAL.snapshot_amm(state)
+        idx, _ = state.locate_many(xs)
+        return idx.tolist()
+
+def _breaker_prices(state):
+    # Prices before a knot insert, only when the breaker has a window to carry over
+    if not BREAKERS.watching(state.market_id):
+        return None
+    return lmsr_kernel.lmsr_prices(state.q, state.b)
+
+def _knots_changed(state):
     # Recompute b
-    N = len(state['knots'])
-    state['b'] = state['bankroll'] / math.log(N)
+    state.b = state.bankroll / math.log(len(state))
+    # New bucket and new b: cached partition sum must be rebuilt
+    state.partition = None
+    state.touch()
 
-# --- AMM Trading Math Helpers ---
-def Z(q, b):
-    try:
-        exps = [math.exp(qk / b) for qk in q]
-        z = sum(exps)
-        if not math.isfinite(z) or z == 0:
-            return float('inf')
-        return z
-    except OverflowError:
-        return float('inf')
+def get_partition(state):
+    """
+    Cached max-shifted partition sum for the market, built on first use.
+    """
+    if state.partition is None:
+        state.partition = lmsr_kernel.PartitionCache(state.q, state.b)
+    return state.partition
+
+def apply_trade(state, k, s, fee=0.0):
+    """
+    Move bucket k by s shares (s < 0 sells) and update the partition cache in O(1).
+    fee: anything the trader paid on top of the LMSR cost (breaker spread).
+    """
+    with state.lock:
+        BREAKERS.before_trade(state.market_id, state.n, lambda: lmsr_kernel.lmsr_prices(state.q, state.b))
+        cache = get_partition(state)
+        q = state.q
+        qk_old = float(q[k])
+        paid = cache.ask(qk_old, s) if s >= 0 else -cache.bid(qk_old, -s)  # C(q + s e_k) - C(q)
+        due = False
+        if JOURNAL is not None:
+            due = JOURNAL.append('amm', state.market_id, 'trade', x=float(state.x[k]), dq=s, paid=paid, fee=fee)
+        q[k] = qk_old + s
+        if not cache.apply(qk_old, qk_old + s):
+            cache.rebase(q, state.b)
+        state.touch()
+        tripped = BREAKERS.after_trade(state.market_id, k, cache.price(q[k]))
+        action = EXPOSURE.record('amm', state.market_id, ((float(state.x[k]), s),), paid, state.bankroll, fee)
+        if due:
+            JOURNAL.snapshot_amm(state)  # after the exposure update, which the snapshot carries
+        if action == 'reduce_b':
+            scale_liquidity(state, exposure.REDUCE_B_FACTOR)
+        if tripped:
+            sync_breaker(state)
+
+def sync_breaker(state):
+    """
+    Apply or lift the circuit breaker's temporary b multiplier and spread
+    once its trip starts or lapses (caller holds state.lock). Reads call this
+    first so a lapse bumps the version like any other change.
+    """
+    factor = BREAKERS.transition(state.market_id)
+    if factor is None:
+        return
+    if factor != 1.0:
+        scale_liquidity(state, factor)
+    else:
+        state.touch()
 
+def scale_liquidity(state, factor):
+    """
+    Scale b (and bankroll) by factor, scaling q with it so prices are
+    unchanged; later trades move prices more per share and cost the maker less.
+    Persisted as a snapshot (the journal has no entry kind for b).
+    """
+    with state.lock:
+        state.q[:] *= factor
+        state.b *= factor
+        state.bankroll *= factor
+        state.partition = None
+        state.touch()
+        if JOURNAL is not None:
+            JOURNAL.snapshot_amm(state)
+
+def replay_entry(state, kind, x, dq):
+    """
+    Apply one persisted log entry during startup replay (not journaled again).
+    kind is 'knot', 'trade' or 'reprice' (q moved without a trade, e.g. by
+    recalibration).
+    """
+    idx, found = state.locate(x)
+    if kind == 'knot':
+        if not found:
+            state.insert(x, 0.0)
+            _knots_changed(state)
+    elif found:
+        state.q[idx] += dq
+        state.touch()
+
+# --- AMM Trading Math Helpers ---
+# Thin wrappers over the shared NumPy kernel (stable log-sum-exp).
 def C(q, b):
-    z = Z(q, b)
-    if z == float('inf') or z <= 0:
-        return float('nan')
-    return b * math.log(z)
+    return float(lmsr_kernel.lmsr_cost(q, b))
 
 def px(q, b):
-    z = Z(q, b)
-    if z == float('inf') or z == 0:
-        return [0.0 for _ in q]
-    return [math.exp(qk / b) / z for qk in q]
+    return lmsr_kernel.lmsr_prices(q, b).tolist()
 
 def ask(q, b, k, s):
-    q_new = [qk + s if i == k else qk for i, qk in enumerate(q)]
-    c_new = C(q_new, b)
-    c_old = C(q, b)
-    if math.isnan(c_new) or math.isnan(c_old):
-        return float('nan')
-    return c_new - c_old
+    p = lmsr_kernel.lmsr_prices(q, b)[k]
+    return float(lmsr_kernel.bucket_ask(p, b, s))
 
 def bid(q, b, k, s):
-    q_new = [qk - s if i == k else qk for i, qk in enumerate(q)]
-    c_new = C(q_new, b)
-    c_old = C(q, b)
-    if math.isnan(c_new) or math.isnan(c_old):
-        return float('nan')
-    return c_old - c_new
+    p = lmsr_kernel.lmsr_prices(q, b)[k]
+    return float(lmsr_kernel.bucket_bid(p, b, s))
+
+_MATH_ERROR = {'error': 'Bankroll exhausted or math error', 'bid': 0, 'mid': 0, 'ask': 0, 'liquidity': 0}
+
+def _format_quote(mid, ask_price, bid_price, liquidity):
+    # Guard against NaN/inf
+    if not all(map(math.isfinite, [mid, ask_price, bid_price, liquidity])):
+        return dict(_MATH_ERROR)
+    return {
+        'bid': round(bid_price, 6),
+        'mid': round(mid, 6),
+        'ask': round(ask_price, 6),
+        'liquidity': round(liquidity, 2)
+    }
 
 def get_quotes_for_bucket(state, k, size=1.0):
-    q = [knot['q'] for knot in state['knots']]
-    b = state['b']
+    """
+    O(1) quote for one bucket from the cached partition sum. While the
+    market's circuit breaker is tripped the spread is widened (and b raised).
+    """
+    with state.lock:
+        sync_breaker(state)
+        b = state.b
+        liquidity = b * math.log(len(state))
+        try:
+            cache = get_partition(state)
+            qk = float(state.q[k])
+            ask_price, bid_price = cache.ask(qk, size), cache.bid(qk, size)
+            if not BREAKERS.in_force(state.market_id):
+                return _format_quote(cache.price(qk), ask_price, bid_price, liquidity)
+            quote = _format_quote(cache.price(qk), *widen(ask_price, bid_price), liquidity)
+            quote['circuit_breaker'] = True
+            return quote
+        except Exception:
+            return dict(_MATH_ERROR)
+
+def get_quote_ladder(state, size=1.0):
+    """
+    Quotes for every bucket from a single kernel pass (O(N) for the whole ladder).
+    Returns list of quote dicts in knot order, same shape as get_quotes_for_bucket.
+    """
+    with state.lock:
+        sync_breaker(state)
+        _, q, b, _ = state.snapshot()
+        widened = BREAKERS.in_force(state.market_id)
     N = len(q)
     liquidity = b * math.log(N)
     try:
-        mid = px(q, b)[k]
-        ask_price = ask(q, b, k, size)
-        bid_price = bid(q, b, k, size)
-        # Guard against NaN/inf
-        if not all(map(math.isfinite, [mid, ask_price, bid_price, liquidity])):
-            return {'error': 'Bankroll exhausted or math error', 'bid': 0, 'mid': 0, 'ask': 0, 'liquidity': 0}
-        return {
-            'bid': round(bid_price, 6),
-            'mid': round(mid, 6),
-            'ask': round(ask_price, 6),
-            'liquidity': round(liquidity, 2)
-        }
+        res = lmsr_kernel.lmsr_kernel(q, b, size)
     except Exception:
-        return {'error': 'Bankroll exhausted or math error', 'bid': 0, 'mid': 0, 'ask': 0, 'liquidity': 0}
+        return [dict(_MATH_ERROR) for _ in range(N)]
+    if widened:
+        res['ask'], res['bid'] = widen(res['ask'], res['bid'])
+    return [
+        _format_quote(float(m), float(a), float(bd), liquidity)
+        for m, a, bd in zip(res['prices'], res['ask'], res['bid'])
+    ]
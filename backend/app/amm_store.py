@@ -0,0 +1,177 @@
+# Persistent AMM state: append-only log of q-deltas + periodic binary snapshots
+# Works on any engine from app/db.py (SQLite or Postgres).
+#
+# Two books are journaled: 'amm' (amm_state.AMM_STATE, knots addressed by x)
+# and 'book' (amm_orders.ORDER_BOOK, buckets addressed by index). On startup
+# each market is restored from its latest snapshot plus the log rows after it.
+
+import math
+from threading import Lock
+from datetime import datetime
+import numpy as np
+import json
+from sqlalchemy import Column, Integer, String, Float, DateTime, LargeBinary, Text, insert, delete, select
+from .models import Base
+from .exposure import EXPOSURE
+
+# Snapshot (and compact the log for) a market after this many log entries
+SNAPSHOT_EVERY = 500
+
+class AMMSnapshot(Base):
+    __tablename__ = 'amm_snapshots'
+    id = Column(Integer, primary_key=True)
+    book = Column(String, nullable=False)
+    market_id = Column(Integer, nullable=False, index=True)
+    seq = Column(Integer, nullable=False)  # last log id folded into this snapshot
+    b = Column(Float, nullable=False)
+    bankroll = Column(Float, nullable=True)
+    min_val = Column(Float, nullable=True)
+    max_val = Column(Float, nullable=True)
+    x = Column(LargeBinary, nullable=True)  # float64 little-endian
+    q = Column(LargeBinary, nullable=False)
+    exposure = Column(Text, nullable=True)  # exposure tracker state as of seq (JSON)
+    orders = Column(Text, nullable=True)  # 'book': resting limit orders as of seq (JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AMMTradeLog(Base):
+    __tablename__ = 'amm_trade_log'
+    # Snapshots delete the rows they cover, so ids must never be handed out
+    # again (SQLite reuses the max rowid without AUTOINCREMENT)
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = Column(Integer, primary_key=True)  # monotonically increasing sequence
+    book = Column(String, nullable=False)
+    market_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)  # 'trade' | 'knot' | 'reprice'; 'book' orders: 'rest' | 'fill' | 'cancel'
+    x = Column(Float, nullable=True)
+    bucket = Column(Integer, nullable=True)
+    dq = Column(Float, nullable=False, default=0.0)
+    paid = Column(Float, nullable=True)  # trades: LMSR cost C(q') - C(q), on one row per trade
+    fee = Column(Float, nullable=True)  # trades: charged on top of paid
+    order_id = Column(Integer, nullable=True)  # resting order events (rest: x = limit, dq = +/- size by side)
+
+def _pack(arr):
+    return np.ascontiguousarray(arr, dtype='<f8').tobytes()
+
+def _unpack(blob):
+    return np.frombuffer(blob, dtype='<f8').astype(np.float64)
+
+class AMMStore:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = Lock()
+        self.pending = {}  # (book, market_id) -> log entries since last snapshot
+
+    # --- write path ---
+    def append(self, book, market_id, kind, x=None, bucket=None, dq=0.0, paid=None, fee=None, order_id=None):
+        """
+        Durably append one entry; callers apply the change in memory afterwards.
+        """
+        return self.append_many(book, market_id, [
+            {'kind': kind, 'x': x, 'bucket': bucket, 'dq': dq, 'paid': paid, 'fee': fee, 'order_id': order_id}])
+
+    def append_many(self, book, market_id, entries):
+        rows = [dict({'x': None, 'bucket': None, 'dq': 0.0, 'paid': None, 'fee': None, 'order_id': None},
+                     **e, book=book, market_id=market_id)
+                for e in entries]
+        with self.engine.begin() as conn:
+            conn.execute(insert(AMMTradeLog), rows)
+        with self.lock:
+            key = (book, market_id)
+            self.pending[key] = self.pending.get(key, 0) + len(rows)
+            return self.pending[key] >= SNAPSHOT_EVERY
+
+    def snapshot_amm(self, state):
+        self._snapshot('amm', state.market_id, state.b, state.q, x=state.x,
+                       bankroll=state.bankroll, min_val=state.min_val, max_val=state.max_val)
+
+    def snapshot_book(self, market_id, book_state):
+        self._snapshot('book', market_id, book_state['b'], book_state['q'],
+                       orders=json.dumps(book_state['clob'].dump()))
+
+    def _snapshot(self, book, market_id, b, q, x=None, **extra):
+        """
+        Write a compact snapshot and drop the log entries (and older snapshots) it covers.
+        Callers hold the market's state stable while this runs.
+        """
+        exposure = EXPOSURE.dump(book, market_id)
+        with self.engine.begin() as conn:
+            seq = conn.execute(
+                select(AMMTradeLog.id).where(AMMTradeLog.book == book, AMMTradeLog.market_id == market_id)
+                .order_by(AMMTradeLog.id.desc()).limit(1)
+            ).scalar() or 0
+            snap_id = conn.execute(insert(AMMSnapshot).values(
+                book=book, market_id=market_id, seq=seq, b=b,
+                x=_pack(x) if x is not None else None, q=_pack(q),
+                exposure=json.dumps(exposure) if exposure is not None else None, created_at=datetime.utcnow(), **extra)).inserted_primary_key[0]
+            conn.execute(delete(AMMTradeLog).where(
+                AMMTradeLog.book == book, AMMTradeLog.market_id == market_id, AMMTradeLog.id <= seq))
+            conn.execute(delete(AMMSnapshot).where(
+                AMMSnapshot.book == book, AMMSnapshot.market_id == market_id, AMMSnapshot.id < snap_id))
+        with self.lock:
+            self.pending[(book, market_id)] = 0
+
+    # --- startup replay ---
+    def restore(self, amm_states, order_book):
+        """
+        Rebuild AMM_STATE / ORDER_BOOK style dicts from snapshots + log.
+        """
+        from .amm_state import make_state, replay_entry
+        from .amm_orders import new_book_state, replay_book_entry, replay_order_entry
+        with self.engine.connect() as conn:
+            snaps = conn.execute(select(AMMSnapshot).order_by(AMMSnapshot.id)).all()
+            latest = {}
+            for snap in snaps:
+                latest[(snap.book, snap.market_id)] = snap
+            for (book, market_id), snap in list(latest.items()):
+                if book == 'amm':
+                    state, created = make_state(market_id, _unpack(snap.x), _unpack(snap.q), snap.bankroll,
+                                                snap.b, snap.min_val, snap.max_val)
+                    amm_states[market_id] = state
+                    if not created:
+                        # Live shared-memory segment from another worker is already current
+                        del latest[(book, market_id)]
+                else:
+                    order_book[market_id] = new_book_state(_unpack(snap.q).tolist(), snap.b)
+                    if snap.orders:
+                        order_book[market_id]['clob'].load(json.loads(snap.orders))
+                if (book, market_id) in latest:
+                    EXPOSURE.load(book, market_id, json.loads(snap.exposure) if snap.exposure else None)
+            rows = conn.execute(select(AMMTradeLog).order_by(AMMTradeLog.id)).all()
+        for row in rows:
+            snap = latest.get((row.book, row.market_id))
+            if snap is None or row.id <= snap.seq:
+                continue
+            if row.book == 'amm':
+                replay_entry(amm_states[row.market_id], row.kind, row.x, row.dq)
+            elif row.kind == 'trade':
+                replay_book_entry(order_book[row.market_id], row.bucket, row.dq)
+            else:
+                replay_order_entry(order_book[row.market_id], row.kind, row.bucket, row.x, row.dq, row.paid,
+                                   row.order_id)
+            if row.kind == 'trade':
+                if row.book == 'amm':
+                    key, seed = row.x, amm_states[row.market_id].bankroll
+                else:
+                    book_state = order_book[row.market_id]
+                    key, seed = row.bucket, book_state['b'] * math.log(len(book_state['q']))
+                EXPOSURE.replay(row.book, row.market_id, key, row.dq, row.paid, row.fee, seed)
+            key = (row.book, row.market_id)
+            self.pending[key] = self.pending.get(key, 0) + 1
+        for state in order_book.values():
+            state['partition'].rebase(state['q'], state['b'])
+
+STORE = None
+
+def attach(engine):
+    """
+    Restore persisted AMM state into the live dicts and journal all further changes.
+    """
+    global STORE
+    from . import amm_state, amm_orders
+    store = AMMStore(engine)
+    with amm_state.AMM_LOCK:
+        store.restore(amm_state.AMM_STATE, amm_orders.ORDER_BOOK)
+    amm_state.JOURNAL = store
+    amm_orders.JOURNAL = store
+    STORE = store
+    return store
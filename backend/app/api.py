@@ -6,7 +6,12 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from . import models, schemas
-from .db import get_db
+from .db import get_db, run_db
+from .market_stats import record_bet, get_stats as get_market_stats
+from .listing import keyset_page, ndjson_response, MAX_LIMIT
+from .leaderboard import get_leaderboard
+from fastapi import Response, Query
+from starlette.concurrency import run_in_threadpool
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # In production, use environment variables
@@ -41,7 +46,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _detached_user(db, username):
+    # The session closes before the handler runs, so hand back a detached
+    # snapshot of the row on purpose: column attributes are loaded and stay
+    # readable, relationships (bets, markets) are not loaded and raise
+    # DetachedInstanceError. Handlers query those by current_user.id in their
+    # own session, and pass the id rather than the object to it.
+    user = get_user(db, username)
+    if user is not None:
+        db.expunge(user)
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,7 +71,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    # Off the event loop: async engine, or a pooled session in the threadpool
+    user = await run_db(lambda db: _detached_user(db, token_data.username))
     if user is None:
         raise credentials_exception
     return user
@@ -64,12 +81,10 @@ router = APIRouter()
 
 # Auth endpoints
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
-):
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await run_db(lambda db: get_user(db, form_data.username))
+    # bcrypt is deliberately slow; keep it off the event loop too
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -120,13 +135,49 @@ def create_market(
         creator_id=current_user.id
     )
     db.add(db_market)
+    db.flush()
+    # Created with the market, so concurrent first bets only ever UPDATE it
+    db.add(models.MarketStats(market_id=db_market.id))
     db.commit()
     db.refresh(db_market)
     return db_market
 
+MARKET_COLUMNS = (models.Market.id, models.Market.title, models.Market.description, models.Market.status,
+                  models.Market.outcome_type, models.Market.outcome_min, models.Market.outcome_max,
+                  models.Market.outcome_categories, models.Market.created_at, models.Market.creator_id)
+
 @router.get("/markets/", response_model=list[schemas.MarketRead])
-def list_markets(db: Session = Depends(get_db)):
-    return db.query(models.Market).all()
+def list_markets(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    status: Optional[str] = None,
+    creator_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    Keyset-paginated markets when cursor or limit is given (next page cursor
+    in X-Next-Cursor, pages of DEFAULT_LIMIT by default), else every
+    matching market; format=ndjson streams them instead.
+    """
+    query = db.query(*MARKET_COLUMNS)
+    if status is not None:
+        query = query.filter(models.Market.status == status)
+    if creator_id is not None:
+        query = query.filter(models.Market.creator_id == creator_id)
+    if since is not None:
+        query = query.filter(models.Market.created_at >= since)
+    if until is not None:
+        query = query.filter(models.Market.created_at < until)
+    if format == "ndjson":
+        return ndjson_response(query, models.Market.id, cursor)
+    rows, next_cursor = keyset_page(query, models.Market.id, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [dict(row._mapping) for row in rows]
 
 @router.get("/markets/{market_id}")
 def get_market_detail(market_id: int, db: Session = Depends(get_db)):
@@ -154,32 +205,38 @@ def get_market_detail(market_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         print(f"Warning: Could not initialize AMM state: {e}")
     
-    # Calculate liquidity and traders
-    bets = db.query(models.Bet).filter(models.Bet.market_id == market_id).all()
-    liquidity = sum(bet.amount for bet in bets)
-    traders = len(set(bet.user_id for bet in bets))
+    # Liquidity and traders from the incrementally maintained aggregate
+    stats = get_market_stats(db, market_id)
     
     # Return market fields plus liquidity and traders
     market_data = {
         **schemas.MarketRead.from_orm(market).dict(),
-        "liquidity": liquidity,
-        "traders": traders
+        "liquidity": stats['liquidity'],
+        "traders": stats['traders'],
+        "last_trade_at": stats['last_trade_at'],
     }
     return market_data
 
 # --- QUOTE API ---
 from . import lmsr
-from .amm_state import get_amm_state, insert_knot, get_quotes_for_bucket, px
-from .threshold_contracts import payoff_vector, price_per_contract
-from .implied_distribution import lmsr_lognormal_pareto
-from .lmsr_bid_ask import lmsr_bid_ask
-from .amm_orders import place_order, set_amm_state
+from .amm_state import get_amm_state, insert_knot, get_quotes_for_bucket, get_quote_ladder, apply_trade, px
+from .threshold_contracts import payoff_vector, price_per_contract, threshold_pricer
+from .implied_distribution import lmsr_lognormal_pareto, lmsr_lognormal_pareto_batch, cached_fit
+from .lmsr_bid_ask import lmsr_bid_ask, lmsr_prices_sparse
+from .price_feed import FEED
+from fastapi import Request, Header
+from fastapi.responses import StreamingResponse
+from .read_cache import cached_response
+from .amm_orders import place_order, place_orders, set_amm_state, cancel_order, get_order, get_book_levels
+from .exposure import EXPOSURE
+from .circuit_breaker import BREAKERS, spread_fee
 import math
 
 @router.get("/markets/{market_id}/bid_ask")
-def get_market_bid_ask(market_id: int, db: Session = Depends(get_db)):
+def get_market_bid_ask(market_id: int, db: Session = Depends(get_db), if_none_match: Optional[str] = Header(None)):
     """
     Returns for each knot: value, mid, bid, ask, liquidity using AMM helpers. Robust to overflow/NaN.
+    Served from a per-version cache; honours If-None-Match.
     """
     market = db.query(models.Market).filter(models.Market.id == market_id).first()
     if not market:
@@ -189,19 +246,22 @@ def get_market_bid_ask(market_id: int, db: Session = Depends(get_db)):
     N = 21
     try:
         state = get_amm_state(market_id, N, min_val, max_val)
-        knots = state['knots']
-        result = []
-        for i, k in enumerate(knots):
-            quote = get_quotes_for_bucket(state, i, size=1.0)
-            result.append({
-                'value': k['x'],
-                'mid': quote.get('mid', 0.0),
-                'bid': quote.get('bid', 0.0),
-                'ask': quote.get('ask', 0.0),
-                'liquidity': quote.get('liquidity', 0.0),
-                'error': quote.get('error', None)
-            })
-        return result
+
+        def build():
+            values = state.x.tolist()
+            ladder = get_quote_ladder(state, size=1.0)
+            result = []
+            for x, quote in zip(values, ladder):
+                result.append({
+                    'value': x,
+                    'mid': quote.get('mid', 0.0),
+                    'bid': quote.get('bid', 0.0),
+                    'ask': quote.get('ask', 0.0),
+                    'liquidity': quote.get('liquidity', 0.0),
+                    'error': quote.get('error', None)
+                })
+            return result
+        return cached_response('bid_ask', state, build, if_none_match)
     except Exception as e:
         print(f"Error in get_market_bid_ask: {e}")
         return [{
@@ -228,8 +288,63 @@ def place_market_order(
     Place a market or limit order at a specific bucket (valuation index).
     """
     result = place_order(market_id, bucket_idx, side, size, order_type, limit_price)
+    if result.get('filled'):
+        FEED.publish(market_id, book='book')
     return result
 
+@router.post("/markets/{market_id}/orders")
+def place_market_orders(market_id: int, batch: schemas.BatchOrder):
+    """
+    Submit many legs (bucket, side, size, limit) as one atomic, jointly priced order.
+    """
+    result = place_orders(market_id, [leg.dict() for leg in batch.legs])
+    if result['status'] == 'error':
+        raise HTTPException(status_code=400, detail=result['detail'])
+    if result['status'] == 'filled':
+        FEED.publish(market_id, book='book')
+    return result
+
+@router.get("/markets/{market_id}/book")
+def get_market_book(market_id: int):
+    """
+    Best resting bid/offer (and size) per bucket for the market's limit order book.
+    """
+    levels = get_book_levels(market_id)
+    if levels is None:
+        raise HTTPException(status_code=404, detail="No AMM state for market")
+    return levels
+
+@router.get("/markets/{market_id}/exposure")
+def get_market_exposure(market_id: int, book: str = Query("amm", regex="^(amm|book)$")):
+    """
+    Market maker's running exposure: worst-case loss (largest net trader
+    position minus cost collected) against seed capital, cumulative fees,
+    and whether b was reduced / trading paused.
+    """
+    report = EXPOSURE.report(book, market_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No trades on this market yet")
+    return report
+
+@router.get("/markets/{market_id}/circuit_breaker")
+def get_circuit_breaker(market_id: int):
+    """Whether the market's price-move breaker is tripped (wider spread, raised b) and until when."""
+    return BREAKERS.status(market_id)
+
+@router.get("/markets/{market_id}/orders/{order_id}")
+def get_resting_order(market_id: int, order_id: int):
+    order = get_order(market_id, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+@router.delete("/markets/{market_id}/orders/{order_id}")
+def cancel_resting_order(market_id: int, order_id: int):
+    order = cancel_order(market_id, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
 @router.get("/markets/{market_id}/quote")
 def get_market_quote(market_id: int, val: float, db: Session = Depends(get_db)):
     # --- CONTINUOUS AMM LOGIC ---
@@ -240,18 +355,17 @@ def get_market_quote(market_id: int, val: float, db: Session = Depends(get_db)):
     max_val = market.outcome_max or lmsr.LOG_BUCKET_MAX
     N = 21
     state = get_amm_state(market_id, N, min_val, max_val)
-    insert_knot(state, val)
-    knots = state['knots']
-    b = state['b']
-    q = [k['q'] for k in knots]
-    prices = lmsr_prices_sparse(q, b)
+    with state.lock:
+        idx = insert_knot(state, val)
+        b = state.b
+        prices = lmsr_prices_sparse(state.q, b)
     pk = prices[idx]
     low_idx = max(0, idx - 1)
-    high_idx = min(len(knots) - 1, idx + 1)
+    high_idx = min(len(state) - 1, idx + 1)
     payout_low = prices[low_idx]
     payout_high = prices[high_idx]
     return {
-        'knot': knots[idx],
+        'knot': state.knot(idx),
         'price': pk,
         'payouts': {
             'low': payout_low,
@@ -259,20 +373,88 @@ def get_market_quote(market_id: int, val: float, db: Session = Depends(get_db)):
             'high': payout_high,
         },
         'b': b,
-        'N': len(knots)
+        'N': len(state)
+    }
+
+@router.get("/markets/{market_id}/stream")
+async def stream_market_prices(market_id: int, request: Request, book: str = 'amm'):
+    """
+    Server-sent events: a snapshot of x, q, b and prices, then coalesced
+    deltas (changed q entries and changed rounded prices) after each trade.
+    book='amm' follows the quote_and_trade AMM, book='book' the order book.
+    """
+    if book not in ('amm', 'book'):
+        raise HTTPException(status_code=400, detail="book must be 'amm' or 'book'")
+    return StreamingResponse(
+        FEED.stream(market_id, book=book, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _market_amm_state(db, market_id):
+    """The market's AMM state on its own outcome bounds; 404 for unknown markets."""
+    market = db.query(models.Market).filter(models.Market.id == market_id).first()
+    if not market:
+        raise HTTPException(status_code=404, detail="Market not found")
+    return get_amm_state(market_id, 21, market.outcome_min or 5e6, market.outcome_max or 1e12)
+
+@router.get("/markets/{market_id}/survival")
+def get_market_survival(market_id: int, K: Optional[List[float]] = Query(None), delta: float = 0.3,
+                        db: Session = Depends(get_db)):
+    """
+    Implied survival curve P(V>=K) (base/low/high scenarios) for many thresholds
+    at once; defaults to the market's knots. The fit is cached per state version.
+    """
+    state = _market_amm_state(db, market_id)
+    x, fit = cached_fit(state)
+    thresholds = x if not K else K
+    if any(k <= 0 for k in thresholds):
+        raise HTTPException(status_code=400, detail="Thresholds must be positive")
+    res = lmsr_lognormal_pareto_batch(None, None, thresholds, delta, fit=fit)
+    return {
+        'K': [float(k) for k in thresholds],
+        'base': res['base'].tolist(),
+        'low': res['low'].tolist(),
+        'high': res['high'].tolist(),
+        'mu': fit['mu'],
+        'sigma': fit['sigma'],
+        'alpha_base': fit['alpha_base'],
+        'tau': fit['tau'],
+    }
+
+@router.get("/markets/{market_id}/threshold")
+def get_threshold_quotes(
+    market_id: int,
+    K: List[float] = Query(...),
+    direction: str = Query("long", regex="^(long|short)$"),
+    size: float = Query(1.0, gt=0),
+    db: Session = Depends(get_db),
+):
+    """
+    Above (long, V >= K) or below (short, V <= K) contract quotes for one or
+    many strikes: price, plus exact LMSR cost (ask) / proceeds (bid) for size
+    units of the whole payoff. O(log N) per strike from cached prefix sums.
+    """
+    state = _market_amm_state(db, market_id)
+    res = threshold_pricer(state).quote(K, direction, size)
+    return {
+        'K': K,
+        'direction': direction,
+        'size': size,
+        'price': res['price'].tolist(),
+        'ask': res['ask'].tolist(),
+        'bid': res['bid'].tolist(),
     }
 
 @router.get("/markets/{market_id}/amm_state")
-def get_market_amm_state(market_id: int):
+def get_market_amm_state(market_id: int, if_none_match: Optional[str] = Header(None)):
     from .amm_state import get_amm_state
     # Use default grid for now
     N = 21
     min_val = 5e6
     max_val = 1e12
     state = get_amm_state(market_id, N, min_val, max_val, prior=None)
-    q = [k['q'] for k in state['knots']]
-    b = state['b']
-    return {'q': q, 'b': b}
+    return cached_response('amm_state', state, lambda: {'q': state.q.tolist(), 'b': state.b}, if_none_match)
 
 # Unified quote_and_trade endpoint for threshold contracts
 from fastapi import Body
@@ -286,11 +468,11 @@ from fastapi import Query
 FAUCET_LIMIT = 1000  # Max faucet per call
 FAUCET_INTERVAL = 60  # seconds between allowed faucet requests per user
 faucet_last = {}  # {user_id: last_request_time}
+WALLET = PlayWallet()  # stateless; balances are cached by the engine's ledger
 
 @router.get("/wallet/balance")
 def get_wallet_balance(user_id: int = Query(...), db: Session = Depends(get_db)):
-    wallet = PlayWallet()
-    bal = wallet.get_balance(db, str(user_id))
+    bal = WALLET.get_balance(db, str(user_id))
     return {"user_id": user_id, "balance": float(bal)}
 
 @router.get("/faucet")
@@ -301,8 +483,8 @@ def faucet(user_id: int = Query(...), amt: float = Query(...), db: Session = Dep
         raise HTTPException(status_code=429, detail=f"Faucet cooldown: wait {int(FAUCET_INTERVAL - (now - last))}s")
     if amt > FAUCET_LIMIT:
         raise HTTPException(status_code=400, detail=f"Max faucet per call: {FAUCET_LIMIT}")
-    wallet = PlayWallet()
-    wallet.credit(db, str(user_id), Decimal(str(amt)), ref="faucet")
+    # Write-behind: the credit is visible in the cached balance immediately
+    WALLET.credit(db, str(user_id), Decimal(str(amt)), ref="faucet", wait=False)
     faucet_last[user_id] = now
     return {"user_id": user_id, "credited": amt}
 
@@ -313,9 +495,8 @@ def deposit_intent(user_id: int = Body(...), db: Session = Depends(get_db)):
 
 @router.post("/withdraw")
 def withdraw(user_id: int = Body(...), amt: float = Body(...), db: Session = Depends(get_db)):
-    wallet = PlayWallet()
     try:
-        wallet.debit(db, str(user_id), Decimal(str(amt)), ref="withdraw")
+        WALLET.debit(db, str(user_id), Decimal(str(amt)), ref="withdraw")
         # Log intent only, no real transfer
         return {"user_id": user_id, "withdrawn": amt, "status": "intent logged"}
     except Exception as e:
@@ -340,48 +521,46 @@ def quote_and_trade(
     max_val = market.outcome_max or 1e12
     N = 21
     state = get_amm_state(market_id, N, min_val, max_val)
-    insert_knot(state, val)
-    knots = state['knots']
-    b = state['b']
-    q = [k['q'] for k in knots]
-    # Find bucket index for val
-    k = next((i for i, knot in enumerate(knots) if abs(knot['x'] - val) < 1e-6), None)
-    if k is None:
-        raise HTTPException(status_code=400, detail="Could not find or insert bucket for valuation")
-    # Get quote for this bucket
-    quote = get_quotes_for_bucket(state, k, size=n)
-    # If math error, return error
-    if 'error' in quote and quote['error']:
-        return {"error": quote['error'], "bid": 0, "mid": 0, "ask": 0, "liquidity": 0}
-    # Quote only (no trade)
-    if not execute:
-        return {
-            "bid": quote['bid'],
-            "mid": quote['mid'],
-            "ask": quote['ask'],
-            "liquidity": quote['liquidity'],
-            "bucket": k
-        }
-    # Trade: update q and wallet
-    q_before = q[:]
-    # For this MVP, buy = ask, sell = bid, size = n
-    if dir == 'buy':
-        q_after = [qk + (n if i == k else 0) for i, qk in enumerate(q)]
-        payment = quote['ask']
-    elif dir == 'sell':
-        q_after = [qk - (n if i == k else 0) for i, qk in enumerate(q)]
-        payment = quote['bid']
-    else:
-        raise HTTPException(status_code=400, detail="Invalid direction (must be 'buy' or 'sell')")
-    # Wallet settlement: debit user for payment, log tx
-    wallet = PlayWallet()
-    try:
-        wallet.debit(db, str(user_id), Decimal(str(payment)), ref=f"market:{market_id}|trade:{val}|{dir}|{n}")
-    except Exception as e:
-        raise HTTPException(status_code=402, detail=f"Insufficient balance: {e}")
-    # Update AMM state
-    for i in range(len(knots)):
-        knots[i]['q'] = q_after[i]
+    # Quote, settle and update q as one step under the market's lock, so
+    # concurrent trades on this market are serialized and can't lose updates
+    with state.lock:
+        # Find (or insert) the bucket for val
+        k = insert_knot(state, val)
+        # Get quote for this bucket
+        quote = get_quotes_for_bucket(state, k, size=n)
+        # If math error, return error
+        if 'error' in quote and quote['error']:
+            return {"error": quote['error'], "bid": 0, "mid": 0, "ask": 0, "liquidity": 0}
+        # Quote only (no trade)
+        if not execute:
+            return {
+                "bid": quote['bid'],
+                "mid": quote['mid'],
+                "ask": quote['ask'],
+                "liquidity": quote['liquidity'],
+                "bucket": k
+            }
+        # Trade: update q and wallet
+        # For this MVP, buy = ask, sell = bid, size = n
+        if dir == 'buy':
+            delta = n
+            payment = quote['ask']
+        elif dir == 'sell':
+            delta = -n
+            payment = quote['bid']
+        else:
+            raise HTTPException(status_code=400, detail="Invalid direction (must be 'buy' or 'sell')")
+        if EXPOSURE.is_paused('amm', market_id):
+            raise HTTPException(status_code=503, detail="Trading paused for this market")
+        # Wallet settlement: debit user for payment, log tx
+        # Checked and reserved in memory; returns once the debit is committed
+        try:
+            WALLET.debit(db, str(user_id), Decimal(str(payment)), ref=f"market:{market_id}|trade:{val}|{dir}|{n}")
+        except Exception as e:
+            raise HTTPException(status_code=402, detail=f"Insufficient balance: {e}")
+        # Update AMM state (O(1) incremental partition update)
+        apply_trade(state, k, delta, fee=spread_fee(quote, dir) if quote.get('circuit_breaker') else 0.0)
+    FEED.publish(market_id)
     # Store contract as Bet
     db_bet = models.Bet(
         user_id=user_id,
@@ -391,6 +570,7 @@ def quote_and_trade(
         placed_at=datetime.utcnow()
     )
     db.add(db_bet)
+    record_bet(db, db_bet)
     db.commit()
     db.refresh(db_bet)
     return {
@@ -403,23 +583,58 @@ def quote_and_trade(
         "bet_id": db_bet.id
     }
 
+BET_COLUMNS = (models.Bet.id, models.Bet.market_id, models.Bet.user_id, models.Bet.amount,
+               models.Bet.prediction, models.Bet.placed_at)
+
 @router.get("/bets/", response_model=list[schemas.BetRead])
-def list_bets(db: Session = Depends(get_db)):
-    return db.query(models.Bet).all()
+def list_bets(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+    market_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    Keyset-paginated bets when cursor or limit is given (next page cursor
+    in X-Next-Cursor, pages of DEFAULT_LIMIT by default), else every
+    matching bet; format=ndjson streams them instead.
+    """
+    query = db.query(*BET_COLUMNS)
+    if market_id is not None:
+        query = query.filter(models.Bet.market_id == market_id)
+    if user_id is not None:
+        query = query.filter(models.Bet.user_id == user_id)
+    if since is not None:
+        query = query.filter(models.Bet.placed_at >= since)
+    if until is not None:
+        query = query.filter(models.Bet.placed_at < until)
+    if format == "ndjson":
+        return ndjson_response(query, models.Bet.id, cursor)
+    rows, next_cursor = keyset_page(query, models.Bet.id, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [dict(row._mapping) for row in rows]
 
 # Leaderboard (P&L)
 @router.get("/leaderboard")
-def leaderboard(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    starting_balance = 1000.0
-    ranked = [
-        {
-            "username": u.username,
-            "display_name": u.display_name,
-            "balance": u.balance,
-            "pnl": u.balance - starting_balance,
-        }
-        for u in users
-    ]
-    ranked = sorted(ranked, key=lambda x: x["pnl"], reverse=True)
-    return ranked
+def leaderboard(
+    limit: int = Query(50, ge=1, le=MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """
+    Users ranked by P&L (wallet balance minus net faucet funding), maintained
+    incrementally from the TxLog; paginate with limit/offset.
+    """
+    return get_leaderboard(db.get_bind()).top(limit, offset)
+
+@router.get("/leaderboard/rank")
+def leaderboard_rank(user_id: int = Query(...), db: Session = Depends(get_db)):
+    entry = get_leaderboard(db.get_bind()).rank(str(user_id))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User has no wallet activity")
+    return entry
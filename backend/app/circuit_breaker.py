@@ -0,0 +1,192 @@
+# Per-market circuit breaker: trips when a bucket's LMSR price moves more
+# than MOVE_LIMIT (relative) within WINDOW_SECONDS, then for COOLDOWN_SECONDS
+# quotes get a wider spread and the market a larger b (q scaled with it, so
+# prices don't jump).
+#
+# Each market keeps a ring of SLOTS price vectors, one per time slot of
+# WINDOW_SECONDS / SLOTS, written by the first trade of a slot (slots with no
+# trades repeat the last price, since only trades move it). A trade then
+# compares its bucket's new price against the ring's oldest slot in O(1).
+# Everything is evaluated lazily on trades and quotes - there are no timers.
+# Knot inserts keep the window: the ring gains a column per new bucket and
+# each old bucket's history is scaled by its price change from the insert
+# itself (new b, mass taken by the new bucket), so only trades count as
+# moves. Disabled in shared-memory mode (see below).
+
+import os
+import time
+from threading import Lock
+import numpy as np
+
+MOVE_LIMIT = float(os.getenv("CIRCUIT_BREAKER_MOVE", "0.2"))  # 0 disables the breaker
+WINDOW_SECONDS = float(os.getenv("CIRCUIT_BREAKER_WINDOW", "3600"))
+SLOTS = 60
+COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "900"))
+SPREAD_WIDEN = float(os.getenv("CIRCUIT_BREAKER_SPREAD", "0.02"))  # ask * (1 + w), bid * (1 - w)
+B_MULTIPLIER = float(os.getenv("CIRCUIT_BREAKER_B_MULTIPLIER", "2.0"))
+MIN_PRICE = 0.01  # moves among buckets priced below this on both ends don't count
+
+class Breaker:
+    __slots__ = ('n', 'ring', 'first', 'last', 'tripped_until', 'b_factor', 'applied', 'trips')
+
+    def __init__(self):
+        self.n = -1
+        self.ring = None  # (SLOTS, n) prices; row = slot % SLOTS
+        self.first = self.last = None  # absolute slot numbers held in the ring
+        self.tripped_until = 0.0
+        self.b_factor = 1.0  # multiplier currently applied to the market's b
+        self.applied = False  # trip effects (spread, b) in force as of the last transition()
+        self.trips = 0
+
+    def capture(self, slot, prices):
+        """Record the price vector for every slot from the last one up to slot."""
+        if len(prices) != self.n:
+            self.n = len(prices)
+            self.ring = np.zeros((SLOTS, self.n))
+            self.first = self.last = None
+        if self.last is None:
+            self.first = slot
+        elif slot - self.last >= SLOTS:
+            self.first = slot - SLOTS + 1
+        start = slot if self.last is None else max(self.last + 1, slot - SLOTS + 1)
+        for s in range(start, slot + 1):
+            self.ring[s % SLOTS] = prices
+        self.last = slot
+
+    def shift(self, pos, before, after):
+        """
+        Re-index the ring for knots inserted at pos (np.insert positions in
+        the old grid, sorted); before / after are the price vectors around
+        the insert.
+        """
+        new = pos + np.arange(len(pos))
+        kept = np.ones(len(after), dtype=bool)
+        kept[new] = False
+        scale = np.divide(after[kept], before, out=np.ones(len(before)), where=before > 0)
+        self.ring = np.insert(self.ring * scale, pos, after[new], axis=1)
+        self.n = len(after)
+
+    def reference(self, k):
+        """Bucket k's price at the start of the window."""
+        return self.ring[max(self.first, self.last - SLOTS + 1) % SLOTS, k]
+
+def _shared_memory():
+    # Breaker state is per process, but in shared-memory mode (app/amm_shm.py)
+    # b and q are shared: every worker would scale the same b by its own
+    # factor and lift it on its own schedule. The breaker stays off there.
+    from . import amm_shm
+    return amm_shm.SHARED_MEMORY
+
+def _slot(now):
+    return int(now // (WINDOW_SECONDS / SLOTS))
+
+class CircuitBreakers:
+    def __init__(self):
+        self.markets = {}
+        self.lock = Lock()  # guards the dict only; each entry is guarded by its market's lock
+
+    def _get(self, market_id):
+        breaker = self.markets.get(market_id)
+        if breaker is None:
+            with self.lock:
+                breaker = self.markets.setdefault(market_id, Breaker())
+        return breaker
+
+    def before_trade(self, market_id, n, prices, now=None):
+        """
+        Called under the market's lock before q moves. prices() builds the
+        current price vector; it only runs on the first trade of a time slot.
+        """
+        if not MOVE_LIMIT or _shared_memory():
+            return
+        breaker = self._get(market_id)
+        slot = _slot(time.time() if now is None else now)
+        if breaker.last != slot or breaker.n != n:
+            breaker.capture(slot, prices())
+
+    def after_trade(self, market_id, k, price, now=None):
+        """O(1) check of bucket k's new price against the window start; True if it trips."""
+        breaker = self.markets.get(market_id)
+        if not MOVE_LIMIT or breaker is None or breaker.ring is None:
+            return False
+        ref = breaker.reference(k)
+        if max(ref, price) < MIN_PRICE or abs(price - ref) <= MOVE_LIMIT * ref:
+            return False
+        now = time.time() if now is None else now
+        if breaker.tripped_until <= now:
+            breaker.trips += 1
+        breaker.tripped_until = now + COOLDOWN_SECONDS
+        return True
+
+    def watching(self, market_id):
+        """Whether the market has a price window (it has traded with the breaker on)."""
+        breaker = self.markets.get(market_id)
+        return breaker is not None and breaker.ring is not None
+
+    def knots_inserted(self, market_id, pos, before, after):
+        """
+        Carry the market's window across a knot insert (caller holds the
+        market's lock): pos are the new knots' positions in the old grid,
+        before / after the price vectors around the insert. O(SLOTS * N).
+        """
+        breaker = self.markets.get(market_id)
+        if breaker is None or breaker.ring is None or breaker.n != len(before):
+            return
+        breaker.shift(np.asarray(pos), np.asarray(before), np.asarray(after))
+
+    def transition(self, market_id, now=None):
+        """
+        None while the breaker is as it was at the last call, else the factor
+        to scale the market's b by on entering or leaving a trip. The caller
+        applies it (even 1.0) under the market's lock and bumps the state
+        version, so per-version read caches drop quotes built under the old
+        spread and b.
+        """
+        breaker = self.markets.get(market_id)
+        if breaker is None:
+            return None
+        tripped = self.is_tripped(market_id, now)
+        if tripped == breaker.applied:
+            return None
+        breaker.applied = tripped
+        target = B_MULTIPLIER if tripped else 1.0
+        factor = target / breaker.b_factor
+        breaker.b_factor = target
+        return factor
+
+    def forget(self, market_id):
+        """Drop a market's breaker (its AMM was replaced); its b carries no trip factor."""
+        with self.lock:
+            self.markets.pop(market_id, None)
+
+    def in_force(self, market_id):
+        """Whether quotes carry the trip's wider spread (as of the last transition)."""
+        breaker = self.markets.get(market_id)
+        return breaker is not None and breaker.applied
+
+    def is_tripped(self, market_id, now=None):
+        breaker = self.markets.get(market_id)
+        return breaker is not None and breaker.tripped_until > (time.time() if now is None else now)
+
+    def status(self, market_id, now=None):
+        breaker = self.markets.get(market_id)
+        if breaker is None:
+            return {'tripped': False, 'trips': 0, 'tripped_until': None, 'b_multiplier': 1.0}
+        return {
+            'tripped': self.is_tripped(market_id, now),
+            'trips': breaker.trips,
+            'tripped_until': breaker.tripped_until or None,
+            'b_multiplier': breaker.b_factor,
+        }
+
+def widen(ask, bid):
+    """Quote with the breaker's extra spread around the same mid."""
+    return ask * (1.0 + SPREAD_WIDEN), bid * (1.0 - SPREAD_WIDEN)
+
+def spread_fee(quote, direction):
+    """The part of a widened quote's payment that is spread, not LMSR cost."""
+    if direction == 'buy':
+        return quote['ask'] * SPREAD_WIDEN / (1.0 + SPREAD_WIDEN)
+    return quote['bid'] * SPREAD_WIDEN / (1.0 - SPREAD_WIDEN)
+
+BREAKERS = CircuitBreakers()
@@ -1,11 +1,45 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 import os
 
 # Update the DATABASE_URL as needed for your environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+# Pool settings (ignored for SQLite, which keeps SQLAlchemy's per-file pooling)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; below typical server idle timeouts
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# SQLite: WAL lets readers run alongside the (single) writer
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; safe against corruption, far fewer fsyncs
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # KiB
+    cursor.close()
+
+def make_engine(url):
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        if ":memory:" not in url:
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+                         pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING)
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -14,3 +48,45 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Optional async engine for Postgres (needs asyncpg). DB_ASYNC=0 disables it.
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_URL.startswith("postgresql") and os.getenv("DB_ASYNC", "1") == "1":
+    try:
+        import asyncpg  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+        ASYNC_DATABASE_URL = "postgresql+asyncpg://" + DATABASE_URL.split("://", 1)[1]
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                                           pool_timeout=POOL_TIMEOUT, pool_recycle=POOL_RECYCLE,
+                                           pool_pre_ping=POOL_PRE_PING)
+        AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    except ImportError:
+        pass
+
+async def get_async_db():
+    """
+    AsyncSession dependency for async handlers; requires the async engine.
+    """
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async sessions need a postgresql DATABASE_URL and asyncpg installed")
+    async with AsyncSessionLocal() as session:
+        yield session
+
+def _with_session(fn):
+    db = SessionLocal()
+    try:
+        return fn(db)
+    finally:
+        db.close()
+
+async def run_db(fn):
+    """
+    Run fn(session) from an async handler without blocking the event loop:
+    on the async engine when there is one, otherwise on a pooled sync
+    session in the threadpool. fn is plain sync ORM code either way.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn)
+    return await run_in_threadpool(_with_session, fn)
@@ -0,0 +1,216 @@
+# Running P&L / seed-capital exposure per market, updated in O(1) per trade
+# The market maker's worst-case loss is max_k (q_k - q0_k) - (C(q) - C(q0)):
+# the payout if the bucket traders hold most of resolves, minus the LMSR cost
+# they paid in. (Plain max_k q_k - C(q) is never positive here, since q
+# includes the phantom prior shares q0.) Both parts are accumulated from the
+# trades themselves: net shares per bucket (keyed by knot value on the 'amm'
+# book, by index on the order book) with a running max, and the cost of each
+# trade. Selling the max bucket down only makes the stored max an upper bound
+# ('stale'), which still answers "is a limit crossed?"; the O(N) rescan runs
+# only when that bound crosses a limit or a report is read. Re-pricing q
+# without trading (b reduction, recalibration, reseeding) leaves it valid.
+#
+# Limits are fractions of the market's seed capital (its bankroll, b log N
+# for order-book markets), net of fees: past REDUCE_B_AT the market's b (and
+# q, so prices are unchanged) is scaled by REDUCE_B_FACTOR, past PAUSE_AT
+# trading pauses. Each fires HOOKS once. Both are off unless configured.
+#
+# Tracker state rides along in each AMM snapshot and the journal carries each
+# trade's cost, so AMMStore.restore rebuilds it (pauses included) on startup.
+
+import os
+from threading import Lock
+
+def _limit(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+REDUCE_B_AT = _limit("EXPOSURE_REDUCE_B_AT")  # e.g. 0.5
+PAUSE_AT = _limit("EXPOSURE_PAUSE_AT")  # e.g. 0.9
+REDUCE_B_FACTOR = float(os.getenv("EXPOSURE_REDUCE_B_FACTOR", "0.5"))
+
+# Called as hook(event, book, market_id, exposure) with event 'reduce_b' or
+# 'pause', while the market's lock is held (keep them short).
+HOOKS = []
+
+def _shared_memory():
+    # In shared-memory mode (app/amm_shm.py) trades on one market arrive at
+    # several workers, so a per-process tracker would see only some of them
+    # and each worker would scale the shared b on its own. Not tracked there.
+    from . import amm_shm
+    return amm_shm.SHARED_MEMORY
+
+class Exposure:
+    __slots__ = ('seed', 'net', 'max_net', 'stale', 'collected', 'fees', 'volume', 'trades',
+                 'peak_loss', 'reduced', 'paused')
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.net = {}  # bucket key -> shares held by traders
+        self.max_net = 0.0  # buckets nobody trades resolve with zero payout
+        self.stale = False
+        self.collected = 0.0
+        self.fees = 0.0
+        self.volume = 0.0
+        self.trades = 0
+        self.peak_loss = 0.0
+        self.reduced = False
+        self.paused = False
+
+    def move(self, key, dq):
+        old = self.net.get(key, 0.0)
+        new = self.net[key] = old + dq
+        if new >= self.max_net:
+            self.max_net = new
+        elif old >= self.max_net:
+            self.stale = True  # the max bucket was sold down; max_net is now an upper bound
+        self.volume += abs(dq)
+
+    def rescan(self):
+        self.max_net = max(0.0, max(self.net.values(), default=0.0))
+        self.stale = False
+
+    @property
+    def worst_case_loss(self):
+        return self.max_net - self.collected
+
+    def report(self):
+        if self.stale:
+            self.rescan()
+        loss = self.worst_case_loss
+        self.peak_loss = max(self.peak_loss, loss)
+        return {
+            'worst_case_loss': loss,
+            'cost_collected': self.collected,
+            'fees': self.fees,
+            'net_worst_case': loss - self.fees,
+            'peak_loss': self.peak_loss,
+            'seed_capital': self.seed,
+            'loss_fraction': (loss - self.fees) / self.seed if self.seed else 0.0,
+            'volume': self.volume,
+            'trades': self.trades,
+            'b_reduced': self.reduced,
+            'paused': self.paused,
+        }
+
+class ExposureTracker:
+    def __init__(self):
+        self.markets = {}  # (book, market_id) -> Exposure
+        self.lock = Lock()  # guards the dict only; each entry is guarded by its market's lock
+
+    def _get(self, book, market_id, seed):
+        e = self.markets.get((book, market_id))
+        if e is None:
+            with self.lock:
+                e = self.markets.setdefault((book, market_id), Exposure(seed))
+        return e
+
+    def record(self, book, market_id, moves, paid, seed, fee=0.0):
+        """
+        Account for one trade: moves are (bucket key, shares) pairs, paid its
+        LMSR cost C(q_after) - C(q_before) (negative for sells), fee anything
+        charged on top. Caller holds the market's lock. Returns the action
+        fired, if any.
+        """
+        if _shared_memory():
+            return None
+        e = self._get(book, market_id, seed)
+        for key, dq in moves:
+            e.move(key, dq)
+        e.collected += paid
+        e.fees += fee
+        e.trades += 1
+        return self._check(book, market_id, e)
+
+    def replay(self, book, market_id, key, dq, paid, fee, seed):
+        """
+        Fold in one journaled trade row during startup replay. Limits are
+        re-evaluated (a market that was paused stays paused) but no hooks fire
+        and no action is taken: the restored b already reflects them. Rows
+        after the first of a multi-leg trade carry paid=None.
+        """
+        e = self._get(book, market_id, seed)
+        e.move(key, dq)
+        if paid is not None:
+            e.collected += paid
+            e.fees += fee or 0.0
+            e.trades += 1
+        self._check(book, market_id, e, quiet=True)
+
+    def _check(self, book, market_id, e, quiet=False):
+        if not e.stale and e.worst_case_loss > e.peak_loss:
+            e.peak_loss = e.worst_case_loss
+        pause = PAUSE_AT is not None and not e.paused
+        reduce = REDUCE_B_AT is not None and not e.reduced
+        if not (pause or reduce):
+            return None
+        lowest = min(limit for limit, armed in ((PAUSE_AT, pause), (REDUCE_B_AT, reduce)) if armed)
+        net = e.max_net - e.collected - e.fees
+        if e.stale and net >= lowest * e.seed:
+            e.rescan()
+            net = e.max_net - e.collected - e.fees
+        if pause and net >= PAUSE_AT * e.seed:
+            e.paused = True
+            return None if quiet else self._fire('pause', book, market_id, e)
+        if reduce and net >= REDUCE_B_AT * e.seed:
+            e.reduced = True
+            return None if quiet else self._fire('reduce_b', book, market_id, e)
+        return None
+
+    def _fire(self, event, book, market_id, e):
+        for hook in HOOKS:
+            hook(event, book, market_id, e)
+        return event
+
+    def dump(self, book, market_id):
+        """JSON-able tracker state for the market's AMM snapshot, or None."""
+        e = self.markets.get((book, market_id))
+        if e is None:
+            return None
+        state = {name: getattr(e, name) for name in Exposure.__slots__ if name != 'net'}
+        state['net'] = list(e.net.items())  # keys are floats ('amm') or ints ('book')
+        return state
+
+    def load(self, book, market_id, state):
+        """Restore a dumped tracker (None drops it)."""
+        with self.lock:
+            if state is None:
+                self.markets.pop((book, market_id), None)
+                return
+            e = Exposure(state['seed'])
+            for name, value in state.items():
+                setattr(e, name, dict((k, v) for k, v in value) if name == 'net' else value)
+            self.markets[(book, market_id)] = e
+
+    def net_shares(self, book, market_id, keys):
+        """Traders' net shares for each bucket key (0 where untracked)."""
+        e = self.markets.get((book, market_id))
+        net = {} if e is None else e.net
+        return [net.get(float(k), 0.0) for k in keys]
+
+    def has_positions(self, book, market_id):
+        """Whether traders hold shares in any bucket (per the tracked trades)."""
+        e = self.markets.get((book, market_id))
+        return e is not None and any(abs(v) > 1e-9 for v in e.net.values())
+
+    def forget(self, book, market_id):
+        """Drop a market's tracker (its AMM was replaced)."""
+        with self.lock:
+            self.markets.pop((book, market_id), None)
+
+    def is_paused(self, book, market_id):
+        """Checked under the market's lock, so no trade slips past a pause being set."""
+        e = self.markets.get((book, market_id))
+        return e is not None and e.paused
+
+    def resume(self, book, market_id):
+        """Operator override: lift a pause and re-arm both limits."""
+        e = self.markets.get((book, market_id))
+        if e is not None:
+            e.paused = e.reduced = False
+
+    def report(self, book, market_id):
+        e = self.markets.get((book, market_id))
+        return None if e is None else e.report()
+
+EXPOSURE = ExposureTracker()
@@ -1,61 +1,89 @@
-import math
-from scipy.stats import norm
+import numpy as np
+from scipy.special import ndtr
 
-def lmsr_lognormal_pareto(p, knots, K, delta=0.3):
+def fit_lognormal_pareto(p, x_values):
     """
-    Given LMSR probabilities p and knot values knots (dicts with 'x'), fit log-normal to body and Pareto to tail.
-    Returns dict with: base, low, high scenario probabilities for threshold K (P(V≥K)).
-    Implements correct hybrid CDF per user spec.
+    Fit the hybrid body/tail model once: log-normal to the body (in log10 space)
+    and Pareto to the top-10% tail. p are LMSR probabilities, x_values the knot
+    values. Returns the parameters survival() needs.
     """
-    x = [math.log10(k['x']) for k in knots]
-    cdf = []
-    s = 0.0
-    for pk in p:
-        s += pk
-        cdf.append(s)
-    # Find tau: smallest idx where tail mass < 10%
-    tail_mass = 0.0
-    tau = len(p) - 1
-    for i in reversed(range(len(p))):
-        tail_mass += p[i]
-        if tail_mass > 0.10:
-            tau = i
-            break
-    # Log-normal fit to body (x < x_tau)
-    p_body = p[:tau+1]
-    x_body = x[:tau+1]
-    Z = sum(p_body)
-    mu = sum(pk * xk for pk, xk in zip(p_body, x_body)) / Z
-    mu2 = sum(pk * xk**2 for pk, xk in zip(p_body, x_body)) / Z
-    sigma2 = mu2 - mu**2
-    sigma = math.sqrt(max(sigma2, 1e-8))
+    p = np.asarray(p, dtype=np.float64)
+    x = np.log10(np.asarray(x_values, dtype=np.float64))
+    cdf = np.cumsum(p)
+    # tau: last index whose tail mass p[tau:] exceeds 10%
+    tail = np.cumsum(p[::-1])[::-1]
+    above = np.flatnonzero(tail > 0.10)
+    tau = int(above[-1]) if len(above) else len(p) - 1
+    # Log-normal fit to body (x <= x_tau)
+    p_body, x_body = p[:tau + 1], x[:tau + 1]
+    Z = p_body.sum()
+    mu = float(p_body @ x_body / Z)
+    mu2 = float(p_body @ (x_body * x_body) / Z)
+    sigma = float(np.sqrt(max(mu2 - mu ** 2, 1e-8)))
     # Pareto fit to tail (x >= x_tau)
-    p_tail = p[tau:]
-    x_tail = x[tau:]
-    Z_tail = sum(p_tail)
-    x_tau = x[tau] if len(x) > tau else x[-1]
+    x_tau = float(x[tau])
+    p_tail, x_tail = p[tau:], x[tau:]
+    Z_tail = float(p_tail.sum())
     if Z_tail > 0 and len(x_tail) > 1:
-        denom = sum(pk * (xk - x_tau) for pk, xk in zip(p_tail, x_tail) if xk > x_tau)
+        over = x_tail > x_tau
+        denom = float(p_tail[over] @ (x_tail[over] - x_tau))
         alpha_base = Z_tail / denom if denom > 0 else 2.0
     else:
         alpha_base = 2.0
-    S_tau = 1.0 - cdf[tau]
-    # Normalized log-normal CDF over body
-    def F_LN(xK):
-        if sigma < 1e-8:
-            return 1.0 if xK > mu else 0.0
+    return {'mu': mu, 'sigma': sigma, 'alpha_base': alpha_base, 'tau': x_tau, 'S_tau': float(1.0 - cdf[tau])}
+
+def survival(fit, K, alpha=None):
+    """
+    P(V >= K) under a fit for an array of thresholds K, in one vectorized pass.
+    """
+    alpha = fit['alpha_base'] if alpha is None else alpha
+    mu, sigma, x_tau, S_tau = fit['mu'], fit['sigma'], fit['tau'], fit['S_tau']
+    xK = np.log10(np.asarray(K, dtype=np.float64))
+    if sigma < 1e-8:
+        F = (xK > mu).astype(np.float64)
+    else:
         # CDF of log-normal body, normalized to [0, x_tau]
-        raw = norm.cdf((xK - mu) / sigma)
-        norm_factor = norm.cdf((x_tau - mu) / sigma)
-        return min(max(raw / (norm_factor if norm_factor > 0 else 1.0), 0.0), 1.0)
-    def hybrid_prob(xK, alpha):
-        if xK < x_tau:
-            return 1.0 - F_LN(xK) * (1 - S_tau) + S_tau
-        else:
-            return S_tau * 10 ** (-alpha * (xK - x_tau))
-    xK = math.log10(K)
-    # Scenario probabilities
-    base = hybrid_prob(xK, alpha_base)
-    low = hybrid_prob(xK, alpha_base - delta)
-    high = hybrid_prob(xK, alpha_base + delta)
-    return {'base': base, 'low': low, 'high': high, 'mu': mu, 'sigma': sigma, 'alpha_base': alpha_base, 'tau': x_tau}
+        norm_factor = float(ndtr((x_tau - mu) / sigma))
+        F = np.clip(ndtr((xK - mu) / sigma) / (norm_factor if norm_factor > 0 else 1.0), 0.0, 1.0)
+    body = 1.0 - F * (1 - S_tau) + S_tau
+    # Clipped so the unused branch can't overflow below x_tau
+    tail = S_tau * 10 ** (-alpha * np.maximum(xK - x_tau, 0.0))
+    return np.where(xK < x_tau, body, tail)
+
+def lmsr_lognormal_pareto_batch(p, x_values, K, delta=0.3, fit=None):
+    """
+    Base/low/high scenario survival curves P(V>=K) for a vector of thresholds K
+    (arrays), from a single fit. Pass a cached fit to skip refitting.
+    """
+    fit = fit or fit_lognormal_pareto(p, x_values)
+    alpha = fit['alpha_base']
+    return dict(fit,
+                base=survival(fit, K, alpha),
+                low=survival(fit, K, alpha - delta),
+                high=survival(fit, K, alpha + delta))
+
+def lmsr_lognormal_pareto(p, knots, K, delta=0.3):
+    """
+    Given LMSR probabilities p and knot values knots (dicts with 'x'), fit log-normal to body and Pareto to tail.
+    Returns dict with: base, low, high scenario probabilities for threshold K (P(V≥K)).
+    Implements correct hybrid CDF per user spec.
+    """
+    res = lmsr_lognormal_pareto_batch(p, [k['x'] for k in knots], [K], delta)
+    return {'base': float(res['base'][0]), 'low': float(res['low'][0]), 'high': float(res['high'][0]),
+            'mu': res['mu'], 'sigma': res['sigma'], 'alpha_base': res['alpha_base'], 'tau': res['tau']}
+
+_FITS = {}  # market_id -> (state, version, x, fit)
+
+def cached_fit(state):
+    """
+    (x, fit) for an AMM state, refit only when state.version has moved.
+    """
+    from .lmsr_kernel import lmsr_prices
+    with state.lock:
+        cached = _FITS.get(state.market_id)
+        if cached is not None and cached[0] is state and cached[1] == state.version:
+            return cached[2], cached[3]
+        x, q, b, version = state.snapshot()
+    fit = fit_lognormal_pareto(lmsr_prices(q, b), x)
+    _FITS[state.market_id] = (state, version, x, fit)
+    return x, fit
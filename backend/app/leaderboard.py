@@ -0,0 +1,142 @@
+# Leaderboard maintained incrementally from the wallet TxLog
+# P&L = balance - net funding (faucet credits minus withdrawals). Instead of
+# sorting every user per request, the board tails tx_log by its monotonically
+# increasing id and re-ranks only the users those rows touched, in a sorted
+# list of (-pnl, user_id) keys: top-K is a slice and "my rank" a bisect.
+#
+# Ids from concurrent Postgres transactions can commit out of order, so each
+# sync re-reads the last LOOKBACK ids and skips the ones already applied.
+
+import bisect
+import time
+from threading import Lock
+from sqlalchemy import select
+from .play_wallet import TxLog
+from .models import User
+
+FUNDING_REFS = ('faucet', 'withdraw')
+SYNC_SECONDS = 1.0  # tail tx_log at most this often per process
+LOOKBACK = 1000  # ids re-checked for late commits
+
+class Leaderboard:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = Lock()
+        self.balance = {}  # user_id -> balance (sum of its tx_log rows)
+        self.funding = {}  # user_id -> net deposits
+        self.keys = []  # sorted (-pnl, user_id)
+        self.key = {}  # user_id -> its entry in keys
+        self.names = {}  # user_id -> (username, display_name)
+        self.watermark = None  # highest tx_log id applied
+        self.recent = set()  # applied ids above watermark - LOOKBACK
+        self.synced_at = 0.0
+
+    def _rerank(self, user_id):
+        old = self.key.get(user_id)
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, old)]
+        new = (-(self.balance.get(user_id, 0.0) - self.funding.get(user_id, 0.0)), user_id)
+        bisect.insort(self.keys, new)
+        self.key[user_id] = new
+
+    def _apply(self, rows):
+        """Fold tx_log rows in; returns the users whose P&L moved."""
+        touched = set()
+        floor = self.watermark - LOOKBACK
+        for tx_id, from_id, to_id, amt, ref in rows:
+            if tx_id <= floor or tx_id in self.recent:
+                continue
+            self.recent.add(tx_id)
+            amt = float(amt)
+            funding = ref in FUNDING_REFS
+            if from_id is not None:
+                self.balance[from_id] = self.balance.get(from_id, 0.0) - amt
+                if funding:
+                    self.funding[from_id] = self.funding.get(from_id, 0.0) - amt
+                touched.add(from_id)
+            if to_id is not None:
+                self.balance[to_id] = self.balance.get(to_id, 0.0) + amt
+                if funding:
+                    self.funding[to_id] = self.funding.get(to_id, 0.0) + amt
+                touched.add(to_id)
+            if tx_id > self.watermark:
+                self.watermark = tx_id
+        self.recent = {i for i in self.recent if i > self.watermark - LOOKBACK}
+        return touched
+
+    def sync(self, force=False):
+        """
+        Apply tx_log rows committed since the last sync (throttled to SYNC_SECONDS).
+        The first sync replays the whole log once to build the board.
+        """
+        now = time.monotonic()
+        if not force and now - self.synced_at < SYNC_SECONDS:
+            return
+        with self.lock, self.engine.connect() as conn:
+            self.synced_at = now
+            bootstrap = self.watermark is None
+            query = select(TxLog.id, TxLog.from_id, TxLog.to_id, TxLog.amt, TxLog.ref).order_by(TxLog.id)
+            if bootstrap:
+                self.watermark = 0
+            else:
+                query = query.where(TxLog.id > self.watermark - LOOKBACK)
+            touched = self._apply(conn.execute(query))
+            if bootstrap:
+                self.keys = sorted((-(self.balance[u] - self.funding.get(u, 0.0)), u) for u in self.balance)
+                self.key = {k[1]: k for k in self.keys}
+            else:
+                for user_id in touched:
+                    self._rerank(user_id)
+
+    def _entry(self, rank, key):
+        user_id = key[1]
+        username, display_name = self.names.get(user_id, (None, None))
+        return {
+            'rank': rank,
+            'user_id': user_id,
+            'username': username,
+            'display_name': display_name,
+            'balance': self.balance.get(user_id, 0.0),
+            'pnl': -key[0],
+        }
+
+    def _fill_names(self, user_ids):
+        missing = [u for u in user_ids if u not in self.names]
+        ids = [int(u) for u in missing if u.isdigit()]
+        if ids:
+            with self.engine.connect() as conn:
+                for uid, username, display_name in conn.execute(
+                        select(User.id, User.username, User.display_name).where(User.id.in_(ids))):
+                    self.names[str(uid)] = (username, display_name)
+        for u in missing:
+            self.names.setdefault(u, (u, None))
+
+    def top(self, limit=50, offset=0):
+        """Ranks offset+1 .. offset+limit, best P&L first."""
+        self.sync()
+        with self.lock:
+            keys = self.keys[offset:offset + limit]
+        self._fill_names([k[1] for k in keys])
+        return [self._entry(offset + i + 1, k) for i, k in enumerate(keys)]
+
+    def rank(self, user_id):
+        """The user's entry (1-based rank, P&L) and the board size, or None."""
+        self.sync()
+        with self.lock:
+            key = self.key.get(user_id)
+            if key is None:
+                return None
+            rank = bisect.bisect_left(self.keys, key) + 1
+            total = len(self.keys)
+        self._fill_names([user_id])
+        return dict(self._entry(rank, key), total=total)
+
+_BOARDS = {}
+_BOARDS_LOCK = Lock()
+
+def get_leaderboard(engine):
+    with _BOARDS_LOCK:
+        board = _BOARDS.get(engine)
+        if board is None:
+            board = _BOARDS[engine] = Leaderboard(engine)
+        return board
@@ -0,0 +1,239 @@
+# Wallet ledger engine: group commit for balance changes
+# Callers queue an op and block until it is durable. Whoever finds no commit
+# in flight becomes the leader and commits everything queued so far in one
+# transaction: one locking SELECT for all touched balances (in user_id order,
+# so concurrent leaders in other workers can't deadlock), one executemany
+# UPDATE / INSERT for balances and one bulk INSERT of TxLog rows. Ops queued
+# while a commit runs form the next batch, so under load each commit covers
+# many trades while an idle ledger commits a single op immediately.
+#
+# Balances are cached in memory: the last committed value per user plus the
+# net of queued ops. Debits are checked and reserved against that at submit
+# time, so reads and overdraft rejections never touch the database. With
+# wait=False an op is write-behind: a background drain commits it and flush()
+# is the durability barrier; a write-behind op that fails is logged, and its
+# reserved delta is released like any failed op's. Cached balances are re-read
+# after BALANCE_CACHE_TTL seconds, so a worker picks up changes other workers
+# made to the shared balances table; the database check in _commit stays
+# authoritative meanwhile. 0 never re-reads (only safe with a single worker).
+
+import os
+import time
+from decimal import Decimal, ROUND_DOWN
+from threading import Condition, Lock, Thread
+from sqlalchemy import select, insert, update, bindparam
+from datetime import datetime
+from .play_wallet import Balance, TxLog
+
+MAX_BATCH = 256  # ops per transaction
+CENT = Decimal('0.000001')
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "5"))  # seconds; 0 = never re-read
+ZERO = Decimal('0')
+
+class InsufficientBalance(Exception):
+    pass
+
+class _Op:
+    __slots__ = ('from_id', 'to_id', 'amt', 'ref', 'done', 'result', 'error', 'behind')
+
+    def __init__(self, from_id, to_id, amt, ref):
+        self.from_id = from_id
+        self.to_id = to_id
+        self.amt = Decimal(amt)
+        self.ref = ref
+        self.done = False
+        self.result = None
+        self.error = None
+        self.behind = False  # write-behind: no caller waits to see the outcome
+
+    def users(self):
+        return [u for u in (self.from_id, self.to_id) if u is not None]
+
+    def deltas(self):
+        if self.from_id is not None:
+            yield self.from_id, -self.amt
+        if self.to_id is not None:
+            yield self.to_id, self.amt
+
+class Ledger:
+    def __init__(self, engine):
+        self.engine = engine
+        self.cond = Condition()
+        self.queue = []
+        self.leading = False
+        self.committed = {}  # user_id -> (balance, loaded_at) as last committed
+        self.pending = {}  # user_id -> net change of queued, uncommitted ops
+
+    def credit(self, user_id, amt, ref, wait=True):
+        """Add amt to user_id's balance; returns the new balance."""
+        return self.submit(_Op(None, user_id, amt, ref), wait)
+
+    def debit(self, user_id, amt, ref, wait=True):
+        """Take amt from user_id; raises InsufficientBalance. Returns the new balance."""
+        return self.submit(_Op(user_id, None, amt, ref), wait)
+
+    def transfer(self, from_id, to_id, amt, ref, wait=True):
+        """Move amt atomically (one TxLog row); returns the payer's new balance."""
+        return self.submit(_Op(from_id, to_id, amt, ref), wait)
+
+    # --- balance cache ---
+    def balance(self, user_id):
+        """Available balance: committed plus queued ops, served from memory."""
+        self._load([user_id])
+        with self.cond:
+            return self._available(user_id)
+
+    def _available(self, user_id):
+        return self.committed[user_id][0] + self.pending.get(user_id, ZERO)
+
+    def _load(self, users):
+        now = time.monotonic()
+        with self.cond:
+            missing = [u for u in users if u not in self.committed
+                       or (BALANCE_CACHE_TTL and now - self.committed[u][1] > BALANCE_CACHE_TTL)]
+        if not missing:
+            return
+        with self.engine.connect() as conn:
+            rows = dict(conn.execute(select(Balance.user_id, Balance.balance)
+                                     .where(Balance.user_id.in_(missing))).all())
+        with self.cond:
+            for u in missing:
+                # A commit that finished meanwhile already stored a newer value
+                if u not in self.committed or self.committed[u][1] < now:
+                    self.committed[u] = (Decimal(rows[u]) if u in rows else ZERO, now)
+
+    def _settle(self, balances):
+        # Caller holds self.cond. After a rollback balances is empty and the
+        # cached committed values are still the database's.
+        now = time.monotonic()
+        for u, bal in balances.items():
+            self.committed[u] = (bal, now)
+
+    # --- write path ---
+    def submit(self, op, wait=True):
+        self._load(op.users())
+        with self.cond:
+            if op.from_id is not None and self._available(op.from_id) < op.amt:
+                raise InsufficientBalance('Insufficient balance')
+            for u, d in op.deltas():
+                self.pending[u] = self.pending.get(u, ZERO) + d
+            self.queue.append(op)
+            if not wait:
+                op.behind = True
+                if not self.leading:
+                    self.leading = True
+                    Thread(target=self._drain, daemon=True).start()
+                return self._available(op.from_id if op.from_id is not None else op.to_id)
+            while not op.done and self.leading:
+                self.cond.wait()
+            lead = not op.done
+            if lead:
+                self.leading = True
+        if lead:
+            self._drain(until=op)
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def _drain(self, until=None):
+        """Commit queued batches as the leader: until `until` is done, or the queue is empty."""
+        try:
+            while until is None or not until.done:
+                with self.cond:
+                    batch = self.queue[:MAX_BATCH]
+                    del self.queue[:len(batch)]
+                if not batch:
+                    break
+                self._commit(batch)
+        finally:
+            with self.cond:
+                if self.queue:
+                    # Ops queued during the last commit still need a leader
+                    Thread(target=self._drain, daemon=True).start()
+                else:
+                    self.leading = False
+                self.cond.notify_all()
+
+    def flush(self):
+        """Block until every queued op (including write-behind ones) is committed."""
+        with self.cond:
+            while self.queue or self.leading:
+                if not self.leading:
+                    self.leading = True
+                    Thread(target=self._drain, daemon=True).start()
+                self.cond.wait()
+
+    def _commit(self, batch):
+        users = sorted({u for op in batch for u in op.users()})
+        try:
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(Balance.user_id, Balance.balance).where(Balance.user_id.in_(users))
+                    .order_by(Balance.user_id).with_for_update()
+                ).all()
+                balances = {r.user_id: Decimal(r.balance) for r in rows}
+                existing = set(balances)
+                changed = set()
+                results = []
+                tx_rows = []
+                now = datetime.utcnow()
+                for op in batch:
+                    if op.from_id is not None and balances.get(op.from_id, Decimal('0')) < op.amt:
+                        results.append((None, InsufficientBalance('Insufficient balance')))
+                        continue
+                    if op.from_id is not None:
+                        balances[op.from_id] = (balances[op.from_id] - op.amt).quantize(CENT, rounding=ROUND_DOWN)
+                        changed.add(op.from_id)
+                    if op.to_id is not None:
+                        balances[op.to_id] = (balances.get(op.to_id, Decimal('0')) + op.amt).quantize(CENT, rounding=ROUND_DOWN)
+                        changed.add(op.to_id)
+                    results.append((balances[op.from_id if op.from_id is not None else op.to_id], None))
+                    tx_rows.append({'ts': now, 'from_id': op.from_id, 'to_id': op.to_id, 'amt': op.amt, 'ref': op.ref})
+                updates = [{'uid': u, 'bal': balances[u]} for u in sorted(changed & existing)]
+                inserts = [{'user_id': u, 'balance': balances[u]} for u in sorted(changed - existing)]
+                if updates:
+                    conn.execute(update(Balance).where(Balance.user_id == bindparam('uid'))
+                                 .values(balance=bindparam('bal')), updates)
+                if inserts:
+                    conn.execute(insert(Balance), inserts)
+                if tx_rows:
+                    conn.execute(insert(TxLog), tx_rows)
+        except Exception as e:
+            results = [(None, e)] * len(batch)
+            balances = {}
+        # Only publish outcomes once the transaction is durable (or failed):
+        # queued deltas leave `pending`, committed values replace the cache
+        with self.cond:
+            net = {}
+            for op in batch:
+                for u, d in op.deltas():
+                    net[u] = net.get(u, ZERO) + d
+            for u, d in net.items():
+                self.pending[u] -= d
+                if not self.pending[u]:
+                    del self.pending[u]
+            self._settle(balances)
+            for op, (result, error) in zip(batch, results):
+                op.result, op.error, op.done = result, error, True
+                if error is not None and op.behind:
+                    print(f"Warning: write-behind wallet op {op.ref!r} "
+                          f"({op.from_id} -> {op.to_id}, {op.amt}) failed: {error}")
+            self.cond.notify_all()
+
+_LEDGERS = {}
+_LEDGERS_LOCK = Lock()
+
+def get_ledger(engine):
+    """The process-wide ledger for an engine."""
+    with _LEDGERS_LOCK:
+        ledger = _LEDGERS.get(engine)
+        if ledger is None:
+            ledger = _LEDGERS[engine] = Ledger(engine)
+        return ledger
+
+def flush_all():
+    """Durability barrier for every ledger (e.g. on shutdown)."""
+    with _LEDGERS_LOCK:
+        ledgers = list(_LEDGERS.values())
+    for ledger in ledgers:
+        ledger.flush()
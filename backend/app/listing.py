@@ -0,0 +1,62 @@
+# Keyset pagination and NDJSON export for list endpoints (/bets/, /markets/)
+# Pages are ordered by primary key; the cursor is the last id of the previous
+# page, so every page is one index range scan no matter how deep it is.
+# Requests without cursor or limit get the unpaginated list.
+
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+EXPORT_BATCH = 1000  # rows fetched per round trip when streaming
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(query, id_col, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    (rows, next_cursor) for the page after cursor; next_cursor is None on the
+    last page. With neither cursor nor limit every row is returned, so clients
+    that predate pagination keep getting the full list.
+    """
+    if limit is None:
+        if not cursor:
+            return query.order_by(id_col).all(), None
+        limit = DEFAULT_LIMIT
+    limit = max(1, min(limit, MAX_LIMIT))
+    if cursor:
+        query = query.filter(id_col > decode_cursor(cursor))
+    rows = query.order_by(id_col).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].id)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+def ndjson_response(query, id_col, cursor=None):
+    """
+    Stream every row after cursor as one JSON object per line. Rows are
+    fetched EXPORT_BATCH at a time, so memory stays bounded for any size.
+    Pass a column query (not entities) to skip ORM hydration.
+    """
+    if cursor:
+        query = query.filter(id_col > decode_cursor(cursor))
+    rows = query.order_by(id_col).yield_per(EXPORT_BATCH)
+
+    def lines():
+        for row in rows:
+            yield json.dumps(dict(row._mapping), default=_default) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,5 +1,8 @@
+import bisect
+import functools
 import math
 from typing import List, Dict, Any
+from . import lmsr_kernel, priors
 
 # --- Log-decade bucket grid ---
 LOG_BUCKET_PATTERN = [5, 10, 25, 50]
@@ -7,7 +10,7 @@ LOG_BUCKET_BASE = 1e6  # Start at $1M
 LOG_BUCKET_MAX = 1e12  # $1T
 
 
-def make_log_buckets(min_val=5e6, max_val=LOG_BUCKET_MAX):
+def _build_log_buckets(min_val, max_val):
     buckets = []
     val = min_val
     idx = 0
@@ -32,35 +35,90 @@ def make_log_buckets(min_val=5e6, max_val=LOG_BUCKET_MAX):
     return buckets
 
 
-def quote_bucket(val, buckets, max_val=LOG_BUCKET_MAX):
-    last = buckets[-1]
-    while val >= last["high"] and last["high"] < max_val:
-        extended = make_log_buckets(last["high"], last["high"] * 10)
-        buckets.extend(extended)
-        last = buckets[-1]
-    for i, bk in enumerate(buckets):
-        if val >= bk["low"] and val < bk["high"]:
+class LogBucketGrid:
+    """
+    Immutable log-decade grid with sorted low/high edge tuples. Shared freely
+    between threads: extending returns another (memoized) grid.
+    """
+    __slots__ = ("min_val", "max_val", "lows", "highs", "centers")
+
+    def __init__(self, min_val, max_val):
+        buckets = _build_log_buckets(min_val, max_val)
+        self.min_val = min_val
+        self.max_val = max_val
+        self.lows = tuple(bk["low"] for bk in buckets)
+        self.highs = tuple(bk["high"] for bk in buckets)
+        self.centers = tuple(bk["center"] for bk in buckets)
+
+    def __len__(self):
+        return len(self.highs)
+
+    def bucket(self, i):
+        return {"low": self.lows[i], "high": self.highs[i], "center": self.centers[i], "idx": i}
+
+    def buckets(self):
+        return [self.bucket(i) for i in range(len(self))]
+
+    def locate(self, val):
+        """
+        Index of the bucket with low <= val < high, by bisect on the highs
+        (zero-width buckets are skipped). Falls back to the last bucket.
+        """
+        i = bisect.bisect_right(self.highs, val)
+        if i < len(self.highs) and self.lows[i] <= val:
             return i
-    return len(buckets) - 1  # fallback
+        return len(self.highs) - 1
+
+    def extend_to(self, val, max_val=LOG_BUCKET_MAX):
+        """
+        Grid grown a decade at a time until it covers val (capped at max_val).
+        """
+        grid = self
+        while val >= grid.highs[-1] and grid.highs[-1] < max_val:
+            grid = log_bucket_grid(grid.min_val, grid.highs[-1] * 10)
+        return grid
+
+
+@functools.lru_cache(maxsize=256)
+def log_bucket_grid(min_val=5e6, max_val=LOG_BUCKET_MAX):
+    return LogBucketGrid(min_val, max_val)
+
+
+def _as_grid(buckets):
+    if isinstance(buckets, LogBucketGrid):
+        return buckets
+    # A list from make_log_buckets: the same edges as the grid it spans
+    return log_bucket_grid(buckets[0]["low"], buckets[-1]["high"])
+
+
+def make_log_buckets(min_val=5e6, max_val=LOG_BUCKET_MAX):
+    return log_bucket_grid(min_val, max_val).buckets()
+
+
+def locate_bucket(val, buckets, max_val=LOG_BUCKET_MAX):
+    """
+    (grid, idx) for val: the grid lazily extended to cover val, and the bucket index in it.
+    """
+    grid = _as_grid(buckets).extend_to(val, max_val)
+    return grid, grid.locate(val)
+
+
+def quote_bucket(val, buckets, max_val=LOG_BUCKET_MAX):
+    # buckets is no longer extended in place; use locate_bucket for the grown grid
+    return locate_bucket(val, buckets, max_val)[1]
 
 
 def prior_lognormal(buckets, median=40_000_000, sigma=0.5):
-    vals = [math.exp(-0.5 * (math.log(bk["center"] / median) / sigma) ** 2) for bk in buckets]
-    total = sum(vals)
-    return [v / total for v in vals]
+    centers = buckets.centers if isinstance(buckets, LogBucketGrid) else [bk["center"] for bk in buckets]
+    return priors.lognormal_prior(centers, median, sigma).tolist()
 
 
 def lmsr_cost(q: List[float], b: float) -> float:
-    max_q = max(q)
-    sum_exp = sum(math.exp((qk - max_q) / b) for qk in q)
-    return b * (math.log(sum_exp) + max_q / b)
+    return float(lmsr_kernel.lmsr_cost(q, b))
 
 
 def lmsr_prices(q: List[float], b: float) -> List[float]:
-    max_q = max(q)
-    exp_q = [math.exp((qk - max_q) / b) for qk in q]
-    sum_exp = sum(exp_q)
-    return [e / sum_exp for e in exp_q]
+    return lmsr_kernel.lmsr_prices(q, b).tolist()
 
 
 def lmsr_trade(q: List[float], delta: List[float], b: float) -> Dict[str, Any]:
@@ -77,17 +135,17 @@ def bayesian_evidence_trade(p: List[float], p_yes: List[float], p_no: List[float
     return [b * math.log((p_prime[i] + 1e-12) / (p[i] + 1e-12)) for i in range(len(p))]
 
 
-def quote_api(val: float, q: List[float], b: float, buckets: List[Dict[str, Any]]):
-    idx = quote_bucket(val, buckets)
+def quote_api(val: float, q: List[float], b: float, buckets):
+    grid, idx = locate_bucket(val, buckets)
     prices = lmsr_prices(q, b)
     pk = prices[idx]
     # Adjacent buckets
     low_idx = max(0, idx - 1)
-    high_idx = min(len(buckets) - 1, idx + 1)
+    high_idx = min(len(grid) - 1, idx + 1)
     payout_low = prices[low_idx]
     payout_high = prices[high_idx]
     return {
-        "bucket": buckets[idx],
+        "bucket": grid.bucket(idx),
         "price": pk,
         "payouts": {
             "low": payout_low,
@@ -0,0 +1,149 @@
+# Shared NumPy kernel for LMSR math (cost, prices, batch bid/ask)
+# All pricing code (lmsr.py, lmsr_bid_ask.py, amm_state.py) goes through here.
+import math
+import numpy as np
+
+
+def as_q(q):
+    """Return q as a contiguous float64 array (no copy if it already is one)."""
+    return np.ascontiguousarray(q, dtype=np.float64)
+
+
+def log_partition(q, b):
+    """
+    Stable log-sum-exp split into its two parts.
+    Returns (m, z) with m = max(q) and z = sum(exp((q - m) / b)), so that
+    C(q) = m + b * log(z) and p_k = exp((q_k - m) / b) / z.
+    """
+    q = as_q(q)
+    m = float(q.max())
+    z = float(np.exp((q - m) / b).sum())
+    return m, z
+
+
+def lmsr_cost(q, b):
+    m, z = log_partition(q, b)
+    return m + b * np.log(z)
+
+
+def lmsr_prices(q, b):
+    q = as_q(q)
+    e = np.exp((q - q.max()) / b)
+    return e / e.sum()
+
+
+def cost_and_prices(q, b):
+    """C(q) and the price vector from one exp pass."""
+    q = as_q(q)
+    m = q.max()
+    e = np.exp((q - m) / b)
+    z = e.sum()
+    return float(m + b * np.log(z)), e / z
+
+
+def trade_cost(q, delta, b):
+    """Cost C(q + delta) - C(q) of a (possibly multi-bucket) trade."""
+    q = as_q(q)
+    return lmsr_cost(q + as_q(delta), b) - lmsr_cost(q, b)
+
+
+def bucket_ask(p, b, s):
+    """
+    Cost of buying s shares of buckets with current price p (scalar or array):
+    C(q + s e_k) - C(q) = b * log(1 + p_k (e^{s/b} - 1)), evaluated in log space.
+    """
+    with np.errstate(divide='ignore'):
+        return b * np.logaddexp(np.log1p(-p), np.log(p) + s / b)
+
+
+def bucket_bid(p, b, s):
+    """Proceeds of selling s shares: C(q) - C(q - s e_k)."""
+    with np.errstate(divide='ignore'):
+        return -b * np.logaddexp(np.log1p(-p), np.log(p) - s / b)
+
+
+def lmsr_kernel(q, b, size=1.0):
+    """
+    Single vectorized pass over q.
+    Returns dict with 'cost' (float) and 'prices', 'bid', 'ask' arrays, where
+    ask_k = C(q + size e_k) - C(q) and bid_k = C(q) - C(q - size e_k).
+    """
+    cost, p = cost_and_prices(q, b)
+    return {
+        'cost': cost,
+        'prices': p,
+        'bid': bucket_bid(p, b, size),
+        'ask': bucket_ask(p, b, size),
+    }
+
+
+class PartitionCache:
+    """
+    Running max-shifted partition sum for one market: z = sum(exp((q - m) / b)).
+    Moving one bucket by s shares updates z in O(1); quotes for that bucket
+    come from p_k and the closed forms above. Rebases (O(N) rebuild from q)
+    every REBASE_EVERY updates, or sooner if a term would overflow or z
+    shrinks enough to lose precision, so floating-point drift stays bounded.
+    """
+    __slots__ = ('b', 'm', 'z', 'updates')
+
+    REBASE_EVERY = 256
+    MAX_EXPONENT = 600.0  # exp(600) is far below float64 overflow
+    MIN_SHRINK = 1e-6  # rebase when z drops below this fraction in one step
+    EXACT_REST = 1e-3  # logit() sums the other buckets below this share of z
+
+    def __init__(self, q, b):
+        self.rebase(q, b)
+
+    def rebase(self, q, b):
+        self.b = b
+        self.m, self.z = log_partition(q, b)
+        self.updates = 0
+
+    def price(self, qk):
+        """Marginal price p_k of a bucket currently holding qk shares."""
+        return math.exp((qk - self.m) / self.b) / self.z
+
+    def logit(self, q, k):
+        """
+        log(p_k / (1 - p_k)) for bucket k of q. O(1) from z while the other
+        buckets hold at least EXACT_REST of it; nearer p_k = 1, z - e_k loses
+        its digits to cancellation, so their mass is summed directly (O(N)).
+        None for a single-bucket market.
+        """
+        qk = q[k]
+        ek = math.exp((qk - self.m) / self.b)
+        rest = self.z - ek
+        if rest > self.z * self.EXACT_REST:
+            return (qk - self.m) / self.b - math.log(rest)
+        others = np.delete(as_q(q), k)
+        if not len(others):
+            return None
+        m, z = log_partition(others, self.b)
+        return (qk - m) / self.b - math.log(z)
+
+    def cost(self):
+        return self.m + self.b * math.log(self.z)
+
+    def ask(self, qk, s):
+        # b*log(1 + p(e^{s/b} - 1)) rewritten so nothing overflows for large s
+        p = self.price(qk)
+        return s + self.b * math.log1p((1.0 - p) * math.expm1(-s / self.b))
+
+    def bid(self, qk, s):
+        p = self.price(qk)
+        return -self.b * math.log1p(p * math.expm1(-s / self.b))
+
+    def apply(self, qk_old, qk_new):
+        """
+        Account for one bucket moving from qk_old to qk_new shares.
+        Returns False when the caller must rebase() from the full q vector.
+        """
+        b = self.b
+        exponent = (qk_new - self.m) / b
+        self.updates += 1
+        if exponent > self.MAX_EXPONENT or self.updates >= self.REBASE_EVERY:
+            return False
+        z_old = self.z
+        self.z = z_old + math.exp(exponent) - math.exp((qk_old - self.m) / b)
+        return self.z > z_old * self.MIN_SHRINK
@@ -25,6 +25,13 @@ if str(engine.url).startswith('sqlite'):
     except Exception as e:
         print(f"Warning: drop_all failed: {e}")
 models.Base.metadata.create_all(bind=engine)
+# Bring tables created by earlier versions up to the current models
+from .migrations import upgrade
+upgrade(engine)
+
+# Restore AMM state (snapshots + trade log) and journal further changes
+from . import amm_store
+amm_store.attach(engine)
 
 # Seed a sample market if none exist
 from .db import SessionLocal
@@ -52,6 +59,12 @@ def seed_sample_data():
 
 seed_sample_data()
 
+@app.on_event("shutdown")
+def flush_ledgers():
+    # Write-behind wallet ops must be durable before the worker exits
+    from .ledger import flush_all
+    flush_all()
+
 app.include_router(router)
 
 # Global OPTIONS handler for CORS preflight
@@ -0,0 +1,81 @@
+# Incremental per-market stats (liquidity, distinct traders, last trade)
+# record_bet() runs in the same session transaction as the Bet insert, so the
+# aggregate commits (or rolls back) together with the bet. Counters are bumped
+# with UPDATE ... SET x = x + :d, so concurrent trades never lose an update.
+
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import Bet, MarketStats, MarketTrader
+
+def record_bet(db, bet):
+    """
+    Fold one new bet into its market's stats. Caller commits.
+    """
+    db.flush()  # the bet insert opens the transaction the savepoint nests in
+    new_trader = False
+    if db.get(MarketTrader, (bet.market_id, bet.user_id)) is None:
+        try:
+            with db.begin_nested():
+                db.add(MarketTrader(market_id=bet.market_id, user_id=bet.user_id, first_trade_at=bet.placed_at))
+            new_trader = True
+        except IntegrityError:
+            pass  # a concurrent first trade by the same user got there first
+    if not _bump(db, bet, new_trader):
+        # First bet of a market without a stats row: build it from the bets table
+        try:
+            with db.begin_nested():
+                rebuild_stats(db, bet.market_id)
+        except IntegrityError:
+            # A concurrent first bet created the row; it can't see this bet, so count it here
+            _bump(db, bet, new_trader)
+
+def _bump(db, bet, new_trader):
+    """Add one bet to the market's stats row; False if the market has none yet."""
+    return db.query(MarketStats).filter(MarketStats.market_id == bet.market_id).update({
+        MarketStats.liquidity: MarketStats.liquidity + bet.amount,
+        MarketStats.traders: MarketStats.traders + (1 if new_trader else 0),
+        MarketStats.bets: MarketStats.bets + 1,
+        MarketStats.last_trade_at: case((MarketStats.last_trade_at > bet.placed_at, MarketStats.last_trade_at),
+                                        else_=bet.placed_at),
+    }, synchronize_session=False) > 0
+
+def rebuild_stats(db, market_id):
+    """
+    Recompute a market's stats (and trader set) from its bets with aggregate
+    queries. Used to backfill markets that predate the stats tables.
+    """
+    liquidity, bets, last_trade_at = db.query(
+        func.coalesce(func.sum(Bet.amount), 0.0), func.count(Bet.id), func.max(Bet.placed_at)
+    ).filter(Bet.market_id == market_id).one()
+    traders = {user_id for (user_id,) in db.query(Bet.user_id).filter(
+        Bet.market_id == market_id, Bet.user_id.isnot(None)).distinct()}
+    known = {user_id for (user_id,) in db.query(MarketTrader.user_id).filter(MarketTrader.market_id == market_id)}
+    db.add_all([MarketTrader(market_id=market_id, user_id=user_id) for user_id in traders - known])
+    stats = db.get(MarketStats, market_id)
+    if stats is None:
+        stats = MarketStats(market_id=market_id)
+        db.add(stats)
+    stats.liquidity = float(liquidity)
+    stats.traders = len(traders)
+    stats.bets = bets
+    stats.last_trade_at = last_trade_at
+    return stats
+
+def get_stats(db, market_id):
+    """
+    O(1) stats lookup; markets from before the stats tables are backfilled once.
+    """
+    stats = db.get(MarketStats, market_id)
+    if stats is None:
+        # Own session, so the caller's pending changes aren't committed with it
+        with Session(bind=db.get_bind()) as backfill:
+            stats = rebuild_stats(backfill, market_id)
+            backfill.commit()
+            backfill.refresh(stats)
+    return {
+        'liquidity': stats.liquidity,
+        'traders': stats.traders,
+        'bets': stats.bets,
+        'last_trade_at': stats.last_trade_at,
+    }
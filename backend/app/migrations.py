@@ -0,0 +1,87 @@
+# In-place schema upgrades for databases created before the current models
+# create_all() only adds missing tables; this brings existing ones up to date.
+# Every step checks the live schema first, so upgrade() is safe to run on
+# every start (main.py does) and against a database that is already current:
+# - tx_log: uuid string ids become an integer autoincrement key. Rows are
+#   copied in ts order, so ids follow the original order of the log.
+# - nullable columns added to existing tables (amm_trade_log.paid / fee /
+#   order_id, amm_snapshots.exposure / orders) are added with ALTER TABLE.
+# - indexes declared on existing tables (the bets indexes) are created.
+# - SQLite: amm_trade_log is rebuilt with AUTOINCREMENT, ids preserved.
+# market_stats / market_traders come from create_all and are backfilled
+# per market on first read (app/market_stats.py).
+
+from sqlalchemy import inspect, text, Integer
+from .models import Base
+
+def _copy_table(conn, table, columns, order_by):
+    """Recreate table from the models and copy columns over from the old one."""
+    old = f"{table.name}_old"
+    pk = inspect(conn).get_pk_constraint(table.name).get('name')
+    conn.execute(text(f'ALTER TABLE {table.name} RENAME TO {old}'))
+    if pk and conn.dialect.name == 'postgresql':
+        # Renaming the table keeps its primary key's name (and index), which the new table needs
+        conn.execute(text(f'ALTER TABLE {old} RENAME CONSTRAINT {pk} TO {old}_pkey'))
+    for index in table.indexes:
+        # Index names are global on Postgres / SQLite; the renamed table still holds them
+        conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    table.create(conn)
+    names = ', '.join(columns)
+    conn.execute(text(f'INSERT INTO {table.name} ({names}) SELECT {names} FROM {old} ORDER BY {order_by}'))
+    conn.execute(text(f'DROP TABLE {old}'))
+
+def _upgrade_tx_log(conn, inspector):
+    table = Base.metadata.tables.get('tx_log')
+    if table is None or not inspector.has_table('tx_log'):
+        return
+    id_type = next(c['type'] for c in inspector.get_columns('tx_log') if c['name'] == 'id')
+    if isinstance(id_type, Integer):
+        return
+    print("Migrating tx_log to integer ids")
+    _copy_table(conn, table, ['ts', 'from_id', 'to_id', 'amt', 'ref'], 'ts')
+
+def _upgrade_trade_log_autoincrement(conn, inspector):
+    if conn.dialect.name != 'sqlite' or not inspector.has_table('amm_trade_log'):
+        return
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'amm_trade_log'")).scalar()
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    print("Migrating amm_trade_log to AUTOINCREMENT ids")
+    table = Base.metadata.tables['amm_trade_log']
+    existing = {c['name'] for c in inspector.get_columns('amm_trade_log')}
+    _copy_table(conn, table, [c.name for c in table.columns if c.name in existing], 'id')
+
+def _add_columns(conn, inspector):
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            print(f"Adding column {table.name}.{column.name}")
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def _add_indexes(conn, inspector):
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                print(f"Creating index {index.name}")
+                index.create(conn)
+
+def upgrade(engine):
+    """Bring an existing database's tables up to the current models. Run after create_all()."""
+    with engine.begin() as conn:
+        _upgrade_tx_log(conn, inspect(conn))
+        _upgrade_trade_log_autoincrement(conn, inspect(conn))
+        _add_columns(conn, inspect(conn))
+        _add_indexes(conn, inspect(conn))
+
+if __name__ == "__main__":
+    from .db import engine
+    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Enum, Boolean, Index
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 import datetime
@@ -12,6 +12,13 @@ except ImportError:
     Balance = None
     TxLog = None
 
+# Import AMM persistence models for Base metadata registration
+try:
+    from .amm_store import AMMSnapshot, AMMTradeLog
+except ImportError:
+    AMMSnapshot = None
+    AMMTradeLog = None
+
 class User(Base):
     __tablename__ = "users"
 
@@ -53,3 +60,30 @@ class Bet(Base):
     placed_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship('User', back_populates='bets')
     market = relationship('Market', back_populates='bets')
+    __table_args__ = (
+        # Per-market aggregates / distinct traders without touching other markets
+        Index('ix_bets_market_user', 'market_id', 'user_id'),
+        # Filtered keyset pages (/bets/?market_id= or ?user_id=, ordered by id)
+        Index('ix_bets_market_id', 'market_id', 'id'),
+        Index('ix_bets_user_id', 'user_id', 'id'),
+    )
+
+class MarketStats(Base):
+    """
+    Per-market aggregates, updated incrementally with every bet (see app/market_stats.py).
+    """
+    __tablename__ = 'market_stats'
+    market_id = Column(Integer, ForeignKey('markets.id'), primary_key=True)
+    liquidity = Column(Float, nullable=False, default=0.0)  # sum of Bet.amount
+    traders = Column(Integer, nullable=False, default=0)  # distinct Bet.user_id
+    bets = Column(Integer, nullable=False, default=0)
+    last_trade_at = Column(DateTime, nullable=True)
+
+class MarketTrader(Base):
+    """
+    (market, user) pairs that have traded; a new row means a new distinct trader.
+    """
+    __tablename__ = 'market_traders'
+    market_id = Column(Integer, ForeignKey('markets.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    first_trade_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,192 @@
+# Resting limit orders for the AMM-CLOB hybrid (see amm_orders.place_order)
+# Per bucket and side: a heap of distinct prices plus a FIFO queue per price
+# level, so best bid/offer is O(1) (amortized, with lazy removal) and matching
+# is price-time priority.
+
+import heapq
+from collections import deque, OrderedDict
+from threading import Lock
+
+FILL_EPS = 1e-9  # remaining size below this counts as fully filled
+DONE_HISTORY = 1000  # filled / cancelled orders kept per market for lookups
+
+class RestingOrder:
+    __slots__ = ('id', 'bucket_idx', 'side', 'price', 'size', 'remaining', 'filled', 'paid', 'status')
+
+    def __init__(self, order_id, bucket_idx, side, price, size):
+        self.id = order_id
+        self.bucket_idx = bucket_idx
+        self.side = side
+        self.price = price
+        self.size = size
+        self.remaining = size
+        self.filled = 0.0
+        self.paid = 0.0
+        self.status = 'resting'
+
+    def fill(self, qty, cost):
+        self.filled += qty
+        self.paid += cost
+        self.remaining -= qty
+        if self.remaining <= FILL_EPS:
+            self.remaining = 0.0
+            self.status = 'filled'
+
+    def to_dict(self):
+        return {
+            'order_id': self.id,
+            'bucket_idx': self.bucket_idx,
+            'side': self.side,
+            'limit_price': self.price,
+            'size': self.size,
+            'filled': self.filled,
+            'avg_price': self.paid / self.filled if self.filled else 0.0,
+            'remaining': self.remaining,
+            'status': self.status,
+        }
+
+class BookSide:
+    """
+    One side (bids or asks) of one bucket.
+    """
+    def __init__(self, side):
+        self.side = side
+        self._sign = -1.0 if side == 'buy' else 1.0  # heapq is a min-heap
+        self._heap = []
+        self._levels = {}  # price -> deque of orders
+        self._qty = {}  # price -> resting quantity at that level
+
+    def add(self, order):
+        level = self._levels.get(order.price)
+        if level is None:
+            level = self._levels[order.price] = deque()
+            self._qty[order.price] = 0.0
+            heapq.heappush(self._heap, self._sign * order.price)
+        level.append(order)
+        self._qty[order.price] += order.remaining
+
+    def best(self):
+        """
+        Best live price level, or None. Drops filled/cancelled orders lazily.
+        """
+        heap = self._heap
+        while heap:
+            price = self._sign * heap[0]
+            level = self._levels[price]
+            while level and level[0].remaining <= 0:
+                level.popleft()
+            if level:
+                return price
+            heapq.heappop(heap)
+            del self._levels[price]
+            del self._qty[price]
+        return None
+
+    def head(self):
+        """Oldest order at the best price (call best() first)."""
+        return self._levels[self.best()][0]
+
+    def best_size(self):
+        price = self.best()
+        return self._qty[price] if price is not None else 0.0
+
+    def reduce(self, order, qty):
+        self._qty[order.price] = max(0.0, self._qty[order.price] - qty)
+
+    def __bool__(self):
+        return self.best() is not None
+
+class MarketBook:
+    """
+    All resting orders for one market, indexed by bucket, side and id.
+    """
+    _next_id = 1  # order ids are unique across markets
+    _id_lock = Lock()
+
+    def __init__(self):
+        self.sides = {}  # (bucket_idx, side) -> BookSide
+        self.orders = {}  # order_id -> RestingOrder, live orders only
+        self.done = OrderedDict()  # the last DONE_HISTORY filled / cancelled orders
+        self.active = set()  # buckets that may hold resting orders
+
+    def side(self, bucket_idx, side):
+        book_side = self.sides.get((bucket_idx, side))
+        if book_side is None:
+            book_side = self.sides[(bucket_idx, side)] = BookSide(side)
+        return book_side
+
+    @classmethod
+    def next_id(cls):
+        with cls._id_lock:
+            order_id = cls._next_id
+            cls._next_id += 1
+            return order_id
+
+    @classmethod
+    def reserve_ids(cls, upto):
+        """Never hand out ids up to upto again (restored orders)."""
+        with cls._id_lock:
+            cls._next_id = max(cls._next_id, upto + 1)
+
+    def rest(self, bucket_idx, side, price, size, order_id=None):
+        order = RestingOrder(order_id or self.next_id(), bucket_idx, side, price, size)
+        self._add(order)
+        return order
+
+    def _add(self, order):
+        self.orders[order.id] = order
+        self.side(order.bucket_idx, order.side).add(order)
+        self.active.add(order.bucket_idx)
+
+    def dump(self):
+        """JSON-able live orders, in arrival order, for the market's snapshot."""
+        return {
+            'next_id': MarketBook._next_id,
+            'orders': [[o.id, o.bucket_idx, o.side, o.price, o.size, o.remaining, o.filled, o.paid]
+                       for o in self.orders.values()],
+        }
+
+    def load(self, state):
+        """Re-rest dumped orders (same ids and time priority)."""
+        MarketBook.reserve_ids(state['next_id'] - 1)
+        for order_id, bucket_idx, side, price, size, remaining, filled, paid in state['orders']:
+            order = RestingOrder(order_id, bucket_idx, side, price, size)
+            order.remaining, order.filled, order.paid = remaining, filled, paid
+            self._add(order)
+
+    def fill(self, order, qty, cost):
+        self.side(order.bucket_idx, order.side).reduce(order, qty)
+        order.fill(qty, cost)
+        if order.status == 'filled':
+            self._retire(order)
+
+    def cancel(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            return self.done.get(order_id)
+        self.side(order.bucket_idx, order.side).reduce(order, order.remaining)
+        order.remaining = 0.0
+        order.status = 'cancelled'
+        self._retire(order)
+        return order
+
+    def _retire(self, order):
+        # The order's queue entry is dropped lazily by BookSide.best()
+        del self.orders[order.id]
+        self.done[order.id] = order
+        if len(self.done) > DONE_HISTORY:
+            self.done.popitem(last=False)
+
+    def get(self, order_id):
+        return self.orders.get(order_id) or self.done.get(order_id)
+
+    def bbo(self, bucket_idx):
+        bids = self.side(bucket_idx, 'buy')
+        asks = self.side(bucket_idx, 'sell')
+        return {
+            'bucket_idx': bucket_idx,
+            'bid': bids.best(),
+            'bid_size': bids.best_size(),
+            'ask': asks.best(),
+            'ask_size': asks.best_size(),
+        }
@@ -1,10 +1,9 @@
-from decimal import Decimal, ROUND_DOWN, getcontext
-from sqlalchemy import Column, String, DECIMAL, DateTime, Integer, ForeignKey
+from decimal import Decimal, getcontext
+from sqlalchemy import Column, String, DECIMAL, DateTime, Integer, BigInteger, ForeignKey
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 from datetime import datetime
 from .models import Base
-import uuid
 
 getcontext().prec = 38
 
@@ -19,33 +18,26 @@ class Wallet:
         raise NotImplementedError
 
 class PlayWallet(Wallet):
+    """
+    Balance changes go through the engine's group-committing ledger
+    (app/ledger.py), outside the caller's session transaction. Balances are
+    read from the ledger's in-memory cache.
+    """
+    def _ledger(self, db: Session):
+        from .ledger import get_ledger
+        return get_ledger(db.get_bind())
+
     def get_balance(self, db: Session, user_id: str) -> Decimal:
-        bal = db.query(Balance).filter(Balance.user_id == user_id).first()
-        return bal.balance if bal else Decimal('0.0')
+        return self._ledger(db).balance(user_id)
 
-    def credit(self, db: Session, user_id: str, amt: Decimal, ref: str) -> None:
-        with db.begin():
-            bal = db.query(Balance).filter(Balance.user_id == user_id).with_for_update().first()
-            if not bal:
-                bal = Balance(user_id=user_id, balance=Decimal('0.0'))
-                db.add(bal)
-            bal.balance = (Decimal(bal.balance) + amt).quantize(Decimal('0.000001'), rounding=ROUND_DOWN)
-            tx = TxLog(ts=datetime.utcnow(), from_id=None, to_id=user_id, amt=amt, ref=ref)
-            db.add(tx)
+    def credit(self, db: Session, user_id: str, amt: Decimal, ref: str, wait: bool = True) -> None:
+        self._ledger(db).credit(user_id, amt, ref, wait=wait)
 
-    def debit(self, db: Session, user_id: str, amt: Decimal, ref: str) -> None:
-        with db.begin():
-            bal = db.query(Balance).filter(Balance.user_id == user_id).with_for_update().first()
-            if not bal or Decimal(bal.balance) < amt:
-                raise Exception('Insufficient balance')
-            bal.balance = (Decimal(bal.balance) - amt).quantize(Decimal('0.000001'), rounding=ROUND_DOWN)
-            tx = TxLog(ts=datetime.utcnow(), from_id=user_id, to_id=None, amt=amt, ref=ref)
-            db.add(tx)
+    def debit(self, db: Session, user_id: str, amt: Decimal, ref: str, wait: bool = True) -> None:
+        self._ledger(db).debit(user_id, amt, ref, wait=wait)
 
-    def transfer(self, db: Session, from_id: str, to_id: str, amt: Decimal, ref: str) -> None:
-        with db.begin():
-            self.debit(db, from_id, amt, ref)
-            self.credit(db, to_id, amt, ref)
+    def transfer(self, db: Session, from_id: str, to_id: str, amt: Decimal, ref: str, wait: bool = True) -> None:
+        self._ledger(db).transfer(from_id, to_id, amt, ref, wait=wait)
 
 class Balance(Base):
     __tablename__ = 'balances'
@@ -54,7 +46,8 @@ class Balance(Base):
 
 class TxLog(Base):
     __tablename__ = 'tx_log'
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # Compact, monotonically increasing key: appends stay at the right edge of the index
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
     ts = Column(DateTime, default=datetime.utcnow)
     from_id = Column(String, nullable=True)
     to_id = Column(String, nullable=True)
@@ -0,0 +1,145 @@
+# Server-sent price feed per market (GET /markets/{id}/stream)
+# Trades call publish() from the threadpool; bursts within COALESCE_SECONDS
+# are folded into one frame, computed and serialized once per market and
+# fanned out to every subscriber's queue on the event loop.
+
+import asyncio
+import json
+from threading import Lock
+import numpy as np
+from . import lmsr_kernel
+
+COALESCE_SECONDS = 0.05
+HEARTBEAT_SECONDS = 15.0
+SUBSCRIBER_QUEUE = 64
+PRICE_DECIMALS = 6  # a price counts as changed if its rounded value changed
+
+def _load_amm(market_id):
+    from .amm_state import AMM_STATE
+    state = AMM_STATE.get(market_id)
+    if state is None:
+        return None
+    x, q, b, version = state.snapshot()
+    return x, q, b, version
+
+def _load_book(market_id):
+    from .amm_orders import get_book_snapshot
+    snap = get_book_snapshot(market_id)
+    if snap is None:
+        return None
+    q = np.asarray(snap['q'], dtype=np.float64)
+    return np.arange(len(q), dtype=np.float64), q, snap['b'], None
+
+LOADERS = {'amm': _load_amm, 'book': _load_book}
+
+class _Subscriber:
+    __slots__ = ('queue', 'needs_snapshot')
+
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.needs_snapshot = True
+
+class MarketChannel:
+    """
+    Subscribers and last published state for one (book, market) pair.
+    All methods except publish() run on the event loop.
+    """
+    def __init__(self, book, market_id, loop):
+        self.book = book
+        self.market_id = market_id
+        self.loop = loop
+        self.subscribers = set()
+        self.scheduled = False
+        self.q = None
+        self.p = None
+        self.seq = 0
+
+    def publish(self):
+        # Called from worker threads; at most one flush is pending at a time
+        if not self.subscribers or self.scheduled:
+            return
+        self.scheduled = True
+        self.loop.call_soon_threadsafe(self.loop.call_later, COALESCE_SECONDS, self.flush)
+
+    def _snapshot_frame(self, x, q, b, p, version):
+        return json.dumps({'type': 'snapshot', 'seq': self.seq, 'version': version, 'b': b,
+                           'x': x.tolist(), 'q': q.tolist(), 'p': p.tolist()})
+
+    def flush(self):
+        self.scheduled = False
+        if not self.subscribers:
+            return
+        loaded = LOADERS[self.book](self.market_id)
+        if loaded is None:
+            return
+        x, q, b, version = loaded
+        p = np.round(lmsr_kernel.lmsr_prices(q, b), PRICE_DECIMALS)
+        self.seq += 1
+        snapshot = None
+        delta = None
+        if self.q is None or len(self.q) != len(q):
+            snapshot = self._snapshot_frame(x, q, b, p, version)
+        else:
+            dq = np.flatnonzero(q != self.q)
+            dp = np.flatnonzero(p != self.p)
+            if len(dq) or len(dp):
+                delta = json.dumps({'type': 'delta', 'seq': self.seq, 'version': version, 'b': b, 'n': len(q),
+                                    'q': {int(i): float(q[i]) for i in dq},
+                                    'p': {int(i): float(p[i]) for i in dp}})
+        self.q, self.p = q, p
+        for sub in list(self.subscribers):
+            if sub.needs_snapshot:
+                snapshot = snapshot or self._snapshot_frame(x, q, b, p, version)
+                frame = snapshot
+            elif snapshot is not None or delta is not None:
+                frame = snapshot or delta
+            else:
+                continue
+            try:
+                sub.queue.put_nowait(frame)
+                sub.needs_snapshot = False
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and resync with a snapshot next time
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.needs_snapshot = True
+
+class PriceFeed:
+    def __init__(self):
+        self.channels = {}
+        self.lock = Lock()
+
+    def publish(self, market_id, book='amm'):
+        """
+        Note that a market's prices moved. Cheap no-op without subscribers.
+        """
+        channel = self.channels.get((book, market_id))
+        if channel is not None:
+            channel.publish()
+
+    async def stream(self, market_id, book='amm', is_disconnected=None):
+        """
+        Async generator of SSE lines: a snapshot frame first, then deltas.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            channel = self.channels.get((book, market_id))
+            if channel is None:
+                channel = self.channels[(book, market_id)] = MarketChannel(book, market_id, loop)
+        sub = _Subscriber()
+        channel.subscribers.add(sub)
+        try:
+            channel.flush()
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {frame}\n\n"
+        finally:
+            channel.subscribers.discard(sub)
+
+FEED = PriceFeed()
@@ -0,0 +1,81 @@
+# Vectorized prior builders for seeding AMM markets
+# Every builder takes the knot values x (array, or a 2-D batch of grids with
+# one row per market) and returns normalized probabilities of the same shape,
+# computed in log space so extreme tails don't underflow to q = -inf.
+
+import math
+import numpy as np
+
+P_FLOOR = 1e-12  # no bucket gets zero prior mass (q = b log p must stay finite)
+
+def knot_grid(N, min_val, max_val):
+    """Log-spaced initial knots, as used by get_amm_state."""
+    return np.exp(np.linspace(math.log(min_val), math.log(max_val), N))
+
+def normalize_log(logw):
+    """Softmax along the last axis, floored at P_FLOOR and renormalized."""
+    logw = np.asarray(logw, dtype=np.float64)
+    w = np.exp(logw - logw.max(axis=-1, keepdims=True))
+    p = np.maximum(w / w.sum(axis=-1, keepdims=True), P_FLOOR)
+    return p / p.sum(axis=-1, keepdims=True)
+
+def normalize(p):
+    p = np.maximum(np.asarray(p, dtype=np.float64), 0.0)
+    with np.errstate(divide='ignore'):
+        return normalize_log(np.log(p))
+
+def lognormal_prior(x, median=40_000_000, sigma=0.5):
+    """
+    Log-normal density at each knot. median and sigma may be scalars or, for
+    a batch of grids, arrays with one value per row.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    median = np.asarray(median, dtype=np.float64)[..., None] if np.ndim(median) else median
+    sigma = np.asarray(sigma, dtype=np.float64)[..., None] if np.ndim(sigma) else sigma
+    return normalize_log(-0.5 * (np.log(x / median) / sigma) ** 2)
+
+def comps_prior(x, comps, weights=None, bandwidth=0.5):
+    """
+    Mixture of log-normal kernels centred on comparable valuations (comps),
+    optionally weighted (e.g. by similarity). One broadcast over knots x comps.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    comps = np.asarray(comps, dtype=np.float64)
+    weights = np.ones(len(comps)) if weights is None else np.asarray(weights, dtype=np.float64)
+    z = (np.log(x)[..., None] - np.log(comps)) / bandwidth
+    # log sum_j w_j exp(-z_j^2 / 2), stable in the tails
+    logk = -0.5 * z * z + np.log(weights / weights.sum())
+    m = logk.max(axis=-1, keepdims=True)
+    return normalize_log(m[..., 0] + np.log(np.exp(logk - m).sum(axis=-1)))
+
+def histogram_prior(x, samples, smoothing=1.0):
+    """
+    Empirical prior: observed valuations binned to their nearest knot (in log
+    space), plus `smoothing` pseudo-counts per knot.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    logx = np.log(x)
+    edges = (logx[1:] + logx[:-1]) / 2
+    idx = np.searchsorted(edges, np.log(np.asarray(samples, dtype=np.float64)))
+    counts = np.bincount(idx, minlength=len(x)).astype(np.float64)
+    return normalize(counts + smoothing)
+
+def prior_vector(prior, x, min_val, max_val):
+    """
+    Normalized prior for the knots x from: None (uniform), an array, a
+    vectorized callable prior(x) -> array, or a legacy per-bucket callable
+    prior(i, N, min_val, max_val).
+    """
+    N = len(x)
+    if prior is None:
+        return np.full(N, 1.0 / N)
+    if not callable(prior):
+        return normalize(prior)
+    if getattr(prior, 'vectorized', False):
+        return normalize(prior(x))
+    return normalize([prior(i, N, min_val, max_val) for i in range(N)])
+
+def vectorized(fn):
+    """Mark a callable as prior(x) -> array for get_amm_state / seed_markets."""
+    fn.vectorized = True
+    return fn
@@ -0,0 +1,44 @@
+# Serialized read responses cached per (view, market) at the state version
+# they were built from. Every mutation of an AMMState bumps state.version
+# (under state.lock), so a cached body is valid exactly while the version is
+# unchanged. ETags are a hash of the body, so they stay valid across
+# restarts and across workers that serve the same state.
+
+import hashlib
+import json
+from fastapi import Response
+
+_CACHE = {}  # (view, market_id) -> (state, version, etag, body)
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+def get_or_build(view, state, build):
+    """
+    (etag, body) for the view at the state's current version. build() is
+    called under state.lock and only when the version moved since last time.
+    """
+    key = (view, state.market_id)
+    with state.lock:
+        # Time-based changes (a breaker trip lapsing) bump the version here,
+        # not on some later write
+        state.refresh()
+        cached = _CACHE.get(key)
+        if cached is not None and cached[0] is state and cached[1] == state.version:
+            return cached[2], cached[3]
+        body = json.dumps(build(), allow_nan=False, separators=(',', ':')).encode()
+        etag = _etag(body)
+        version = state.version  # after build(), in case it changed the state
+        # Tied to the state object too: a restored state restarts its version
+        _CACHE[key] = (state, version, etag, body)
+    return etag, body
+
+def cached_response(view, state, build, if_none_match=None):
+    """
+    JSON response for the view, or an empty 304 when the client's ETag matches.
+    """
+    etag, body = get_or_build(view, state, build)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
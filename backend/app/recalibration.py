@@ -0,0 +1,131 @@
+# Prior recalibration: blend each market's q toward b * log(p0_new)
+# q' = (1 - w) q + w b log p0, i.e. prices move to the normalized geometric
+# blend p^(1-w) p0^w. Blends are computed for many markets at once (markets
+# with the same knot count form one matrix) from lock-free snapshots; each
+# market is then locked only to journal and copy in its new q. A market that
+# traded in between is re-blended from its live q while locked (O(N)).
+# Journaled as 'reprice' entries: q moves, but no trader's position does.
+# So the worst-case loss (app/exposure.py) is unchanged; what moves is the
+# market value of the traders' net shares, which the report marks to market.
+
+import numpy as np
+from . import amm_state, priors
+from .exposure import EXPOSURE
+
+DEFAULT_WEIGHT = 0.1
+
+def _logsumexp_rows(Q, B):
+    Z = Q / B[:, None]
+    m = Z.max(axis=1)
+    return B * (m + np.log(np.exp(Z - m[:, None]).sum(axis=1)))
+
+def blend(Q, B, P0, weight=DEFAULT_WEIGHT):
+    """
+    Blended q rows plus cost C(q) and price rows before and after, for
+    stacked markets: Q and P0 are (M, N), B is (M,).
+    """
+    Q = np.asarray(Q, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    Q_new = (1.0 - weight) * Q + weight * B[:, None] * np.log(P0)
+    cost, cost_new = _logsumexp_rows(Q, B), _logsumexp_rows(Q_new, B)
+    return Q_new, {
+        'cost_before': cost,
+        'cost_after': cost_new,
+        'prices_before': np.exp((Q - cost[:, None]) / B[:, None]),
+        'prices_after': np.exp((Q_new - cost_new[:, None]) / B[:, None]),
+    }
+
+def _apply(state, version, q_new, p0, weight):
+    """
+    Journal and install one market's blended q under its lock. Returns
+    (q_old, net): q_old is the live q it was blended from if the market
+    traded since the snapshot (so the batch stats are stale), else None;
+    net the traders' net shares per knot at that moment. False if the knots
+    changed and the blend no longer lines up.
+    """
+    with state.lock:
+        q_old = None
+        if state.version != version:
+            if state.n != len(p0):
+                return False
+            q_old = state.q.copy()
+            q_new = (1.0 - weight) * q_old + weight * state.b * np.log(p0)
+        dq = q_new - state.q
+        due = False
+        if amm_state.JOURNAL is not None:
+            due = amm_state.JOURNAL.append_many('amm', state.market_id, [
+                {'kind': 'reprice', 'x': float(x), 'dq': float(d)} for x, d in zip(state.x, dq)])
+        state.q[:] = q_new
+        state.partition = None
+        state.touch()
+        if due:
+            amm_state.JOURNAL.snapshot_amm(state)
+        return q_old, np.array(EXPOSURE.net_shares('amm', state.market_id, state.x))
+
+def recalibrate(new_priors, weight=DEFAULT_WEIGHT, max_retries=3):
+    """
+    Shift many markets toward new priors. new_priors maps market_id to an
+    array over the market's current knots or a prior accepted by
+    priors.prior_vector (e.g. a @vectorized builder evaluated on the knots).
+    Returns {market_id: report} with the cost C(q) and the market value of
+    the traders' net shares (sum_k net_k p_k, from the exposure tracker)
+    before and after, pnl_impact and the new version. pnl_impact is the
+    AMM's mark-to-market P&L from the repricing, -sum_k net_k dp_k: negative
+    when prices move toward the buckets traders hold. Repricing moves no
+    shares or cost, so the worst-case loss is unchanged. (The tracker is off
+    in shared-memory mode, where positions read as zero.)
+    """
+    report = {}
+    pending = dict(new_priors)
+    for _ in range(max_retries):
+        groups = {}
+        for market_id, prior in pending.items():
+            state = amm_state.AMM_STATE.get(market_id)
+            if state is None:
+                report[market_id] = {'error': 'unknown market'}
+                continue
+            x, q, b, version = state.snapshot()
+            p0 = priors.prior_vector(prior, x, state.min_val, state.max_val)
+            if len(p0) != len(q):
+                report[market_id] = {'error': f'prior has {len(p0)} buckets, market has {len(q)}'}
+                continue
+            groups.setdefault(len(q), []).append((market_id, state, version, q, b, p0))
+        retry = {}
+        for rows in groups.values():
+            Q_new, stats = blend(np.array([r[3] for r in rows]), np.array([r[4] for r in rows]),
+                                 np.array([r[5] for r in rows]), weight)
+            for i, (market_id, state, version, q, b, p0) in enumerate(rows):
+                applied = _apply(state, version, Q_new[i], p0, weight)
+                if applied is False:
+                    retry[market_id] = pending[market_id]
+                    continue
+                q_old, net = applied
+                if q_old is None:
+                    row = {name: values[i] for name, values in stats.items()}
+                else:
+                    # Traded meanwhile: report against the q the blend was applied to
+                    row = _market_stats(q_old, state.b, p0, weight)
+                entry = _report(row, net)
+                entry['version'] = state.version
+                report[market_id] = entry
+        if not retry:
+            break
+        pending = retry
+    for market_id in pending:
+        report.setdefault(market_id, {'error': 'knots kept changing; not recalibrated'})
+    return report
+
+def _market_stats(q, b, p0, weight):
+    _, stats = blend(q[None, :], np.array([b]), p0[None, :], weight)
+    return {name: values[0] for name, values in stats.items()}
+
+def _report(row, net):
+    value_before = float(net @ row['prices_before'])
+    value_after = float(net @ row['prices_after'])
+    return {
+        'cost_before': float(row['cost_before']),
+        'cost_after': float(row['cost_after']),
+        'positions_value_before': value_before,
+        'positions_value_after': value_after,
+        'pnl_impact': value_before - value_after,
+    }
@@ -62,3 +62,12 @@ class BetRead(BetBase):
     placed_at: datetime
     class Config:
         orm_mode = True
+
+class OrderLeg(BaseModel):
+    bucket_idx: int
+    side: str  # 'buy' or 'sell'
+    size: float
+    limit_price: Optional[float] = None
+
+class BatchOrder(BaseModel):
+    legs: List[OrderLeg]
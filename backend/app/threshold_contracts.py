@@ -1,5 +1,7 @@
 # Utilities for threshold (above/below) contracts on continuous AMM
 import math
+import numpy as np
+from .lmsr_kernel import lmsr_prices, bucket_ask, bucket_bid
 
 def payoff_vector(knots, val, direction):
     """
@@ -17,3 +19,63 @@ def price_per_contract(prices, w):
     Instantaneous price per contract: p = sum(w_k * p_k)
     """
     return sum(wk * pk for wk, pk in zip(w, prices))
+
+# --- Prefix-sum threshold pricing ---
+# A threshold contract pays 1 on a contiguous run of sorted knots, so its
+# price is a difference of prefix sums (the CDF) of the price vector: one
+# bisect per strike instead of an O(N) payoff vector. Buying s units of the
+# whole payoff adds s to q_k on that run, and the exact LMSR cost is
+# C(q + s 1_A) - C(q) = b log(1 + P_A (e^{s/b} - 1)), the same closed form as
+# a single bucket with p = P_A.
+
+class ThresholdPricer:
+    """
+    Above/below prices and trade costs for one (x, prices, b) snapshot.
+    Strikes may be scalars or arrays; arrays are priced in one pass.
+    """
+    __slots__ = ('x', 'cdf', 'b')
+
+    def __init__(self, x, prices, b):
+        self.x = np.asarray(x, dtype=np.float64)
+        p = np.asarray(prices, dtype=np.float64)
+        self.cdf = np.concatenate(([0.0], np.cumsum(p)))
+        self.cdf /= self.cdf[-1]
+        self.b = b
+
+    def price(self, K, direction='long'):
+        """
+        Price of the payoff on knots >= K ('long', above) or <= K ('short', below).
+        """
+        K = np.asarray(K, dtype=np.float64)
+        if direction == 'long':
+            mass = 1.0 - self.cdf[np.searchsorted(self.x, K, side='left')]
+        else:
+            mass = self.cdf[np.searchsorted(self.x, K, side='right')]
+        mass = np.clip(mass, 0.0, 1.0)
+        return float(mass) if mass.ndim == 0 else mass
+
+    def quote(self, K, direction='long', size=1.0):
+        """
+        Price plus exact cost to buy (ask) / proceeds to sell (bid) `size` units.
+        """
+        P = self.price(K, direction)
+        return {
+            'price': P,
+            'ask': bucket_ask(P, self.b, size),
+            'bid': bucket_bid(P, self.b, size),
+        }
+
+_PRICERS = {}  # market_id -> (state, version, pricer)
+
+def threshold_pricer(state):
+    """
+    ThresholdPricer for an AMM state, rebuilt only when state.version moves.
+    """
+    with state.lock:
+        cached = _PRICERS.get(state.market_id)
+        if cached is not None and cached[0] is state and cached[1] == state.version:
+            return cached[2]
+        x, q, b, version = state.snapshot()
+    pricer = ThresholdPricer(x, lmsr_prices(q, b), b)
+    _PRICERS[state.market_id] = (state, version, pricer)
+    return pricer
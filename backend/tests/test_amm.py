@@ -6,8 +6,8 @@ def test_phantom_share_seeding_uniform():
     min_val = 1
     max_val = 100
     state = get_amm_state('test_market', N, min_val, max_val, prior=None)
-    b = state['b']
-    q = [k['q'] for k in state['knots']]
+    b = state.b
+    q = state.q.tolist()
     # Uniform prior: p_k0 = 1/N, so q_k = b*ln(1/N)
     expected_q = b * math.log(1.0 / N)
     assert all(abs(qk - expected_q) < 1e-8 for qk in q)
@@ -24,9 +24,337 @@ def test_phantom_share_seeding_custom_prior():
     # Prior: p_k0 = [0.1, 0.2, 0.3, 0.4]
     prior = [0.1, 0.2, 0.3, 0.4]
     state = get_amm_state('test_market2', N, min_val, max_val, prior=prior)
-    b = state['b']
-    q = [k['q'] for k in state['knots']]
+    b = state.b
+    q = state.q.tolist()
     expq = [math.exp(qk / b) for qk in q]
     prices = [e / sum(expq) for e in expq]
     for p, pk0 in zip(prices, [0.1, 0.2, 0.3, 0.4]):
         assert abs(p - pk0) < 1e-8
+
+def test_kernel_bid_ask_matches_cost_differences():
+    from app.lmsr_kernel import lmsr_kernel, lmsr_cost
+    q = [-3.0, 1.5, 0.0, 7.25, -12.0]
+    b = 4.0
+    s = 2.5
+    res = lmsr_kernel(q, b, size=s)
+    c0 = lmsr_cost(q, b)
+    assert abs(res['cost'] - c0) < 1e-12
+    assert abs(res['prices'].sum() - 1.0) < 1e-12
+    for k in range(len(q)):
+        q_plus = list(q)
+        q_plus[k] += s
+        q_minus = list(q)
+        q_minus[k] -= s
+        assert abs(res['ask'][k] - (lmsr_cost(q_plus, b) - c0)) < 1e-9
+        assert abs(res['bid'][k] - (c0 - lmsr_cost(q_minus, b))) < 1e-9
+
+def test_kernel_stable_for_large_q():
+    from app.lmsr_kernel import lmsr_kernel
+    res = lmsr_kernel([5000.0, 4999.0, 0.0], 1.0)
+    assert all(math.isfinite(v) for v in res['ask'])
+    assert abs(res['prices'].sum() - 1.0) < 1e-12
+
+def test_partition_cache_tracks_full_recompute():
+    import random
+    from app.lmsr_kernel import PartitionCache, lmsr_cost, lmsr_prices, bucket_ask
+    rng = random.Random(7)
+    b = 50.0
+    q = [rng.uniform(-100, 100) for _ in range(30)]
+    cache = PartitionCache(q, b)
+    for _ in range(1000):
+        k = rng.randrange(len(q))
+        s = rng.uniform(-40, 60)
+        qk_old = q[k]
+        q[k] += s
+        if not cache.apply(qk_old, q[k]):
+            cache.rebase(q, b)
+    assert abs(cache.cost() - lmsr_cost(q, b)) < 1e-8
+    prices = lmsr_prices(q, b)
+    for k in (0, 11, 29):
+        assert abs(cache.price(q[k]) - prices[k]) < 1e-10
+        assert abs(cache.ask(q[k], 3.0) - bucket_ask(prices[k], b, 3.0)) < 1e-8
+
+def test_partition_cache_logit_near_one():
+    from app.lmsr_kernel import PartitionCache
+    b = 10.0
+    for lead in (5.0, 20.0, 45.0):
+        # p_0 = e^lead / (e^lead + 3 e^-1): the complement ranges from ~2e-2 down to ~1e-19
+        q = [lead * b, -b, -b, -b]
+        expected = lead - (math.log(3.0) - 1.0)
+        assert abs(PartitionCache(q, b).logit(q, 0) - expected) < 1e-12 * lead
+        assert abs(PartitionCache(q, b).logit(q, 1) - (-1.0 - math.log(math.exp(lead) + 2 * math.exp(-1.0)))) < 1e-9
+    assert PartitionCache([3.0], b).logit([3.0], 0) is None
+
+def test_apply_trade_updates_quotes():
+    from app.amm_state import apply_trade, get_quotes_for_bucket, C
+    state = get_amm_state('test_market3', 6, 1, 1000, prior=None)
+    apply_trade(state, 2, 25.0)
+    q = state.q.tolist()
+    quote = get_quotes_for_bucket(state, 2, size=1.0)
+    q_plus = list(q)
+    q_plus[2] += 1.0
+    assert abs(quote['ask'] - (C(q_plus, state.b) - C(q, state.b))) < 1e-6
+
+def test_amm_state_sorted_insert_grows_in_place():
+    from app.amm_state import AMMState
+    state = AMMState([1.0, 10.0, 100.0], [0.0, 1.0, 2.0], 100.0, 10.0, 1.0, 100.0)
+    for i in range(50):
+        state.insert(50.0 + i, float(i))
+    assert state.insert(5.0, -1.0) == 1
+    assert len(state) == 54
+    assert all(a < b for a, b in zip(state.x[:-1], state.x[1:]))
+    assert state.knot(1) == {'x': 5.0, 'q': -1.0}
+    view = state.q
+    view[0] = 42.0
+    assert state.knot(0)['q'] == 42.0
+
+def test_insert_knot_returns_index_with_tolerance():
+    from app.amm_state import insert_knot, insert_knots
+    state = get_amm_state('test_market4', 5, 1, 10000, prior=None)
+    k = insert_knot(state, 42.0)
+    assert state.x[k] == 42.0
+    assert insert_knot(state, 42.0 + 1e-9) == k
+    assert len(state) == 6
+    idx = insert_knots(state, [7.0, 42.0, 3e3, 7.0 + 1e-8, 0.5])
+    assert len(state) == 9
+    assert [float(state.x[i]) for i in idx] == [7.0, 42.0, 3e3, 7.0, 0.5]
+    assert all(a < b for a, b in zip(state.x[:-1], state.x[1:]))
+    assert abs(state.b - state.bankroll / math.log(9)) < 1e-12
+
+def test_concurrent_orders_on_one_market_do_not_lose_updates():
+    import threading
+    from app import amm_orders
+    amm_orders.set_amm_state('test_book_concurrent', [0.0] * 8, 20.0)
+    def worker(bucket):
+        for _ in range(200):
+            amm_orders.place_order('test_book_concurrent', bucket, 'buy', 0.5, 'market')
+    threads = [threading.Thread(target=worker, args=(i % 8,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    snap = amm_orders.get_book_snapshot('test_book_concurrent')
+    assert all(abs(qk - 200.0) < 1e-9 for qk in snap['q'])
+
+def test_batch_order_priced_jointly_and_atomic():
+    from app import amm_orders
+    from app.lmsr_kernel import lmsr_cost
+    q0 = [0.0, 1.0, -2.0, 0.5]
+    b = 10.0
+    amm_orders.set_amm_state('test_book_batch', q0, b)
+    legs = [
+        {'bucket_idx': 0, 'side': 'buy', 'size': 4.0, 'limit_price': None},
+        {'bucket_idx': 2, 'side': 'sell', 'size': 1.5, 'limit_price': None},
+        {'bucket_idx': 0, 'side': 'buy', 'size': 1.0, 'limit_price': 0.9},
+    ]
+    res = amm_orders.place_orders('test_book_batch', legs)
+    assert res['status'] == 'filled'
+    q1 = [5.0, 1.0, -3.5, 0.5]
+    assert abs(res['payment'] - (lmsr_cost(q1, b) - lmsr_cost(q0, b))) < 1e-9
+    assert amm_orders.get_book_snapshot('test_book_batch')['q'] == q1
+    # One leg over its limit rejects the whole batch
+    legs[1]['limit_price'] = 0.99
+    res = amm_orders.place_orders('test_book_batch', legs)
+    assert res['status'] == 'rejected'
+    assert amm_orders.get_book_snapshot('test_book_batch')['q'] == q1
+
+def test_limit_order_fills_exactly_to_limit_price():
+    from app import amm_orders
+    from app.lmsr_kernel import lmsr_prices
+    amm_orders.set_amm_state('test_book_limit', [0.0, 0.0, 0.0, 0.0], 5.0)
+    res = amm_orders.place_order('test_book_limit', 1, 'buy', 1000.0, 'limit', limit_price=0.6)
+    assert res['status'] == 'resting'
+    q = amm_orders.get_book_snapshot('test_book_limit')['q']
+    assert abs(lmsr_prices(q, 5.0)[1] - 0.6) < 1e-12
+    # Closed form and bisection fallback agree
+    s = amm_orders._bisect_fill([0.0, 0.0, 0.0, 0.0], 5.0, 1, 'buy', 1000.0, 0.6)
+    assert abs(s - res['filled']) < 1e-9
+    res = amm_orders.place_order('test_book_limit', 1, 'sell', 2.0, 'limit', limit_price=0.1)
+    assert res['status'] == 'filled' and res['filled'] == 2.0
+
+def test_resting_orders_cross_and_fill_when_amm_moves():
+    from app import amm_orders
+    amm_orders.set_amm_state('test_book_clob', [0.0, 0.0, 0.0, 0.0], 5.0)
+    # Below the AMM price (0.25): nothing fills, the order rests
+    bid = amm_orders.place_order('test_book_clob', 0, 'buy', 3.0, 'limit', limit_price=0.2)
+    assert bid['status'] == 'resting' and bid['filled'] == 0.0
+    sell = amm_orders.place_order('test_book_clob', 2, 'sell', 2.0, 'limit', limit_price=0.3)
+    assert sell['status'] == 'resting'
+    assert amm_orders.get_book_levels('test_book_clob') == [
+        {'bucket_idx': 0, 'bid': 0.2, 'bid_size': 3.0, 'ask': None, 'ask_size': 0.0},
+        {'bucket_idx': 2, 'bid': None, 'bid_size': 0.0, 'ask': 0.3, 'ask_size': 2.0},
+    ]
+    # Incoming buy takes the cheaper AMM until its price reaches the resting
+    # sell's 0.3 (logit moves by s / b), then crosses that sell at its price
+    q_before = amm_orders.get_book_snapshot('test_book_clob')['q']
+    res = amm_orders.place_order('test_book_clob', 2, 'buy', 1.5, 'limit', limit_price=0.35)
+    amm_qty = 5.0 * (math.log(0.3 / 0.7) - math.log(0.25 / 0.75))
+    q_after = amm_orders.get_book_snapshot('test_book_clob')['q']
+    assert res['filled'] == 1.5 and 0.25 < res['avg_price'] < 0.3
+    assert abs(q_after[2] - q_before[2] - amm_qty) < 1e-9
+    assert abs(amm_orders.get_order('test_book_clob', sell['order_id'])['remaining'] - (0.5 + amm_qty)) < 1e-9
+    # Buying bucket 3 pushes bucket 0's AMM price below 0.2: the resting bid fills
+    amm_orders.place_order('test_book_clob', 3, 'buy', 20.0, 'market')
+    assert amm_orders.get_order('test_book_clob', bid['order_id'])['status'] == 'filled'
+    assert amm_orders.cancel_order('test_book_clob', sell['order_id'])['status'] == 'cancelled'
+    assert amm_orders.get_book_levels('test_book_clob') == []
+    assert amm_orders.get_amm_state('test_book_clob')['clob'].orders == {}  # done orders are evicted
+    # A resting offer far above the AMM's ask never gets picked off
+    amm_orders.set_amm_state('test_book_clob2', [0.0, 0.0, 0.0, 0.0], 5.0)
+    offer = amm_orders.place_order('test_book_clob2', 0, 'sell', 5.0, 'limit', limit_price=0.9)
+    res = amm_orders.place_order('test_book_clob2', 0, 'buy', 5.0, 'market')
+    assert res['filled'] == 5.0 and res['avg_price'] < 0.5
+    assert amm_orders.get_order('test_book_clob2', offer['order_id'])['remaining'] == 5.0
+
+def test_implied_survival_batch_matches_scalar():
+    import numpy as np
+    from app.amm_state import apply_trade
+    from app.implied_distribution import lmsr_lognormal_pareto, lmsr_lognormal_pareto_batch, cached_fit
+    state = get_amm_state('test_market_survival', 12, 1e6, 1e10, prior=None)
+    apply_trade(state, 8, 400.0)
+    _, fit = cached_fit(state)
+    assert cached_fit(state)[1] is fit  # same version: no refit
+    apply_trade(state, 2, 50.0)
+    assert cached_fit(state)[1] is not fit
+    # (K, base, low, high) from the per-threshold loop implementation this replaced
+    w = [1, 3, 6, 9, 7, 4, 2, 1]
+    p = [v / sum(w) for v in w]
+    x = [1e6 * 4.0 ** i for i in range(8)]
+    reference = [
+        (3e6, 1.0486752338173164, 1.0486752338173164, 1.0486752338173164),
+        (1.5e8, 0.4299617961027369, 0.4299617961027369, 0.4299617961027369),
+        (9e8, 0.19068392156098024, 0.19068392156098024, 0.19068392156098024),
+        (3e9, 0.003996721416017668, 0.0055176006870028054, 0.0028950594621466397),
+        (1e10, 0.00012074217164861449, 0.0002392043073610752, 6.094652799214523e-05),
+        (4e10, 2.1471331776611652e-06, 6.447435306752544e-06, 7.150410455123118e-07),
+    ]
+    res = lmsr_lognormal_pareto_batch(np.array(p), np.array(x), np.array([r[0] for r in reference]))
+    for i, (k, *expected) in enumerate(reference):
+        one = lmsr_lognormal_pareto(p, [{'x': v} for v in x], k)
+        for name, value in zip(('base', 'low', 'high'), expected):
+            assert abs(res[name][i] - value) <= 1e-9 * value
+            assert abs(one[name] - value) <= 1e-9 * value
+
+def test_threshold_pricer_matches_payoff_vector():
+    import numpy as np
+    from app.amm_state import apply_trade
+    from app.lmsr_kernel import lmsr_prices, lmsr_cost
+    from app.threshold_contracts import payoff_vector, price_per_contract, threshold_pricer
+    state = get_amm_state('test_market_threshold', 10, 1, 1000, prior=None)
+    apply_trade(state, 6, 120.0)
+    pricer = threshold_pricer(state)
+    assert threshold_pricer(state) is pricer
+    q, b = state.q.copy(), state.b
+    knots = [{'x': v} for v in state.x]
+    strikes = [0.5, float(state.x[3]), 42.0, 999.0, 5000.0]
+    for direction in ('long', 'short'):
+        batch = pricer.quote(strikes, direction, size=7.0)
+        for i, K in enumerate(strikes):
+            w = np.array(payoff_vector(knots, K, direction))
+            assert abs(batch['price'][i] - price_per_contract(lmsr_prices(q, b), w)) < 1e-12
+            assert abs(batch['ask'][i] - (lmsr_cost(q + 7.0 * w, b) - lmsr_cost(q, b))) < 1e-8
+            assert abs(batch['bid'][i] - (lmsr_cost(q, b) - lmsr_cost(q - 7.0 * w, b))) < 1e-8
+
+def test_log_bucket_grid_locate_and_lazy_extend():
+    from app.lmsr import log_bucket_grid, make_log_buckets, locate_bucket
+    grid = log_bucket_grid(5e6, 5e8)
+    assert log_bucket_grid(5e6, 5e8) is grid
+    buckets = make_log_buckets(5e6, 5e8)
+    for val in (5e6, 9.9e6, 2.5e7, 5e7, 7e7, 4.99e8):
+        i = grid.locate(val)
+        assert buckets[i]['low'] <= val < buckets[i]['high']
+        assert [k for k, bk in enumerate(buckets) if bk['low'] <= val < bk['high']][0] == i
+    # Extending returns a bigger grid and leaves the shared one (and list) untouched
+    bigger, i = locate_bucket(3e10, buckets)
+    assert len(buckets) == len(grid) and bigger is not grid
+    assert bigger.lows[i] <= 3e10 < bigger.highs[i]
+    assert bigger.buckets()[:len(grid)] == grid.buckets()
+
+def test_exposure_tracks_worst_case_loss_and_fires_limits(monkeypatch):
+    from app import exposure, amm_orders
+    from app.amm_state import apply_trade, C
+    from app.lmsr_kernel import lmsr_prices
+    events = []
+    monkeypatch.setattr(exposure, 'HOOKS', [lambda event, book, market_id, e: events.append(event)])
+    monkeypatch.setattr(exposure, 'REDUCE_B_AT', 0.5)
+    monkeypatch.setattr(exposure, 'PAUSE_AT', 0.85)
+    state = get_amm_state('test_market_exposure', 6, 1, 1000, prior=None)
+    q0 = state.q.copy()
+    apply_trade(state, 1, 300.0)
+    apply_trade(state, 1, -200.0)  # sells the max bucket down: max is only an upper bound now
+    apply_trade(state, 3, 50.0)
+    report = exposure.EXPOSURE.report('amm', 'test_market_exposure')
+    expected = (state.q - q0).max() - (C(state.q, state.b) - C(q0, state.b))
+    assert abs(report['worst_case_loss'] - expected) < 1e-9
+    assert report['trades'] == 3 and report['volume'] == 550.0 and events == []
+    # Order book: crossing REDUCE_B_AT halves b and q (prices unchanged), PAUSE_AT stops trading
+    amm_orders.set_amm_state('test_book_exposure', [0.0, 0.0, 0.0], 10.0)
+    seed = 10.0 * math.log(3)
+    amm_orders.place_order('test_book_exposure', 0, 'buy', 20.0, 'market')
+    assert events == ['reduce_b']
+    book = amm_orders.get_amm_state('test_book_exposure')
+    assert book['b'] == 5.0
+    assert abs(lmsr_prices(book['q'], book['b'])[0] - 1 / (1 + 2 * math.exp(-2))) < 1e-12
+    # Halving b caps what the next 40 shares can lose at about b log(1/p)
+    amm_orders.place_order('test_book_exposure', 0, 'buy', 40.0, 'market')
+    assert events == ['reduce_b', 'pause']
+    report = exposure.EXPOSURE.report('book', 'test_book_exposure')
+    assert 0.85 * seed <= report['net_worst_case'] < seed and report['paused']
+    assert amm_orders.place_order('test_book_exposure', 1, 'buy', 1.0, 'market')['status'] == 'error'
+    exposure.EXPOSURE.resume('book', 'test_book_exposure')
+    assert amm_orders.place_order('test_book_exposure', 1, 'buy', 1.0, 'market')['status'] == 'filled'
+
+def test_circuit_breaker_trips_on_hourly_move_and_expires(monkeypatch):
+    import numpy as np
+    from types import SimpleNamespace
+    from app import circuit_breaker
+    import json
+    from app.amm_state import apply_trade, get_quotes_for_bucket, get_quote_ladder
+    from app.lmsr_kernel import lmsr_prices
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(circuit_breaker, 'time', SimpleNamespace(time=lambda: clock.now))
+    state = get_amm_state('test_market_breaker', 4, 1, 100, prior=None)
+    b = state.b
+    apply_trade(state, 0, 100.0)
+    assert 'circuit_breaker' not in get_quotes_for_bucket(state, 0)
+    # Half an hour later the bucket's price is up ~45% on the window start
+    clock.now += 1800
+    apply_trade(state, 0, 1900.0)
+    prices = lmsr_prices(state.q, state.b)
+    quote = get_quotes_for_bucket(state, 0, size=10.0)
+    assert quote['circuit_breaker'] and circuit_breaker.BREAKERS.is_tripped('test_market_breaker')
+    assert abs(state.b - 2 * b) < 1e-9 and np.allclose(lmsr_prices(state.q, state.b), prices)
+    assert quote['ask'] > 10.0 * quote['mid'] * 1.01 and quote['bid'] < 10.0 * quote['mid'] * 0.99
+    # A cached ladder is built widened; the first read after the cooldown
+    # lifts the trip, bumps the version and rebuilds it
+    from app import read_cache
+    build = lambda: get_quote_ladder(state)
+    etag = read_cache.cached_response('test_breaker', state, build).headers['etag']
+    clock.now += circuit_breaker.COOLDOWN_SECONDS + 1
+    lifted = read_cache.cached_response('test_breaker', state, build, if_none_match=etag)
+    assert lifted.status_code == 200 and lifted.headers['etag'] != etag
+    assert abs(state.b - b) < 1e-9 and np.allclose(lmsr_prices(state.q, state.b), prices)
+    fresh = get_quotes_for_bucket(state, 0)
+    assert 'circuit_breaker' not in fresh and json.loads(lifted.body)[0] == get_quote_ladder(state)[0]
+
+def test_circuit_breaker_window_survives_knot_inserts(monkeypatch):
+    from types import SimpleNamespace
+    from app import circuit_breaker
+    from app.amm_state import apply_trade, insert_knot
+    from app.lmsr_kernel import lmsr_prices
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(circuit_breaker, 'time', SimpleNamespace(time=lambda: clock.now))
+    state = get_amm_state('test_market_breaker_knots', 4, 1, 100, prior=None)
+    apply_trade(state, 0, 1.0)
+    trips = []
+    # Every trade follows a new valuation's knot insert (as quote_and_trade
+    # does); each moves bucket 0 by under 5% while the inserts dilute it ~15x
+    for i in range(12):
+        clock.now += 60
+        insert_knot(state, 200.0 + i)
+        before = lmsr_prices(state.q, state.b)[0]
+        apply_trade(state, 0, 60.0)
+        assert lmsr_prices(state.q, state.b)[0] < 1.05 * before
+        trips.append(circuit_breaker.BREAKERS.status('test_market_breaker_knots')['trips'])
+    # Dilution from the inserts is not a move; the trades' cumulative one is
+    assert trips[:5] == [0] * 5 and trips[-1] == 1
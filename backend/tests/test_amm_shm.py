@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+import numpy as np
+import pytest
+from app import amm_state, amm_shm
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="shared-memory mode needs fcntl")
+
+@pytest.fixture
+def shm_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(amm_shm, 'SHARED_MEMORY', True)
+    monkeypatch.setattr(amm_shm, 'SHM_PREFIX', f"vmtest{os.getpid()}")
+    monkeypatch.setattr(amm_shm, 'LOCK_DIR', str(tmp_path))
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    yield
+    amm_shm.unlink(7)
+
+def _worker_trades(n):
+    # Simulates another uvicorn worker: its own AMM_STATE, same segment
+    amm_state.AMM_STATE = {}
+    state = amm_state.get_amm_state(7, 5, 1, 1000)
+    for _ in range(n):
+        amm_state.apply_trade(state, 1, 2.0)
+
+def test_workers_share_market_state(shm_mode):
+    state = amm_state.get_amm_state(7, 5, 1, 1000)
+    quote_before = amm_state.get_quotes_for_bucket(state, 1)
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_worker_trades, args=(50,)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    amm_state.apply_trade(state, 1, 2.0)
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    expected = 5000.0 / np.log(5) * np.log(0.2) + 2.0 * 101
+    assert abs(state.q[1] - expected) < 1e-9
+    assert state.version == 101
+    # This worker's partition cache is stale and must be rebuilt
+    quote = amm_state.get_quotes_for_bucket(state, 1)
+    assert quote['mid'] > quote_before['mid']
+    assert abs(quote['mid'] - amm_state.px(state.q, state.b)[1]) < 1e-6
+    # Per-worker breaker state would stack multipliers on the shared b: off here
+    b = state.b
+    amm_state.apply_trade(state, 2, 3000.0)
+    assert 'circuit_breaker' not in amm_state.get_quotes_for_bucket(state, 2) and state.b == b
@@ -0,0 +1,132 @@
+import numpy as np
+from sqlalchemy import create_engine
+from app.models import Base
+from app import amm_state, amm_orders, amm_store
+from app.amm_store import AMMStore
+from app.exposure import EXPOSURE
+import tempfile
+import os
+import pytest
+
+@pytest.fixture(scope="function")
+def store(monkeypatch):
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    store = AMMStore(engine)
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    monkeypatch.setattr(amm_state, 'JOURNAL', store)
+    monkeypatch.setattr(amm_orders, 'ORDER_BOOK', {})
+    monkeypatch.setattr(amm_orders, 'JOURNAL', store)
+    monkeypatch.setattr(EXPOSURE, 'markets', {})
+    yield store
+    engine.dispose()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_restore_replays_snapshot_and_log(store, monkeypatch):
+    monkeypatch.setattr(amm_store, 'SNAPSHOT_EVERY', 7)
+    state = amm_state.get_amm_state(1, 5, 1, 1000)
+    for i in range(20):
+        k = amm_state.insert_knot(state, 3.0 + i)
+        amm_state.apply_trade(state, k, 1.5 * (i % 4) - 2.0)
+    amm_orders.set_amm_state(2, [0.0, 0.0, 0.0], 10.0)
+    amm_orders.place_order(2, 1, 'buy', 25.0, 'market')
+    amm_states, order_book = {}, {}
+    AMMStore(store.engine).restore(amm_states, order_book)
+    restored = amm_states[1]
+    assert np.array_equal(restored.x, state.x)
+    assert np.allclose(restored.q, state.q)
+    assert restored.b == state.b
+    assert order_book[2]['q'] == amm_orders.ORDER_BOOK[2]['q']
+
+def test_recalibration_blends_and_is_journaled(store):
+    from app import recalibration, priors
+    from app.lmsr_kernel import lmsr_prices
+    states = [amm_state.get_amm_state(i, 12, 1e6, 1e10) for i in range(4)]
+    amm_state.apply_trade(states[0], 3, 40.0)
+    p_old = lmsr_prices(states[0].q, states[0].b)
+    p0 = priors.lognormal_prior(states[0].x, 5e8, 0.8)
+    report = recalibration.recalibrate({i: p0 for i in range(4)} | {'nope': p0}, weight=0.25)
+    assert report['nope'] == {'error': 'unknown market'}
+    # Prices move to the normalized geometric blend p^(1-w) p0^w
+    blended = p_old ** 0.75 * p0 ** 0.25
+    assert np.allclose(lmsr_prices(states[0].q, states[0].b), blended / blended.sum())
+    assert report[0]['version'] == states[0].version
+    assert report[0]['pnl_impact'] == report[0]['positions_value_before'] - report[0]['positions_value_after']
+    assert report[1]['pnl_impact'] == 0.0  # nobody holds shares there
+    amm_states = {}
+    AMMStore(store.engine).restore(amm_states, {})
+    assert np.allclose(amm_states[0].q, states[0].q)
+
+def test_recalibration_pnl_marks_positions_to_market(store):
+    from app import recalibration
+    from app.lmsr_kernel import lmsr_prices
+    state = amm_state.get_amm_state(5, 4, 1, 1000, prior=None)
+    amm_state.apply_trade(state, 1, 30.0)
+    amm_state.apply_trade(state, 3, 10.0)
+    amm_state.apply_trade(state, 3, -4.0)
+    p_before = lmsr_prices(state.q, state.b)
+    # Moving the prior onto bucket 1 makes the traders' 30 shares there worth more
+    report = recalibration.recalibrate({5: np.array([0.1, 0.6, 0.1, 0.2])}, weight=0.5)[5]
+    dp = lmsr_prices(state.q, state.b) - p_before
+    assert dp[1] > 0
+    expected = -(30.0 * dp[1] + 6.0 * dp[3])
+    assert report['pnl_impact'] < 0 and abs(report['pnl_impact'] - expected) < 1e-9
+    assert abs(report['positions_value_before'] - (30.0 * p_before[1] + 6.0 * p_before[3])) < 1e-9
+
+def test_trades_after_snapshot_survive_restore(store, monkeypatch):
+    monkeypatch.setattr(amm_store, 'SNAPSHOT_EVERY', 5)
+    state = amm_state.get_amm_state(3, 5, 1, 1000)
+    for _ in range(5):
+        amm_state.apply_trade(state, 2, 1.0)
+    # The snapshot compacted the log; the next entry must not reuse a deleted id
+    amm_state.apply_trade(state, 2, 10.0)
+    amm_states = {}
+    AMMStore(store.engine).restore(amm_states, {})
+    assert np.allclose(amm_states[3].q, state.q)
+
+def test_exposure_and_pause_survive_restore(store, monkeypatch):
+    from app import exposure
+    monkeypatch.setattr(amm_store, 'SNAPSHOT_EVERY', 3)
+    monkeypatch.setattr(exposure, 'PAUSE_AT', 0.5)
+    amm_orders.set_amm_state(4, [0.0, 0.0, 0.0], 10.0)
+    for side in ('buy', 'buy', 'sell', 'buy'):
+        amm_orders.place_order(4, 0, side, 4.0, 'market')
+    amm_orders.place_orders(4, [{'bucket_idx': 1, 'side': 'buy', 'size': 2.0},
+                                {'bucket_idx': 2, 'side': 'sell', 'size': 1.0}])
+    amm_orders.place_order(4, 1, 'buy', 30.0, 'market')
+    live = exposure.EXPOSURE.report('book', 4)
+    assert live['paused']
+    # Snapshot (every 3 rows) plus the rows after it rebuild the tracker
+    exposure.EXPOSURE.forget('book', 4)
+    AMMStore(store.engine).restore({}, {})
+    restored = exposure.EXPOSURE.report('book', 4)
+    assert restored.keys() == live.keys()
+    for name, value in live.items():
+        assert abs(restored[name] - value) < 1e-9 if isinstance(value, float) else restored[name] == value
+    assert amm_orders.place_order(4, 0, 'buy', 1.0, 'market')['status'] == 'error'
+
+def test_resting_orders_survive_restore(store, monkeypatch):
+    from app.order_book import MarketBook
+    monkeypatch.setattr(amm_store, 'SNAPSHOT_EVERY', 3)
+    amm_orders.set_amm_state(6, [0.0, 0.0, 0.0], 10.0)
+    amm_orders.place_order(6, 0, 'buy', 5.0, 'limit', 0.2)
+    second = amm_orders.place_order(6, 0, 'buy', 4.0, 'limit', 0.2)['order_id']
+    amm_orders.place_order(6, 1, 'sell', 6.0, 'limit', 0.45)
+    amm_orders.place_order(6, 0, 'sell', 8.0, 'market')  # the AMM reaches 0.2 and part-fills the first bid
+    amm_orders.cancel_order(6, second)
+    amm_orders.place_order(6, 1, 'buy', 3.0, 'market')  # and sweeps part of the offer, refilling the bid
+    amm_orders.place_order(6, 2, 'sell', 3.0, 'limit', 0.9)
+    live = amm_orders.ORDER_BOOK[6]['clob'].dump()
+    assert second not in [o[0] for o in live['orders']]
+    assert len(live['orders']) == 3 and 0 < live['orders'][0][5] < 5.0 and 0 < live['orders'][1][5] < 6.0
+    monkeypatch.setattr(MarketBook, '_next_id', 1)  # a fresh process
+    order_book = {}
+    AMMStore(store.engine).restore({}, order_book)
+    assert order_book[6]['clob'].dump()['orders'] == live['orders']
+    assert np.allclose(order_book[6]['q'], amm_orders.ORDER_BOOK[6]['q'])
+    levels = amm_orders.get_book_levels(6)
+    monkeypatch.setattr(amm_orders, 'ORDER_BOOK', order_book)
+    assert amm_orders.get_book_levels(6) == levels
+    assert MarketBook.next_id() >= live['next_id']
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import DetachedInstanceError
+from app import db, api
+from app.models import Base, User
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    yield path
+    os.close(db_fd)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+@pytest.fixture
+def sessions(db_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(db, 'SessionLocal', sessionmaker(bind=engine))
+    monkeypatch.setattr(db, 'AsyncSessionLocal', None)
+    yield db.SessionLocal
+    engine.dispose()
+
+def test_pool_settings_from_env():
+    env = dict(os.environ, DB_POOL_SIZE="3", DB_MAX_OVERFLOW="4", DB_POOL_TIMEOUT="2.5",
+               DB_POOL_RECYCLE="60", DB_POOL_PRE_PING="0", SQLITE_WAL="0")
+    out = subprocess.run([sys.executable, "-c", "from app import db; print(db.POOL_SIZE, db.MAX_OVERFLOW, "
+                          "db.POOL_TIMEOUT, db.POOL_RECYCLE, db.POOL_PRE_PING, db.SQLITE_WAL)"],
+                         cwd=BACKEND, env=env, capture_output=True, text=True, check=True).stdout
+    assert out.split() == ["3", "4", "2.5", "60", "False", "False"]
+
+def test_postgres_engine_gets_pool_settings(monkeypatch):
+    calls = []
+    monkeypatch.setattr(db, 'create_engine', lambda url, **kwargs: calls.append((url, kwargs)))
+    monkeypatch.setattr(db, 'POOL_SIZE', 3)
+    db.make_engine("postgresql://u:p@localhost/venture")
+    assert calls == [("postgresql://u:p@localhost/venture", {
+        'pool_size': 3, 'max_overflow': db.MAX_OVERFLOW, 'pool_timeout': db.POOL_TIMEOUT,
+        'pool_recycle': db.POOL_RECYCLE, 'pool_pre_ping': db.POOL_PRE_PING})]
+
+def test_sqlite_pragmas(db_path, monkeypatch):
+    monkeypatch.setattr(db, 'SQLITE_WAL', True)
+    engine = db.make_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == db.SQLITE_BUSY_TIMEOUT_MS
+    engine.dispose()
+
+def test_run_db_uses_threadpool_session(sessions):
+    def work(session):
+        return threading.get_ident(), session.execute(text("SELECT 41 + 1")).scalar()
+    thread, value = asyncio.run(db.run_db(work))
+    assert value == 42 and thread != threading.get_ident()
+
+def test_current_user_is_detached_snapshot(sessions):
+    with sessions() as session:
+        session.add(User(username="carol", hashed_password="x", display_name="Carol"))
+        session.commit()
+    token = api.create_access_token({"sub": "carol"})
+    user = asyncio.run(api.get_current_user(token))
+    assert inspect(user).detached
+    assert (user.username, user.display_name) == ("carol", "Carol") and user.id is not None
+    with pytest.raises(DetachedInstanceError):
+        user.bets
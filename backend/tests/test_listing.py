@@ -0,0 +1,62 @@
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, User, Market, Bet
+from app.listing import keyset_page, ndjson_response, DEFAULT_LIMIT
+
+@pytest.fixture(scope="function")
+def session():
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    sess = sessionmaker(bind=engine)()
+    yield sess
+    sess.close()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_bets_keyset_pages_and_ndjson(session):
+    user = User(username="pager", hashed_password="x")
+    session.add(user)
+    session.flush()
+    markets = [Market(title=f"m{i}", creator_id=user.id) for i in range(2)]
+    session.add_all(markets)
+    session.flush()
+    for i in range(25):
+        session.add(Bet(user_id=user.id, market_id=markets[i % 2].id, amount=float(i), prediction={"i": i},
+                        placed_at=datetime(2024, 1, 1) + timedelta(minutes=i)))
+    session.commit()
+    query = session.query(Bet.id, Bet.amount).filter(Bet.market_id == markets[0].id)
+    seen, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(query, Bet.id, cursor, limit=5)
+        seen += [row.amount for row in rows]
+        if cursor is None:
+            break
+    assert seen == [float(i) for i in range(0, 25, 2)]
+
+    async def body(response):
+        return b"".join([chunk if isinstance(chunk, bytes) else chunk.encode()
+                         async for chunk in response.body_iterator])
+    rows, cursor = keyset_page(session.query(Bet.id, Bet.placed_at), Bet.id, None, limit=20)
+    lines = asyncio.run(body(ndjson_response(session.query(Bet.id, Bet.placed_at), Bet.id, cursor))).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [rows[-1].id + k for k in range(1, 6)]
+
+def test_unpaginated_without_cursor_or_limit(session):
+    user = User(username="lister", hashed_password="x")
+    session.add(user)
+    session.flush()
+    session.add_all([Market(title=f"m{i}", creator_id=user.id) for i in range(DEFAULT_LIMIT + 5)])
+    session.commit()
+    query = session.query(Market.id)
+    rows, cursor = keyset_page(query, Market.id, None, None)
+    assert len(rows) == DEFAULT_LIMIT + 5 and cursor is None
+    # A cursor alone pages with the default limit
+    rows, cursor = keyset_page(query, Market.id, None, 3)
+    rows, cursor = keyset_page(query, Market.id, cursor, None)
+    assert len(rows) == DEFAULT_LIMIT and cursor is not None
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import api, amm_state
+from app.models import Base, User, Market
+
+@pytest.fixture
+def session(monkeypatch):
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    sess = sessionmaker(bind=engine)()
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    monkeypatch.setattr(amm_state, 'JOURNAL', None)
+    yield sess
+    sess.close()
+    engine.dispose()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+@pytest.fixture
+def market(session):
+    user = User(username="maker", hashed_password="x")
+    session.add(user)
+    session.flush()
+    market = Market(title="m", creator_id=user.id, outcome_min=1e6, outcome_max=1e9)
+    session.add(market)
+    session.commit()
+    return market
+
+def test_survival_needs_an_existing_market(session, market):
+    with pytest.raises(HTTPException) as err:
+        api.get_market_survival(market.id + 1, K=None, delta=0.3, db=session)
+    assert err.value.status_code == 404 and market.id + 1 not in amm_state.AMM_STATE
+    curve = api.get_market_survival(market.id, K=None, delta=0.3, db=session)
+    state = amm_state.AMM_STATE[market.id]
+    assert (state.min_val, state.max_val) == (1e6, 1e9)
+    assert curve['K'] == state.x.tolist()
+
+def test_threshold_quotes_need_an_existing_market(session, market):
+    with pytest.raises(HTTPException) as err:
+        api.get_threshold_quotes(market.id + 1, K=[1e7], direction="long", size=1.0, db=session)
+    assert err.value.status_code == 404 and market.id + 1 not in amm_state.AMM_STATE
+    quote = api.get_threshold_quotes(market.id, K=[1e7], direction="long", size=1.0, db=session)
+    state = amm_state.AMM_STATE[market.id]
+    assert (state.min_val, state.max_val) == (1e6, 1e9) and 0.0 < quote['price'][0] < 1.0
@@ -0,0 +1,88 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, User, Market, Bet, MarketStats
+from sqlalchemy import insert
+from app import market_stats
+from app.market_stats import record_bet, get_stats
+
+@pytest.fixture(scope="function")
+def session():
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    sess = sessionmaker(bind=engine)()
+    yield sess
+    sess.close()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_stats_backfill_then_incremental(session):
+    users = [User(username=f"u{i}", hashed_password="x") for i in range(3)]
+    session.add_all(users)
+    session.flush()
+    market = Market(title="m", creator_id=users[0].id)
+    session.add(market)
+    session.flush()
+    t0 = datetime(2024, 1, 1)
+    # Legacy bets written before the stats table existed
+    for i, amt in enumerate([5.0, 7.0, 1.0]):
+        session.add(Bet(user_id=users[i % 2].id, market_id=market.id, amount=amt, prediction={}, placed_at=t0 + timedelta(minutes=i)))
+    session.commit()
+    stats = get_stats(session, market.id)
+    assert stats['liquidity'] == 13.0 and stats['traders'] == 2 and stats['bets'] == 3
+    # New bets update the aggregate in place
+    for user, amt, minutes in [(users[2], 2.0, 10), (users[0], 3.0, 5)]:
+        bet = Bet(user_id=user.id, market_id=market.id, amount=amt, prediction={}, placed_at=t0 + timedelta(minutes=minutes))
+        session.add(bet)
+        record_bet(session, bet)
+        session.commit()
+    session.expire_all()
+    stats = get_stats(session, market.id)
+    assert stats['liquidity'] == 18.0 and stats['traders'] == 3 and stats['bets'] == 5
+    assert stats['last_trade_at'] == t0 + timedelta(minutes=10)
+
+def test_first_bet_creates_stats(session):
+    user = User(username="solo", hashed_password="x")
+    session.add(user)
+    session.flush()
+    market = Market(title="m", creator_id=user.id)
+    session.add(market)
+    session.flush()
+    bet = Bet(user_id=user.id, market_id=market.id, amount=4.0, prediction={}, placed_at=datetime(2024, 1, 1))
+    session.add(bet)
+    record_bet(session, bet)
+    session.commit()
+    stats = session.get(MarketStats, market.id)
+    assert (stats.liquidity, stats.traders, stats.bets) == (4.0, 1, 1)
+
+def test_first_bets_race_for_stats_row(session, monkeypatch):
+    user = User(username="racer", hashed_password="x")
+    session.add(user)
+    session.flush()
+    market = Market(title="m", creator_id=user.id)
+    session.add(market)
+    session.flush()
+    bump = market_stats._bump
+    calls = []
+
+    def racing_bump(db, bet, new_trader):
+        if not calls:
+            # A concurrent first bet commits the row between this bet's UPDATE and INSERT
+            db.execute(insert(MarketStats).values(market_id=bet.market_id, liquidity=6.0, traders=1, bets=1))
+            calls.append(bet)
+            return False
+        return bump(db, bet, new_trader)
+
+    monkeypatch.setattr(market_stats, '_bump', racing_bump)
+    # Its rebuild can't see the other bet's row, so it tries to INSERT a second one
+    monkeypatch.setattr(market_stats, 'rebuild_stats', lambda db, market_id: db.add(MarketStats(market_id=market_id)))
+    bet = Bet(user_id=user.id, market_id=market.id, amount=4.0, prediction={}, placed_at=datetime(2024, 1, 1))
+    session.add(bet)
+    record_bet(session, bet)
+    session.commit()
+    stats = session.get(MarketStats, market.id)
+    assert (stats.liquidity, stats.bets) == (10.0, 2)
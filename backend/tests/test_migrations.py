@@ -0,0 +1,60 @@
+import os
+import tempfile
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from app.models import Base
+from app.migrations import upgrade
+
+# Tables as created by the previous models (uuid tx_log ids, no AUTOINCREMENT,
+# no exposure / orders / paid / fee / order_id columns, no bets indexes)
+OLD_SCHEMA = [
+    "CREATE TABLE tx_log (id VARCHAR NOT NULL PRIMARY KEY, ts DATETIME, from_id VARCHAR, to_id VARCHAR, "
+    "amt NUMERIC(38, 6) NOT NULL, ref VARCHAR NOT NULL)",
+    "CREATE TABLE amm_trade_log (id INTEGER NOT NULL PRIMARY KEY, book VARCHAR NOT NULL, market_id INTEGER NOT NULL, "
+    "kind VARCHAR NOT NULL, x FLOAT, bucket INTEGER, dq FLOAT NOT NULL)",
+    "CREATE INDEX ix_amm_trade_log_market_id ON amm_trade_log (market_id)",
+    "CREATE TABLE amm_snapshots (id INTEGER NOT NULL PRIMARY KEY, book VARCHAR NOT NULL, market_id INTEGER NOT NULL, "
+    "seq INTEGER NOT NULL, b FLOAT NOT NULL, bankroll FLOAT, min_val FLOAT, max_val FLOAT, x BLOB, q BLOB NOT NULL, "
+    "created_at DATETIME)",
+    "CREATE TABLE bets (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, market_id INTEGER, amount FLOAT NOT NULL, "
+    "prediction JSON NOT NULL, placed_at DATETIME)",
+]
+
+@pytest.fixture
+def engine():
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}")
+    yield engine
+    engine.dispose()
+    os.close(db_fd)
+    os.unlink(db_path)
+
+def test_upgrade_brings_old_tables_up_to_date(engine):
+    with engine.begin() as conn:
+        for ddl in OLD_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO tx_log VALUES ('b-uuid', :ts2, 'u1', NULL, 5, 'debit'), "
+                          "('a-uuid', :ts1, NULL, 'u1', 10, 'credit')"),
+                     {'ts1': datetime(2024, 1, 1), 'ts2': datetime(2024, 1, 2)})
+        conn.execute(text("INSERT INTO amm_trade_log VALUES (7, 'amm', 1, 'trade', 2.5, NULL, 1.0)"))
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+    upgrade(engine)  # idempotent
+
+    inspector = inspect(engine)
+    assert {'market_stats', 'market_traders'} <= set(inspector.get_table_names())
+    assert {'ix_bets_market_user', 'ix_bets_market_id', 'ix_bets_user_id'} <= {
+        ix['name'] for ix in inspector.get_indexes('bets')}
+    assert {'paid', 'fee', 'order_id'} <= {c['name'] for c in inspector.get_columns('amm_trade_log')}
+    assert {'exposure', 'orders'} <= {c['name'] for c in inspector.get_columns('amm_snapshots')}
+    with engine.begin() as conn:
+        # tx_log ids are integers in ts order, and new rows continue after them
+        rows = conn.execute(text("SELECT id, ref FROM tx_log ORDER BY id")).fetchall()
+        assert [tuple(r) for r in rows] == [(1, 'credit'), (2, 'debit')]
+        conn.execute(text("INSERT INTO tx_log (amt, ref) VALUES (1, 'new')"))
+        assert conn.execute(text("SELECT max(id) FROM tx_log")).scalar() == 3
+        # Journal ids survive the rebuild and are never handed out again
+        conn.execute(text("DELETE FROM amm_trade_log"))
+        conn.execute(text("INSERT INTO amm_trade_log (book, market_id, kind, dq) VALUES ('amm', 1, 'knot', 0)"))
+        assert conn.execute(text("SELECT id FROM amm_trade_log")).scalar() == 8
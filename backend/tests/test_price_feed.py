@@ -0,0 +1,37 @@
+import asyncio
+import json
+import threading
+from app import amm_state, price_feed
+from app.price_feed import PriceFeed
+
+def _frame(line):
+    assert line.startswith("data: ")
+    return json.loads(line[len("data: "):])
+
+def test_stream_sends_snapshot_then_coalesced_delta(monkeypatch):
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    state = amm_state.get_amm_state(11, 5, 1, 1000)
+    feed = PriceFeed()
+
+    async def run():
+        stream = feed.stream(11)
+        snap = _frame(await stream.__anext__())
+        assert snap['type'] == 'snapshot' and len(snap['q']) == 5
+        # A burst of trades from worker threads becomes one delta frame
+        def trades():
+            for _ in range(5):
+                amm_state.apply_trade(state, 2, 10.0)
+                feed.publish(11)
+        t = threading.Thread(target=trades)
+        t.start()
+        t.join()
+        delta = _frame(await asyncio.wait_for(stream.__anext__(), 1.0))
+        assert delta['type'] == 'delta'
+        assert list(delta['q']) == ['2']
+        assert abs(delta['q']['2'] - float(state.q[2])) < 1e-12
+        assert len(delta['p']) == 5
+        assert feed.channels[('amm', 11)].subscribers
+        await stream.aclose()
+        assert not feed.channels[('amm', 11)].subscribers
+
+    asyncio.run(run())
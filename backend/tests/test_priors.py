@@ -0,0 +1,51 @@
+import math
+import numpy as np
+from app import amm_state, priors
+from app.exposure import ExposureTracker
+from app.circuit_breaker import CircuitBreakers
+from app.lmsr import prior_lognormal, make_log_buckets
+
+def test_prior_builders_are_normalized_and_batched():
+    x = priors.knot_grid(40, 1e6, 1e11)
+    grids = np.vstack([x, x])
+    batch = priors.lognormal_prior(grids, median=[2e7, 5e8], sigma=[0.5, 1.0])
+    assert np.allclose(batch.sum(axis=1), 1.0)
+    assert np.allclose(batch[1], priors.lognormal_prior(x, 5e8, 1.0))
+    assert x[np.argmax(batch[0])] < x[np.argmax(batch[1])]
+    comps = priors.comps_prior(x, [3e7, 4e7, 9e9], weights=[1, 1, 0.1])
+    assert abs(comps.sum() - 1.0) < 1e-12 and comps.min() > 0
+    hist = priors.histogram_prior(x, [2e7] * 50 + [1e9] * 10, smoothing=1.0)
+    assert abs(x[np.argmax(hist)] / 2e7 - 1) < 0.5
+    # Legacy loop version of lmsr.prior_lognormal
+    buckets = make_log_buckets()
+    vals = [math.exp(-0.5 * (math.log(bk["center"] / 4e7) / 0.5) ** 2) for bk in buckets]
+    assert np.allclose(prior_lognormal(buckets), np.array(vals) / sum(vals), atol=1e-11)
+
+def test_seed_markets_bulk_and_reseed(monkeypatch):
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    monkeypatch.setattr(amm_state, 'EXPOSURE', ExposureTracker())
+    monkeypatch.setattr(amm_state, 'BREAKERS', CircuitBreakers())
+    x = priors.knot_grid(21, 5e6, 1e12)
+    specs = [{'market_id': i, 'N': 21, 'min_val': 5e6, 'max_val': 1e12,
+              'prior': priors.lognormal_prior(x, 1e7 * (i + 1))} for i in range(50)]
+    specs.append({'market_id': 'uniform', 'N': 8, 'min_val': 1, 'max_val': 100})
+    assert len(amm_state.seed_markets(specs)) == 51
+    state = amm_state.AMM_STATE[3]
+    p = np.exp(state.q / state.b)
+    assert np.allclose(p / p.sum(), specs[3]['prior'])
+    assert np.allclose(amm_state.AMM_STATE['uniform'].q, amm_state.AMM_STATE['uniform'].b * math.log(1 / 8))
+    # Existing markets are skipped unless reseeding, which resets in place;
+    # markets where traders hold shares are never reseeded
+    amm_state.apply_trade(state, 4, 100.0)
+    version = state.version
+    assert amm_state.seed_markets(specs[:5]) == []
+    assert amm_state.seed_markets(specs[:5], reseed=True) == [0, 1, 2, 4]
+    assert state.version == version
+    amm_state.apply_trade(state, 4, -100.0)
+    assert amm_state.EXPOSURE.report('amm', 3)['trades'] == 2
+    assert amm_state.BREAKERS.after_trade(3, 4, 1.0) and amm_state.BREAKERS.status(3)['trips'] == 1
+    assert amm_state.seed_markets(specs[:5], reseed=True) == [0, 1, 2, 3, 4]
+    assert amm_state.AMM_STATE[3] is state and state.version > version
+    p = np.exp(state.q / state.b)
+    assert np.allclose(p / p.sum(), specs[3]['prior'])
+    assert amm_state.EXPOSURE.report('amm', 3) is None and not amm_state.BREAKERS.status(3)['trips']
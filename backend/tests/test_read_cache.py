@@ -0,0 +1,20 @@
+from app import amm_state, read_cache
+
+def test_cached_response_revalidates_by_version(monkeypatch):
+    monkeypatch.setattr(amm_state, 'AMM_STATE', {})
+    state = amm_state.get_amm_state(12, 5, 1, 1000)
+    builds = []
+    def build():
+        builds.append(state.version)
+        return {'q': state.q.tolist(), 'b': state.b}
+    first = read_cache.cached_response('test', state, build)
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    # Unchanged market: served from cache, and a matching ETag gets a 304
+    again = read_cache.cached_response('test', state, build, if_none_match=etag)
+    assert again.status_code == 304 and again.headers['etag'] == etag
+    assert len(builds) == 1
+    amm_state.apply_trade(state, 1, 5.0)
+    moved = read_cache.cached_response('test', state, build, if_none_match=etag)
+    assert moved.status_code == 200 and moved.headers['etag'] != etag
+    assert len(builds) == 2
@@ -5,7 +5,7 @@ import {
   Select, MenuItem, FormControl, InputLabel, Alert, Tabs, Tab, Switch,
   FormControlLabel, Grid, Card, CardContent, Chip
 } from '@mui/material';
-import { getMarketDetail, getMarketBidAsk, placeMarketOrder, getMarketAMMState, quoteAndTrade } from '../../utils/api';
+import { getMarketDetail, getMarketBidAsk, placeMarketOrder, getMarketAMMState, quoteAndTrade, subscribeMarketStream } from '../../utils/api';
 import { Line, Bar } from 'react-chartjs-2';
 import { 
   makeLogBuckets, 
@@ -374,6 +374,9 @@ function MarketDetail() {
     setPortfolio(prev => prev.filter(pos => pos.id !== positionId));
   }, []);
 
+  // True while q is the client-side startup curve standing in for a uniform server q
+  const syntheticQRef = useRef(false);
+
   // Fetch market data with defensive error handling
   const fetchMarket = useCallback(async () => {
     setLoading(true);
@@ -390,6 +393,7 @@ function MarketDetail() {
       
       let breakpoints = ammRes.breakpoints || [];
       let q = ammRes.q || [];
+      const serverQ = q;
       const b = ammRes.b || 3000;
 
       // Fix: Generate breakpoints if missing but q exists
@@ -449,6 +453,7 @@ function MarketDetail() {
         }
       }
 
+      syntheticQRef.current = q !== serverQ;
       setBreakpoints(breakpoints);
       setQ(q);
       setB(b);
@@ -465,6 +470,38 @@ function MarketDetail() {
     if (id) fetchMarket();
   }, [id, fetchMarket]);
 
+  // Live prices: patch q from streamed deltas and snapshots instead of refetching the market
+  const qLenRef = useRef(0);
+  useEffect(() => {
+    qLenRef.current = q.length;
+  }, [q]);
+
+  useEffect(() => {
+    if (!id) return undefined;
+    return subscribeMarketStream(id, (msg) => {
+      // Nothing loaded yet: the fetch on mount is still in flight
+      if ((msg.type !== 'delta' && msg.type !== 'snapshot') || !qLenRef.current) return;
+      const n = msg.type === 'snapshot' ? msg.q.length : msg.n;
+      if (n !== qLenRef.current || syntheticQRef.current) {
+        // Knots were added (breakpoints changed too), or q is the synthetic
+        // startup curve, which server deltas don't apply to: reload
+        fetchMarket();
+        return;
+      }
+      if (msg.type === 'snapshot') {
+        setQ(msg.q);
+        setB(msg.b);
+        return;
+      }
+      setQ(prev => {
+        const next = prev.slice();
+        Object.entries(msg.q).forEach(([i, v]) => { next[Number(i)] = v; });
+        return next;
+      });
+      setB(msg.b);
+    });
+  }, [id, fetchMarket]);
+
   // Memoized calculations with proper array guards
   const prices = React.useMemo(() => {
     if (!Array.isArray(q) || q.length === 0 || !b) return [];
@@ -782,7 +819,6 @@ function MarketDetail() {
           message: res.message || `${tradeSide === 'buy' ? 'Bought' : 'Sold'} ${tradeSize} contracts at market`,
           details: res.details || {}
         });
-        fetchMarket();
         setTrades(prev => [
           ...prev,
           {
@@ -82,3 +82,17 @@ export const placeMarketOrder = async (id, bucket_idx, side, size, order_type, l
     body: JSON.stringify({ bucket_idx, side, size, order_type, limit_price }),
   });
 };
+
+// Server-sent price feed: a snapshot frame, then coalesced q/price deltas.
+// Returns an unsubscribe function.
+export const subscribeMarketStream = (id, onMessage, book = 'amm') => {
+  const source = new EventSource(`${API_BASE_URL}/markets/${id}/stream?book=${book}`);
+  source.onmessage = (e) => {
+    try {
+      onMessage(JSON.parse(e.data));
+    } catch (err) {
+      console.error('Bad stream frame', err);
+    }
+  };
+  return () => source.close();
+};